@@ -0,0 +1,203 @@
+# Two-Tier Cache for Deterministic AI Responses (in-process LRU over an on-disk store)
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+AI_CACHE_PATH = os.getenv("AI_CACHE_PATH", "cache/ai_responses.sqlite3")
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", "86400"))  # Seconds
+AI_CACHE_MEMORY_ENTRIES = int(os.getenv("AI_CACHE_MEMORY_ENTRIES", "1000"))
+AI_CACHE_DISK_ENTRIES = int(os.getenv("AI_CACHE_DISK_ENTRIES", "50000"))
+
+# Conversational features depend on the person and the moment; their replies are never reused
+UNCACHEABLE_FEATURES = {"grief"}
+
+def _normalize(value):
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
+
+def cache_key(feature: str, provider: str, model: str, template_version: str, inputs: Dict) -> str:
+    """Canonical hash: whitespace-normalized inputs serialized with sorted keys"""
+    if feature in UNCACHEABLE_FEATURES:
+        raise ValueError(f"{feature} responses must not be cached")
+    payload = json.dumps({
+        "feature": feature,
+        "provider": provider,
+        "model": model,
+        "template_version": template_version,
+        "inputs": _normalize(inputs)
+    }, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class AIResponseCache:
+    """LRU in memory, SQLite on disk; both tiers honour the TTL and an entry bound"""
+
+    def __init__(self, path: str = AI_CACHE_PATH, ttl: int = AI_CACHE_TTL,
+                 memory_entries: int = AI_CACHE_MEMORY_ENTRIES, disk_entries: int = AI_CACHE_DISK_ENTRIES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.metrics = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_responses_last_access ON responses (last_access)")
+        return self._conn
+
+    def _remember(self, key: str, value: Dict, expires_at: float):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.metrics["evictions"] += 1
+
+    def get_sync(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self.metrics["memory_hits"] += 1
+                    return entry[0]
+                del self._memory[key]
+                self.metrics["expired"] += 1
+
+            row = self._db().execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and row[1] > now:
+                self._db().execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+                self._db().commit()
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                self.metrics["disk_hits"] += 1
+                return value
+            if row:
+                self._db().execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db().commit()
+                self.metrics["expired"] += 1
+            self.metrics["misses"] += 1
+            return None
+
+    def set_sync(self, key: str, value: Dict):
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at)
+            db = self._db()
+            db.execute("INSERT OR REPLACE INTO responses (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                       (key, json.dumps(value, default=str), expires_at, now))
+            count = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.disk_entries:
+                # Trim expired rows, then the least recently used tenth beyond the bound
+                db.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+                excess = db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.disk_entries
+                if excess > 0:
+                    trim = excess + self.disk_entries // 10
+                    db.execute("DELETE FROM responses WHERE key IN "
+                               "(SELECT key FROM responses ORDER BY last_access LIMIT ?)", (trim,))
+                    self.metrics["evictions"] += trim
+            db.commit()
+            self.metrics["stores"] += 1
+
+    async def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._memory.get(key)
+        if entry and entry[1] > time.time():
+            return self.get_sync(key)  # Memory hit; no disk access
+        return await asyncio.to_thread(self.get_sync, key)
+
+    async def set(self, key: str, value: Dict):
+        await asyncio.to_thread(self.set_sync, key, value)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.metrics["memory_hits"] + self.metrics["disk_hits"] + self.metrics["misses"]
+            hits = self.metrics["memory_hits"] + self.metrics["disk_hits"]
+            return {
+                **self.metrics,
+                "memory_entries": len(self._memory),
+                "hit_rate": round(hits / lookups, 3) if lookups else None
+            }
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """Concurrent calls with the same key share one in-flight task and all receive its result or error.
+
+    Keys come from cache_key, which refuses conversational features, so grief replies are never shared.
+    A caller that is cancelled only stops waiting; the shared call is cancelled when its last waiter leaves."""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.metrics = {"leaders": 0, "followers": 0, "cancelled": 0, "errors": 0}
+
+    async def do(self, key: str, call: Callable[[], Awaitable]):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(call()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+            self.metrics["leaders"] += 1
+        else:
+            self.metrics["followers"] += 1
+
+        flight.waiters += 1
+        try:
+            # Shielded so one waiter's cancellation does not cancel the call for the others
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self._forget(key, flight)
+                self.metrics["cancelled"] += 1
+
+    def _finish(self, key: str, flight: _Flight):
+        self._forget(key, flight)
+        if not flight.task.cancelled() and flight.task.exception() is not None:
+            self.metrics["errors"] += 1
+
+    def _forget(self, key: str, flight: _Flight):
+        # A newer flight may already own the key
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> Dict:
+        calls = self.metrics["leaders"] + self.metrics["followers"]
+        return {
+            **self.metrics,
+            "in_flight": len(self._flights),
+            "coalesced_rate": round(self.metrics["followers"] / calls, 3) if calls else None
+        }
+
+# Process-wide cache and coalescer shared by every MultiAIService instance
+ai_response_cache = AIResponseCache()
+ai_single_flight = SingleFlight()
@@ -0,0 +1,63 @@
+# Shared Async Clients for AI Providers (one connection pool per process)
+import os
+import asyncio
+import logging
+from typing import Optional
+
+import httpx
+import openai
+
+logger = logging.getLogger(__name__)
+
+AI_HTTP_MAX_CONNECTIONS = int(os.getenv("AI_HTTP_MAX_CONNECTIONS", "100"))
+AI_HTTP_KEEPALIVE = int(os.getenv("AI_HTTP_KEEPALIVE", "20"))
+AI_REQUEST_TIMEOUT = float(os.getenv("AI_REQUEST_TIMEOUT", "30"))
+
+# Overridable so staging and tests can point at a local fake provider
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com")
+ANTHROPIC_VERSION = "2023-06-01"
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
+
+_http_client: Optional[httpx.AsyncClient] = None
+_openai_client: Optional[openai.AsyncOpenAI] = None
+_loop = None
+
+def _check_loop():
+    # Pooled connections belong to the event loop that opened them; start fresh under a new loop
+    global _http_client, _openai_client, _loop
+    loop = asyncio.get_running_loop()
+    if _loop is not loop:
+        _http_client = _openai_client = None
+        _loop = loop
+
+def get_http_client() -> httpx.AsyncClient:
+    """Process-wide pooled client shared by every provider"""
+    global _http_client
+    _check_loop()
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=AI_REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=AI_HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=AI_HTTP_KEEPALIVE)
+        )
+    return _http_client
+
+def get_openai_client() -> openai.AsyncOpenAI:
+    global _openai_client
+    http_client = get_http_client()
+    if _openai_client is None:
+        _openai_client = openai.AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=OPENAI_BASE_URL,
+            timeout=AI_REQUEST_TIMEOUT,
+            http_client=http_client
+        )
+    return _openai_client
+
+async def close_ai_clients():
+    """Release pooled connections on shutdown"""
+    global _http_client, _openai_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = _openai_client = None
@@ -0,0 +1,174 @@
+# Priority Admission Control and Token-Bucket Rate Limiting for AI Providers
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lower rank is admitted first; within a rank, first come first served
+PRIORITIES = {"crisis": 0, "interactive": 1, "batch": 2}
+
+# Requests and tokens per minute; override with e.g. AI_RATE_LIMIT_OPENAI_RPM / AI_RATE_LIMIT_OPENAI_TPM
+DEFAULT_PROVIDER_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 150000},
+    "claude": {"rpm": 50, "tpm": 40000},
+    "deepseek": {"rpm": 60, "tpm": 100000}
+}
+AI_RATE_LIMIT_WINDOW = 1000  # Recent waits kept per priority for percentiles
+
+def provider_limits(provider: str) -> Dict[str, float]:
+    defaults = DEFAULT_PROVIDER_LIMITS.get(provider, DEFAULT_PROVIDER_LIMITS["openai"])
+    prefix = f"AI_RATE_LIMIT_{provider.upper()}"
+    return {
+        "rpm": float(os.getenv(f"{prefix}_RPM", defaults["rpm"])),
+        "tpm": float(os.getenv(f"{prefix}_TPM", defaults["tpm"]))
+    }
+
+class TokenBucket:
+    """Refills continuously at rate per second up to capacity (a minute's worth, so bursts are allowed)"""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available (0 when it is now)"""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+class ProviderLimiter:
+    """Request and token buckets for one provider behind a strict priority queue.
+
+    Callers that cannot be admitted at once wait in the queue; nothing is rejected. The head of the queue
+    blocks everything behind it, so batch work never takes capacity a waiting crisis message needs."""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        limits = provider_limits(provider)
+        self.requests = TokenBucket(limits["rpm"])
+        self.tokens = TokenBucket(limits["tpm"])
+        self._queue: List = []  # (rank, sequence, tokens, future)
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._loop = None
+        self.admitted = {name: 0 for name in PRIORITIES}
+        self.waits = {name: deque(maxlen=AI_RATE_LIMIT_WINDOW) for name in PRIORITIES}
+
+    def _wait_time(self, tokens: float) -> float:
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _admit(self, tokens: float):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+
+    def _check_loop(self):
+        # Futures belong to the loop that created them; a new loop starts with an empty queue
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = []
+            self._wakeup = asyncio.Event()
+            self._dispatcher = None
+
+    async def acquire(self, tokens: float, priority: str = "interactive"):
+        """Wait until the call may be sent; tokens is the estimated prompt plus completion size"""
+        self._check_loop()
+        started = time.monotonic()
+        if not self._queue and self._wait_time(tokens) == 0:
+            self._admit(tokens)
+        else:
+            future = self._loop.create_future()
+            heapq.heappush(self._queue, (PRIORITIES[priority], next(self._sequence), tokens, future))
+            self._wakeup.set()
+            if self._dispatcher is None or self._dispatcher.done():
+                self._dispatcher = asyncio.ensure_future(self._dispatch())
+            try:
+                await future
+            except asyncio.CancelledError:
+                self._wakeup.set()  # Let the dispatcher move past this waiter now
+                raise
+        self.admitted[priority] += 1
+        self.waits[priority].append(time.monotonic() - started)
+
+    async def _dispatch(self):
+        while self._queue:
+            _, _, tokens, future = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+            delay = self._wait_time(tokens)
+            if delay == 0:
+                heapq.heappop(self._queue)
+                self._admit(tokens)
+                future.set_result(None)
+                continue
+            # Sleep until the head fits, or until a new arrival that may outrank it
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict:
+        depth = {name: 0 for name in PRIORITIES}
+        ranks = {rank: name for name, rank in PRIORITIES.items()}
+        for rank, _, _, future in self._queue:
+            if not future.done():
+                depth[ranks[rank]] += 1
+
+        def wait_summary(name: str) -> Dict:
+            ordered = sorted(self.waits[name])
+            if not ordered:
+                return {"admitted": self.admitted[name], "queued": depth[name]}
+            return {
+                "admitted": self.admitted[name],
+                "queued": depth[name],
+                "wait_p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+                "wait_p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 1)
+            }
+
+        return {
+            "provider": self.provider,
+            "requests_available": round(self.requests.level, 1),
+            "tokens_available": round(self.tokens.level),
+            "queue_depth": sum(depth.values()),
+            "priorities": {name: wait_summary(name) for name in PRIORITIES}
+        }
+
+class AIRateLimiter:
+    """One ProviderLimiter per provider, created on first use"""
+
+    def __init__(self):
+        self.providers: Dict[str, ProviderLimiter] = {}
+
+    def for_provider(self, provider: str) -> ProviderLimiter:
+        if provider not in self.providers:
+            self.providers[provider] = ProviderLimiter(provider)
+        return self.providers[provider]
+
+    async def acquire(self, provider: str, tokens: float, priority: str = "interactive"):
+        await self.for_provider(provider).acquire(tokens, priority)
+
+    def stats(self) -> List[Dict]:
+        return [limiter.stats() for _, limiter in sorted(self.providers.items())]
+
+# Process-wide limiter; provider quotas are per API key, not per request
+ai_rate_limiter = AIRateLimiter()
@@ -0,0 +1,281 @@
+# Latency-Aware AI Provider Routing with Hedged Requests
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+AI_ROUTER_EWMA_ALPHA = 0.2
+AI_ROUTER_WINDOW = 200  # Recent samples kept per provider for p95 and error rate
+AI_ROUTER_MAX_ERROR_RATE = float(os.getenv("AI_ROUTER_MAX_ERROR_RATE", "0.5"))
+AI_ROUTER_MIN_SAMPLES = 5  # Below this a provider is assumed healthy
+AI_HEDGE_MIN_DELAY = float(os.getenv("AI_HEDGE_MIN_DELAY", "0.5"))  # Seconds
+AI_HEDGE_MAX_DELAY = float(os.getenv("AI_HEDGE_MAX_DELAY", "10"))
+AI_DEFAULT_LATENCY = 5.0  # Assumed for a provider with no history
+AI_BREAKER_FAILURES = int(os.getenv("AI_BREAKER_FAILURES", "5"))  # Consecutive failures that open a breaker
+AI_BREAKER_RESET_TIMEOUT = float(os.getenv("AI_BREAKER_RESET_TIMEOUT", "30"))  # Seconds open before a probe
+AI_BREAKER_HALF_OPEN_PROBES = int(os.getenv("AI_BREAKER_HALF_OPEN_PROBES", "1"))
+
+class CircuitOpenError(Exception):
+    """Raised when every provider's breaker is open"""
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half_open after the reset timeout -> closed on a good probe"""
+
+    def __init__(self, name: str, failure_threshold: int = AI_BREAKER_FAILURES,
+                 reset_timeout: float = AI_BREAKER_RESET_TIMEOUT, half_open_probes: int = AI_BREAKER_HALF_OPEN_PROBES):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probes_in_flight = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """Whether a call may go to this provider now; in half_open this reserves a probe slot"""
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self._transition("half_open")
+        if self.state == "half_open":
+            if self.probes_in_flight >= self.half_open_probes:
+                self.rejected += 1
+                return False
+            self.probes_in_flight += 1
+        return True
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        if self.state == "half_open":
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            self._transition("closed")
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == "half_open":
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            self._open()
+        elif self.state == "closed" and self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def release(self):
+        """A call that was cancelled (e.g. a losing hedge) says nothing about health"""
+        if self.state == "half_open":
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._transition("open")
+
+    def _transition(self, state: str):
+        if state != self.state:
+            logger.warning(f"AI provider {self.name} circuit {self.state} -> {state}")
+            self.state = state
+            if state != "half_open":
+                self.probes_in_flight = 0
+
+    def snapshot(self) -> Dict:
+        retry_in = None
+        if self.state == "open":
+            retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 1)
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "retry_in_s": retry_in
+        }
+
+class ProviderStats:
+    """Latency EWMA, p95 over a sliding window, and recent error rate for one provider"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ewma: Optional[float] = None
+        self.latencies = deque(maxlen=AI_ROUTER_WINDOW)
+        self.outcomes = deque(maxlen=AI_ROUTER_WINDOW)  # True for success
+        self.hedges_won = 0
+
+    def record_success(self, latency: float):
+        self.ewma = latency if self.ewma is None else (
+            AI_ROUTER_EWMA_ALPHA * latency + (1 - AI_ROUTER_EWMA_ALPHA) * self.ewma)
+        self.latencies.append(latency)
+        self.outcomes.append(True)
+
+    def record_failure(self):
+        self.outcomes.append(False)
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    @property
+    def p95(self) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    @property
+    def healthy(self) -> bool:
+        return len(self.outcomes) < AI_ROUTER_MIN_SAMPLES or self.error_rate <= AI_ROUTER_MAX_ERROR_RATE
+
+    def snapshot(self) -> Dict:
+        return {
+            "provider": self.name,
+            "ewma_ms": round(self.ewma * 1000, 1) if self.ewma is not None else None,
+            "p95_ms": round(self.p95 * 1000, 1) if self.p95 is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "samples": len(self.outcomes),
+            "healthy": self.healthy,
+            "hedges_won": self.hedges_won
+        }
+
+def _retrieve_outcome(task: asyncio.Task):
+    if not task.cancelled():
+        task.exception()
+
+class AIProviderRouter:
+    """Sends each call to the fastest healthy provider and hedges to the next one after its p95"""
+
+    def __init__(self, providers: List[str], preferred: str = None,
+                 hedge_min_delay: float = AI_HEDGE_MIN_DELAY, hedge_max_delay: float = AI_HEDGE_MAX_DELAY):
+        self.providers = list(providers)
+        self.preferred = preferred
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self.stats = {name: ProviderStats(name) for name in self.providers}
+        self.breakers = {name: CircuitBreaker(name) for name in self.providers}
+
+    def record_success(self, provider: str, latency: float):
+        self.stats[provider].record_success(latency)
+        self.breakers[provider].record_success()
+
+    def record_failure(self, provider: str):
+        self.stats[provider].record_failure()
+        self.breakers[provider].record_failure()
+
+    def rank(self, first: str = None) -> List[str]:
+        """Healthy providers by latency EWMA, then unhealthy ones as a last resort"""
+        def latency(name):
+            ewma = self.stats[name].ewma
+            # With no history, the configured default goes first so cold start matches the old behaviour
+            return ewma if ewma is not None else AI_DEFAULT_LATENCY - (name == self.preferred)
+
+        healthy = sorted((name for name in self.providers if self.stats[name].healthy), key=latency)
+        unhealthy = sorted((name for name in self.providers if not self.stats[name].healthy),
+                           key=lambda name: self.stats[name].error_rate)
+        order = healthy + unhealthy
+        if first in order:
+            order.remove(first)
+            order.insert(0, first)
+        return order
+
+    def hedge_delay(self, provider: str) -> float:
+        p95 = self.stats[provider].p95
+        if p95 is None:
+            p95 = AI_DEFAULT_LATENCY
+        return min(max(p95, self.hedge_min_delay), self.hedge_max_delay)
+
+    async def call(self, request: Callable[[str], Awaitable], first: str = None,
+                   admit: Callable[[str], Awaitable] = None) -> Tuple[object, str]:
+        """Run request(provider) with hedging; returns (result, provider). Raises the last error if all fail,
+        or CircuitOpenError at once when every breaker is open.
+
+        admit(provider), when given, is awaited before each request (e.g. a rate limiter). Latency samples and
+        the hedge timer start once it returns, and no hedge is sent while the newest attempt is still waiting
+        for admission: local queueing neither counts against the provider nor adds load when told to back off."""
+        loop = asyncio.get_running_loop()
+        remaining = self.rank(first)
+        running: Dict[asyncio.Task, Tuple[str, asyncio.Future]] = {}  # task -> (provider, admission time)
+        last_error: Optional[BaseException] = None
+
+        async def attempt(provider: str, admitted: asyncio.Future):
+            if admit is not None:
+                await admit(provider)
+            admitted.set_result(time.monotonic())
+            return await request(provider)
+
+        def launch() -> bool:
+            # Providers with an open breaker are skipped without a request
+            while remaining:
+                provider = remaining.pop(0)
+                if self.breakers[provider].allow():
+                    admitted = loop.create_future()
+                    running[asyncio.ensure_future(attempt(provider, admitted))] = (provider, admitted)
+                    return True
+            return False
+
+        if not launch():
+            raise CircuitOpenError("All AI provider circuits are open")
+        try:
+            while running:
+                # Hedge once the newest attempt has run past its provider's p95 since admission
+                newest_provider, newest_admitted = list(running.values())[-1]
+                waiting_on = set(running)
+                timeout = None
+                if remaining:
+                    if newest_admitted.done():
+                        timeout = max(0.0, newest_admitted.result() + self.hedge_delay(newest_provider)
+                                      - time.monotonic())
+                    else:
+                        waiting_on.add(newest_admitted)  # Wake on admission to start the hedge timer
+
+                done, _ = await asyncio.wait(waiting_on, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.info(f"Hedging {newest_provider} after {self.hedge_delay(newest_provider):.2f}s")
+                    launch()
+                    continue
+
+                for task in done:
+                    if task not in running:
+                        continue  # An admission, not a result
+                    provider, admitted = running.pop(task)
+                    if task.exception() is None:
+                        self.record_success(provider, time.monotonic() - admitted.result())
+                        if running:
+                            self.stats[provider].hedges_won += 1
+                        return task.result(), provider
+                    last_error = task.exception()
+                    self.record_failure(provider)
+                    logger.warning(f"AI provider {provider} failed: {str(last_error)}")
+
+                if not running:
+                    launch()
+        finally:
+            # Losers (and everything on cancellation of the caller) are cancelled; their outcome is still
+            # retrieved so one that had already failed does not log "Task exception was never retrieved"
+            for task, (provider, _) in running.items():
+                task.cancel()
+                task.add_done_callback(_retrieve_outcome)
+                self.breakers[provider].release()
+
+        raise last_error or CircuitOpenError("All AI provider circuits are open")
+
+    def snapshot(self) -> List[Dict]:
+        return [{**self.stats[name].snapshot(), "circuit": self.breakers[name].snapshot()} for name in self.rank()]
+
+def configured_providers() -> List[str]:
+    """Providers with credentials present"""
+    keys = {"openai": "OPENAI_API_KEY", "claude": "ANTHROPIC_API_KEY", "deepseek": "DEEPSEEK_API_KEY"}
+    return [name for name, key in keys.items() if os.getenv(key)] or ["openai"]
+
+_router: Optional[AIProviderRouter] = None
+
+def get_ai_router() -> AIProviderRouter:
+    """Process-wide router so latency history is shared by every request"""
+    global _router
+    if _router is None:
+        _router = AIProviderRouter(configured_providers(), os.getenv("DEFAULT_AI_PROVIDER", "openai"))
+    return _router
@@ -1,29 +1,126 @@
 # Multi-Provider AI Service (OpenAI, Claude, DeepSeek)
 import os
-import openai
-import anthropic
-import requests
-from typing import Dict, List, Optional, Any
+import time
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple
 from datetime import datetime
 import logging
 import json
+from collections import deque
+
+from ai_clients import (get_http_client, get_openai_client, ANTHROPIC_BASE_URL, ANTHROPIC_VERSION,
+                        DEEPSEEK_BASE_URL)
+from ai_router import get_ai_router
+from ai_cache import ai_response_cache, ai_single_flight, cache_key
+from ai_rate_limit import ai_rate_limiter
+from ai_telemetry import ai_telemetry
+from emotion_detector import emotion_detector
+from conversation_context import conversation_context, count_tokens, message_tokens, AI_SUMMARY_MAX_TOKENS
+from document_analysis import chunk_text, map_reduce
+from statute_index import statute_index
 
 logger = logging.getLogger(__name__)
 
+PROVIDER_MODELS = {
+    "openai": "gpt-4-turbo-preview",
+    "claude": "claude-3-sonnet-20240229",
+    "deepseek": "deepseek-chat"
+}
+
+# Bump when a prompt changes so cached responses for the old wording are not reused
+GUIDANCE_PROMPT_VERSION = "4"
+COMPLIANCE_PROMPT_VERSION = "2"
+
+# Hard cap on the statute passages in the guidance prompt; passages are quoted whole or not at all
+GUIDANCE_LAW_MAX_TOKENS = int(os.getenv("GUIDANCE_LAW_MAX_TOKENS", "260"))
+# Retrieved for the user's state whatever the query: guidance always lists the execution formalities
+GUIDANCE_PINNED_TOPICS = ("execution",)
+
+COMPLIANCE_REPORT_FORMAT = """Provide:
+        1. Compliance score (0-100)
+        2. Required elements present/missing
+        3. Legal issues or concerns
+        4. Recommendations for improvement
+        5. Risk assessment"""
+
+# Time to first streamed token, in milliseconds, for the most recent streams
+STREAM_TTFB_MS = deque(maxlen=1000)
+
+def _strip_indent(prompt: str) -> str:
+    return "\n".join(line.strip() for line in prompt.splitlines())
+
+def stream_ttfb_summary() -> Dict:
+    if not STREAM_TTFB_MS:
+        return {"samples": 0}
+    ordered = sorted(STREAM_TTFB_MS)
+    return {
+        "samples": len(ordered),
+        "p50_ms": round(ordered[len(ordered) // 2], 1),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1)
+    }
+
 class MultiAIService:
     def __init__(self):
-        # Initialize AI providers
-        self.openai_client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.anthropic_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        # Provider clients are process-wide and pooled (see ai_clients); this object is cheap to create
+        self.anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
+        self.anthropic_url = f"{ANTHROPIC_BASE_URL}/v1/messages"
         self.deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
-        self.deepseek_url = "https://api.deepseek.com/v1/chat/completions"
+        self.deepseek_url = f"{DEEPSEEK_BASE_URL}/chat/completions"
         self.default_provider = os.getenv("DEFAULT_AI_PROVIDER", "openai")
     
-    def generate_grief_response(self, user_message: str, emotional_state: str = None, 
-                              conversation_history: List[Dict] = None, provider: str = None) -> Dict:
+    async def generate_grief_response(self, user_message: str, emotional_state: str = None, 
+                              conversation_history: List[Dict] = None, provider: str = None,
+                              session_id: str = None) -> Dict:
         """Generate empathetic grief support response"""
-        provider = provider or self.default_provider
+        messages = await self._grief_messages(user_message, conversation_history, provider, session_id)
+        priority = self._grief_priority(user_message)
         
+        try:
+            response, provider = await self._route(messages, provider, priority=priority, feature="grief")
+            return self._grief_result(user_message, response, provider)
+            
+        except Exception as e:
+            logger.error(f"AI grief response generation failed on every provider: {str(e)}")
+            
+            # Fallback to pre-programmed responses
+            return self._fallback_grief_response(user_message, emotional_state)
+    
+    async def stream_grief_response(self, user_message: str, emotional_state: str = None,
+                                    conversation_history: List[Dict] = None,
+                                    provider: str = None, session_id: str = None) -> AsyncIterator[Dict]:
+        """Yield {"type": "token"} events as the provider produces text, then one {"type": "done"} event
+        carrying the same analysis as generate_grief_response"""
+        messages = await self._grief_messages(user_message, conversation_history, provider, session_id)
+        priority = self._grief_priority(user_message)
+        router = get_ai_router()
+        
+        # Failover is only possible until the first token has been forwarded
+        for name in router.rank(provider):
+            if not router.breakers[name].allow():
+                continue
+            parts = []
+            try:
+                async for text in self._chat_stream(name, messages, priority=priority, feature="grief"):
+                    parts.append(text)
+                    yield {"type": "token", "content": text}
+                router.breakers[name].record_success()
+            except Exception as e:
+                router.record_failure(name)
+                logger.error(f"Streaming grief response failed with {name}: {str(e)}")
+                if not parts:
+                    continue
+                # Partial answer already shown; finish with what the user has seen
+            except BaseException:
+                router.breakers[name].release()
+                raise
+            yield {"type": "done", **self._grief_result(user_message, "".join(parts), name)}
+            return
+        
+        fallback = self._fallback_grief_response(user_message, emotional_state)
+        yield {"type": "token", "content": fallback["content"]}
+        yield {"type": "done", **fallback}
+    
+    async def _grief_messages(self, user_message: str, conversation_history: List[Dict] = None,
+                              provider: str = None, session_id: str = None) -> List[Dict]:
         # Create context-aware prompt
         system_prompt = """You are a compassionate AI grief counselor with deep understanding of loss, trauma, and healing. 
         Your role is to provide empathetic, non-judgmental support to people experiencing grief.
@@ -51,74 +148,88 @@ class MultiAIService:
         - Complete hopelessness
         - Inability to function for extended periods"""
 
+        # Recent turns up to the token budget; older ones reach the model through the session summary
+        return await conversation_context.build(
+            session_id, system_prompt, conversation_history or [], user_message,
+            provider or get_ai_router().rank()[0], self._summarize_turns
+        )
+    
+    async def _summarize_turns(self, previous_summary: str, turns: List[Dict]) -> str:
+        """Fold turns that no longer fit the prompt into the session's running summary"""
+        transcript = "\n".join(
+            f"{'Person' if turn['role'] == 'user' else 'Counselor'}: {turn['content']}" for turn in turns
+        )
         messages = [
-            {"role": "system", "content": system_prompt}
+            {"role": "system", "content": f"""You keep a running summary of a grief support conversation for the counselor.
+            Keep who died and the person's relationship to them, names, important dates, feelings expressed,
+            any crisis or self-harm mentions, coping strategies already suggested, and anything the person
+            asked to be remembered. Write in the third person, no more than {AI_SUMMARY_MAX_TOKENS * 3 // 4} words."""},
+            {"role": "user", "content": f"Current summary:\n{previous_summary or '(none yet)'}\n\n"
+                                        f"New conversation turns:\n{transcript}\n\nReturn the updated summary."}
         ]
         
-        # Add conversation history if available
-        if conversation_history:
-            messages.extend(conversation_history[-10:])  # Last 10 messages for context
-        
-        messages.append({"role": "user", "content": user_message})
-        
         try:
-            if provider == "openai":
-                response = self._openai_chat(messages)
-            elif provider == "claude":
-                response = self._claude_chat(messages)
-            elif provider == "deepseek":
-                response = self._deepseek_chat(messages)
-            else:
-                # Fallback to OpenAI
-                response = self._openai_chat(messages)
-            
-            # Analyze emotional state and crisis risk
-            emotional_analysis = self._analyze_emotional_state(user_message, response)
-            
-            return {
-                "content": response,
-                "emotional_state": emotional_analysis["emotional_state"],
-                "crisis_detected": emotional_analysis["crisis_detected"],
-                "confidence": emotional_analysis["confidence"],
-                "recommendations": emotional_analysis["recommendations"],
-                "provider_used": provider,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
+            summary, _ = await self._route(messages, temperature=0.2, max_tokens=AI_SUMMARY_MAX_TOKENS,
+                                          priority="batch", feature="summary")
+            return summary.strip()
         except Exception as e:
-            logger.error(f"AI grief response generation failed with {provider}: {str(e)}")
+            logger.warning(f"AI summary failed, keeping an extractive one: {str(e)}")
             
-            # Fallback to pre-programmed responses
-            return self._fallback_grief_response(user_message, emotional_state)
+            # Opening sentence of each thing the person said, newest kept when over budget
+            points = [turn["content"].split(". ")[0].strip()[:200] for turn in turns if turn["role"] == "user"]
+            summary = " ".join(filter(None, [previous_summary] + [f"The person said: {point}." for point in points]))
+            while count_tokens(summary) > AI_SUMMARY_MAX_TOKENS and ". " in summary:
+                summary = summary.split(". ", 1)[1]
+            return summary
+    
+    @staticmethod
+    def _grief_priority(user_message: str) -> str:
+        # Crisis messages are admitted ahead of everything else when a provider is rate limited
+        return "crisis" if emotion_detector.scan(user_message)["crisis_detected"] else "interactive"
     
-    def generate_will_guidance(self, user_data: Dict, state_code: str, provider: str = None) -> Dict:
-        """Generate AI-powered will creation guidance"""
-        provider = provider or self.default_provider
+    def _grief_result(self, user_message: str, response: str, provider: str) -> Dict:
+        # Analyze emotional state and crisis risk
+        emotional_analysis = self._analyze_emotional_state(user_message, response)
         
-        system_prompt = f"""You are an expert estate planning attorney AI assistant specializing in {state_code} state law.
-        Provide personalized, legally-informed guidance for will creation.
-
-        Your expertise includes:
-        - State-specific legal requirements for {state_code}
-        - Asset distribution strategies
-        - Tax optimization
-        - Digital asset planning
-        - Family dynamics considerations
-        - Executor selection guidance
+        return {
+            "content": response,
+            "emotional_state": emotional_analysis["emotional_state"],
+            "crisis_detected": emotional_analysis["crisis_detected"],
+            "confidence": emotional_analysis["confidence"],
+            "recommendations": emotional_analysis["recommendations"],
+            "provider_used": provider,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+    
+    async def generate_will_guidance(self, user_data: Dict, state_code: str, provider: str = None) -> Dict:
+        """Generate AI-powered will creation guidance grounded in retrieved state statutes"""
+        
+        try:
+            passages = statute_index.search(self._guidance_query(user_data), state_code,
+                                            pinned_topics=GUIDANCE_PINNED_TOPICS)
+        except Exception as e:
+            logger.warning(f"Statute retrieval failed, guidance will rely on the model alone: {str(e)}")
+            passages = []
+        
+        law, passages = self._law_section(passages)
+        if passages:
+            grounding = f"""Ground state-specific statements in the law below and cite it. If something the person needs
+        is not covered there, say so and recommend professional review.
 
-        Always:
-        - Provide state-specific advice for {state_code}
-        - Explain legal concepts in plain language
-        - Suggest best practices
-        - Highlight potential issues
-        - Recommend professional review when needed
-        - Consider family circumstances and relationships"""
+        Relevant law:
+        {law}"""
+        else:
+            grounding = f"Provide state-specific advice for {state_code} and recommend professional review when needed."
+        
+        system_prompt = f"""You are an expert estate planning attorney AI assistant for {state_code} wills.
+        Give personalized guidance in plain language, consider family circumstances, and highlight potential issues.
+        {grounding}"""
 
         user_prompt = f"""Help me create my will with the following information:
         
-        Personal Details: {json.dumps(user_data.get('personal_info', {}), indent=2)}
-        Assets: {json.dumps(user_data.get('assets', {}), indent=2)}
-        Beneficiaries: {json.dumps(user_data.get('beneficiaries', []), indent=2)}
+        Personal Details: {json.dumps(user_data.get('personal_info', {}))}
+        Assets: {json.dumps(user_data.get('assets', {}))}
+        Beneficiaries: {json.dumps(user_data.get('beneficiaries', []))}
         State: {state_code}
         
         Please provide:
@@ -129,28 +240,41 @@ class MultiAIService:
         5. Suggested executor qualities
         6. Any red flags or issues to address"""
 
+        # Source indentation is not sent; it costs tokens on every guidance call
         messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
+            {"role": "system", "content": _strip_indent(system_prompt)},
+            {"role": "user", "content": _strip_indent(user_prompt)}
         ]
         
-        try:
-            if provider == "openai":
-                response = self._openai_chat(messages, temperature=0.3)  # Lower temp for legal advice
-            elif provider == "claude":
-                response = self._claude_chat(messages)
-            elif provider == "deepseek":
-                response = self._deepseek_chat(messages)
-            else:
-                response = self._openai_chat(messages, temperature=0.3)
+        key = self._cache_key("will_guidance", provider, GUIDANCE_PROMPT_VERSION, {
+            "personal_info": user_data.get('personal_info', {}),
+            "assets": user_data.get('assets', {}),
+            "beneficiaries": user_data.get('beneficiaries', []),
+            "state": state_code.upper(),
+            "statutes": {"index": statute_index.version, "passages": [passage["id"] for passage in passages]}
+        })
+        cached = await ai_response_cache.get(key)
+        if cached:
+            return {**cached, "cached": True}
+        
+        async def generate() -> Dict:
+            response, used = await self._route(messages, provider, temperature=0.3,  # Lower temp for legal advice
+                                                feature="guidance")
             
-            return {
+            result = {
                 "guidance": response,
-                "provider_used": provider,
+                "provider_used": used,
+                "sources": [passage["citation"] for passage in passages],
                 "confidence": "high",
                 "requires_review": True,  # Always recommend professional review
                 "timestamp": datetime.utcnow().isoformat()
             }
+            await ai_response_cache.set(key, result)
+            return result
+        
+        try:
+            # Identical requests arriving while this one is in flight share its provider call
+            return {**await ai_single_flight.do(key, generate)}
             
         except Exception as e:
             logger.error(f"Will guidance generation failed: {str(e)}")
@@ -162,53 +286,83 @@ class MultiAIService:
                 "error": str(e)
             }
     
-    def analyze_document_compliance(self, document_content: str, state_code: str, provider: str = None) -> Dict:
-        """Analyze document for legal compliance"""
-        provider = provider or self.default_provider
+    @staticmethod
+    def _law_section(passages: List[Dict]) -> Tuple[str, List[Dict]]:
+        """Whole passages in retrieval order (pinned ones first) within GUIDANCE_LAW_MAX_TOKENS; a passage that
+        does not fit is skipped, never cut. Returns the section and the passages it quotes"""
+        lines, used, spent = [], [], 0
+        for passage in passages:
+            line = f"[{passage['citation']}] {passage['title']}: {passage['text']}"
+            tokens = count_tokens(line)
+            if spent + tokens > GUIDANCE_LAW_MAX_TOKENS:
+                continue
+            lines.append(line)
+            used.append(passage)
+            spent += tokens
+        return "\n".join(lines), used
+    
+    @staticmethod
+    def _guidance_query(user_data: Dict) -> str:
+        """Retrieval query: what every will needs plus the words describing this person's situation"""
+        words = ["execution witnesses signature self-proving executor qualified estate tax"]
         
-        system_prompt = f"""You are a legal document analysis AI specializing in {state_code} estate planning law.
-        Analyze the provided document for legal compliance, completeness, and potential issues.
-
-        Check for:
-        - Required legal language and clauses
-        - State-specific formalities
-        - Missing essential elements
-        - Ambiguous language
-        - Potential legal challenges
-        - Tax implications
-        - Digital asset coverage"""
+        def collect(value):
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    words.append(str(key).replace("_", " "))
+                    collect(item)
+            elif isinstance(value, list):
+                for item in value:
+                    collect(item)
+            elif isinstance(value, str):
+                words.append(value.replace("_", " "))
+        
+        collect({key: user_data.get(key) for key in ("personal_info", "assets", "beneficiaries")})
+        return " ".join(words)
+    
+    async def analyze_document_compliance(self, document_content: str, state_code: str, provider: str = None) -> Dict:
+        """Analyze document for legal compliance; long documents are analyzed in parallel chunks and merged"""
+        
+        system_prompt = self._compliance_system_prompt(state_code)
 
         user_prompt = f"""Analyze this estate planning document for {state_code} compliance:
 
         {document_content}
 
-        Provide:
-        1. Compliance score (0-100)
-        2. Required elements present/missing
-        3. Legal issues or concerns
-        4. Recommendations for improvement
-        5. Risk assessment"""
+        {COMPLIANCE_REPORT_FORMAT}"""
 
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ]
         
-        try:
-            if provider == "openai":
-                response = self._openai_chat(messages, temperature=0.2)
-            elif provider == "claude":
-                response = self._claude_chat(messages)
-            elif provider == "deepseek":
-                response = self._deepseek_chat(messages)
+        key = self._cache_key("document_compliance", provider, COMPLIANCE_PROMPT_VERSION, {
+            "document": document_content,
+            "state": state_code.upper()
+        })
+        cached = await ai_response_cache.get(key)
+        if cached:
+            return {**cached, "cached": True}
+        
+        chunks = chunk_text(document_content, provider=provider or get_ai_router().rank()[0])
+        
+        async def analyze() -> Dict:
+            if len(chunks) > 1:
+                result = await self._analyze_document_chunks(chunks, state_code, provider)
             else:
-                response = self._openai_chat(messages, temperature=0.2)
-            
-            return {
-                "analysis": response,
-                "provider_used": provider,
-                "timestamp": datetime.utcnow().isoformat()
-            }
+                response, used = await self._route(messages, provider, temperature=0.2, priority="batch",
+                                                    feature="analysis")
+                result = {
+                    "analysis": response,
+                    "provider_used": used,
+                    "timestamp": datetime.utcnow().isoformat()
+                }
+            if "sections_not_analyzed" not in result:  # A partial analysis is retried next time
+                await ai_response_cache.set(key, result)
+            return result
+        
+        try:
+            return {**await ai_single_flight.do(key, analyze)}
             
         except Exception as e:
             logger.error(f"Document compliance analysis failed: {str(e)}")
@@ -218,40 +372,201 @@ class MultiAIService:
                 "error": str(e)
             }
     
-    def _openai_chat(self, messages: List[Dict], temperature: float = 0.7, max_tokens: int = 1000) -> str:
-        """Generate response using OpenAI"""
+    @staticmethod
+    def _compliance_system_prompt(state_code: str) -> str:
+        return f"""You are a legal document analysis AI specializing in {state_code} estate planning law.
+        Analyze the provided document for legal compliance, completeness, and potential issues.
+
+        Check for:
+        - Required legal language and clauses
+        - State-specific formalities
+        - Missing essential elements
+        - Ambiguous language
+        - Potential legal challenges
+        - Tax implications
+        - Digital asset coverage"""
+    
+    async def _analyze_document_chunks(self, chunks: List[str], state_code: str, provider: str = None) -> Dict:
+        """Map: findings per overlapping section, concurrently. Reduce: merge findings into one report."""
+        failed = []
+        final_provider = []
+        
+        async def analyze_section(index: int, chunk: str) -> Optional[str]:
+            messages = [
+                {"role": "system", "content": f"""You are a legal document analysis AI specializing in {state_code} estate planning law.
+                You are reviewing section {index + 1} of {len(chunks)} of a longer document; sections overlap slightly.
+                Report concisely only what this section shows:
+                - Required legal language, clauses and formalities present (name each briefly)
+                - Ambiguous language, inconsistencies or potential legal challenges, quoting the words at issue
+                - Tax implications and digital asset provisions
+                Do not report elements as missing; other sections may contain them."""},
+                {"role": "user", "content": chunk}
+            ]
+            try:
+                response, _ = await self._route(messages, provider, temperature=0.2, max_tokens=600,
+                                               priority="batch", feature="analysis")
+            except Exception as e:
+                logger.warning(f"Document section {index + 1}/{len(chunks)} analysis failed: {str(e)}")
+                failed.append(index + 1)
+                return None
+            return f"Section {index + 1}:\n{response}"
+        
+        async def merge(findings: List[str], final: bool) -> str:
+            joined = "\n\n".join(findings)
+            if final:
+                messages = [
+                    {"role": "system", "content": self._compliance_system_prompt(state_code)},
+                    {"role": "user", "content": f"""These are section-by-section findings covering an entire estate planning document. Assess it for {state_code} compliance as a whole; an element is missing only if no section shows it.
+
+        {joined}
+
+        {COMPLIANCE_REPORT_FORMAT}"""}
+                ]
+            else:
+                messages = [
+                    {"role": "system", "content": "Merge these findings from sections of one legal document into a single concise list. "
+                                                  "Keep section numbers, quoted wording and every distinct issue; drop duplicates "
+                                                  "that come from overlapping sections."},
+                    {"role": "user", "content": joined}
+                ]
+            response, used = await self._route(messages, provider, temperature=0.2, priority="batch",
+                                               feature="analysis")
+            if final:
+                final_provider.append(used)
+            return response
+        
+        analysis = await map_reduce(chunks, analyze_section, merge)
+        result = {
+            "analysis": analysis,
+            "provider_used": final_provider[0],
+            "sections": len(chunks),
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        if failed:
+            result["sections_not_analyzed"] = sorted(failed)
+        return result
+    
+    @staticmethod
+    def _cache_key(feature: str, provider: Optional[str], template_version: str, inputs: Dict) -> str:
+        # Unpinned requests may be answered by any routed provider, so they share one "auto" entry
+        model = PROVIDER_MODELS.get(provider) if provider else sorted(PROVIDER_MODELS.values())
+        return cache_key(feature, provider or "auto", model, template_version, inputs)
+    
+    async def _route(self, messages: List[Dict], provider: str = None, temperature: float = 0.7,
+                     max_tokens: int = 1000, priority: str = "interactive",
+                     feature: str = "other") -> Tuple[str, str]:
+        """Fastest healthy provider (an explicitly requested one goes first), hedged when slow"""
+        # The router awaits rate-limit admission itself so its latency samples exclude local queueing
+        return await get_ai_router().call(
+            lambda name: self._chat(name, messages, temperature=temperature, max_tokens=max_tokens,
+                                    priority=priority, feature=feature, admit=False),
+            first=provider,
+            admit=lambda name: self._admit(name, messages, max_tokens, priority)
+        )
+    
+    @staticmethod
+    async def _admit(provider: str, messages: List[Dict], max_tokens: int, priority: str):
+        """Wait for the provider's rate limit; the token estimate is prompt plus the completion allowance"""
+        name = provider if provider in ("claude", "deepseek") else "openai"
+        tokens = sum(message_tokens(message, name) for message in messages) + max_tokens
+        await ai_rate_limiter.acquire(name, tokens, priority)
+    
+    @staticmethod
+    def _record_call(feature: str, provider: str, messages: List[Dict], content: Optional[str], usage: Dict,
+                     started: float):
+        """Telemetry for one finished call; token counts are estimated when the provider reported none"""
+        name = provider if provider in ("claude", "deepseek") else "openai"
+        latency = time.perf_counter() - started
+        if content is None:
+            ai_telemetry.record(feature, name, PROVIDER_MODELS[name], latency, error=True)
+            return
+        estimated = not usage
+        if estimated:
+            usage = {
+                "prompt_tokens": sum(message_tokens(message, name) for message in messages),
+                "completion_tokens": count_tokens(content, name)
+            }
+        ai_telemetry.record(feature, name, PROVIDER_MODELS[name], latency, usage.get("prompt_tokens", 0),
+                            usage.get("completion_tokens", 0), estimated=estimated)
+    
+    async def _chat(self, provider: str, messages: List[Dict], temperature: float = 0.7,
+                    max_tokens: int = 1000, priority: str = "interactive", feature: str = "other",
+                    admit: bool = True) -> str:
+        """Dispatch to a provider; unknown providers fall back to OpenAI. admit=False when the caller has
+        already waited for the rate limit"""
+        if admit:
+            await self._admit(provider, messages, max_tokens, priority)
+        started = time.perf_counter()
+        try:
+            if provider == "claude":
+                content, usage = await self._claude_chat(messages, temperature=temperature, max_tokens=max_tokens)
+            elif provider == "deepseek":
+                content, usage = await self._deepseek_chat(messages, temperature=temperature, max_tokens=max_tokens)
+            else:
+                content, usage = await self._openai_chat(messages, temperature=temperature, max_tokens=max_tokens)
+        except Exception:
+            self._record_call(feature, provider, messages, None, {}, started)
+            raise
+        self._record_call(feature, provider, messages, content, usage, started)
+        return content
+    
+    async def _openai_chat(self, messages: List[Dict], temperature: float = 0.7,
+                           max_tokens: int = 1000) -> Tuple[str, Dict]:
+        """Generate response using OpenAI; returns (text, token usage)"""
         try:
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4-turbo-preview",
+            response = await get_openai_client().chat.completions.create(
+                model=PROVIDER_MODELS["openai"],
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens
             )
-            return response.choices[0].message.content
+            usage = {}
+            if response.usage:
+                usage = {"prompt_tokens": response.usage.prompt_tokens,
+                         "completion_tokens": response.usage.completion_tokens}
+            return response.choices[0].message.content, usage
         except Exception as e:
             logger.error(f"OpenAI API error: {str(e)}")
             raise
     
-    def _claude_chat(self, messages: List[Dict], max_tokens: int = 1000) -> str:
-        """Generate response using Claude"""
+    async def _claude_chat(self, messages: List[Dict], temperature: float = 0.7,
+                           max_tokens: int = 1000) -> Tuple[str, Dict]:
+        """Generate response using Claude; returns (text, token usage)"""
         try:
             # Convert messages format for Claude
             system_message = next((msg["content"] for msg in messages if msg["role"] == "system"), "")
             user_messages = [msg for msg in messages if msg["role"] != "system"]
             
-            response = self.anthropic_client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=max_tokens,
-                system=system_message,
-                messages=user_messages
-            )
-            return response.content[0].text
+            # Messages API over the shared pool (the pinned SDK predates messages.create)
+            headers = {
+                "x-api-key": self.anthropic_api_key,
+                "anthropic-version": ANTHROPIC_VERSION,
+                "Content-Type": "application/json"
+            }
+            
+            data = {
+                "model": PROVIDER_MODELS["claude"],
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "system": system_message,
+                "messages": user_messages
+            }
+            
+            response = await get_http_client().post(self.anthropic_url, headers=headers, json=data)
+            response.raise_for_status()
+            
+            result = response.json()
+            usage = result.get("usage") or {}
+            if usage:
+                usage = {"prompt_tokens": usage.get("input_tokens", 0), "completion_tokens": usage.get("output_tokens", 0)}
+            return result["content"][0]["text"], usage
         except Exception as e:
             logger.error(f"Claude API error: {str(e)}")
             raise
     
-    def _deepseek_chat(self, messages: List[Dict], temperature: float = 0.7, max_tokens: int = 1000) -> str:
-        """Generate response using DeepSeek"""
+    async def _deepseek_chat(self, messages: List[Dict], temperature: float = 0.7,
+                             max_tokens: int = 1000) -> Tuple[str, Dict]:
+        """Generate response using DeepSeek; returns (text, token usage)"""
         try:
             headers = {
                 "Authorization": f"Bearer {self.deepseek_api_key}",
@@ -259,48 +574,132 @@ class MultiAIService:
             }
             
             data = {
-                "model": "deepseek-chat",
+                "model": PROVIDER_MODELS["deepseek"],
                 "messages": messages,
                 "temperature": temperature,
                 "max_tokens": max_tokens
             }
             
-            response = requests.post(self.deepseek_url, headers=headers, json=data, timeout=30)
+            response = await get_http_client().post(self.deepseek_url, headers=headers, json=data)
             response.raise_for_status()
             
             result = response.json()
-            return result["choices"][0]["message"]["content"]
+            usage = result.get("usage") or {}
+            return result["choices"][0]["message"]["content"], {
+                key: usage[key] for key in ("prompt_tokens", "completion_tokens") if key in usage}
             
         except Exception as e:
             logger.error(f"DeepSeek API error: {str(e)}")
             raise
     
-    def _analyze_emotional_state(self, user_message: str, ai_response: str) -> Dict:
-        """Analyze emotional state and crisis risk"""
-        message_lower = user_message.lower()
-        
-        # Crisis detection
-        crisis_keywords = [
-            'suicide', 'kill myself', 'end it all', 'not worth living', 
-            'better off dead', 'want to die', 'can\'t go on', 'no point',
-            'harm myself', 'hurt myself'
-        ]
-        crisis_detected = any(keyword in message_lower for keyword in crisis_keywords)
+    async def _chat_stream(self, provider: str, messages: List[Dict], temperature: float = 0.7,
+                           max_tokens: int = 1000, priority: str = "interactive",
+                           feature: str = "other") -> AsyncIterator[str]:
+        """Streaming counterpart of _chat; yields text deltas"""
+        await self._admit(provider, messages, max_tokens, priority)
+        usage: Dict = {}  # Filled by providers that report usage in the stream
+        if provider == "claude":
+            stream = self._claude_stream(messages, temperature=temperature, max_tokens=max_tokens, usage=usage)
+        elif provider == "deepseek":
+            stream = self._deepseek_stream(messages, temperature=temperature, max_tokens=max_tokens, usage=usage)
+        else:
+            stream = self._openai_stream(messages, temperature=temperature, max_tokens=max_tokens)
         
-        # Emotional state detection
-        emotional_indicators = {
-            'sad': ['sad', 'crying', 'tears', 'miss', 'lonely', 'empty', 'hurt', 'pain', 'heartbroken'],
-            'angry': ['angry', 'mad', 'furious', 'rage', 'unfair', 'hate', 'frustrated', 'livid'],
-            'anxious': ['worried', 'scared', 'anxious', 'nervous', 'afraid', 'overwhelmed', 'panic'],
-            'hopeful': ['better', 'healing', 'hope', 'forward', 'strength', 'grateful', 'thankful'],
-            'guilty': ['guilty', 'fault', 'should have', 'blame myself', 'regret'],
-            'numb': ['numb', 'empty', 'nothing', 'disconnected', 'hollow', 'void']
+        started = time.perf_counter()
+        parts = []
+        try:
+            async for text in stream:
+                parts.append(text)
+                yield text
+        except Exception:
+            self._record_call(feature, provider, messages, None, {}, started)
+            raise
+        self._record_call(feature, provider, messages, "".join(parts), usage, started)
+    
+    async def _openai_stream(self, messages: List[Dict], temperature: float = 0.7,
+                             max_tokens: int = 1000) -> AsyncIterator[str]:
+        # The pinned SDK cannot ask for usage on streams, so these calls are counted by estimate
+        stream = await get_openai_client().chat.completions.create(
+            model=PROVIDER_MODELS["openai"],
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    async def _claude_stream(self, messages: List[Dict], temperature: float = 0.7,
+                             max_tokens: int = 1000, usage: Dict = None) -> AsyncIterator[str]:
+        system_message = next((msg["content"] for msg in messages if msg["role"] == "system"), "")
+        headers = {
+            "x-api-key": self.anthropic_api_key,
+            "anthropic-version": ANTHROPIC_VERSION,
+            "Content-Type": "application/json"
         }
-        
-        detected_states = []
-        for state, keywords in emotional_indicators.items():
-            if any(keyword in message_lower for keyword in keywords):
-                detected_states.append(state)
+        data = {
+            "model": PROVIDER_MODELS["claude"],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "system": system_message,
+            "messages": [msg for msg in messages if msg["role"] != "system"],
+            "stream": True
+        }
+        async with get_http_client().stream("POST", self.anthropic_url, headers=headers, json=data) as response:
+            response.raise_for_status()
+            async for event in self._sse_events(response):
+                if event.get("type") == "content_block_delta":
+                    yield event["delta"].get("text", "")
+                elif event.get("type") == "message_start" and usage is not None:
+                    usage["prompt_tokens"] = event["message"].get("usage", {}).get("input_tokens", 0)
+                elif event.get("type") == "message_delta" and usage is not None:
+                    usage["completion_tokens"] = event.get("usage", {}).get("output_tokens", 0)
+                elif event.get("type") == "error":
+                    raise RuntimeError(event.get("error", {}).get("message", "Claude stream error"))
+    
+    async def _deepseek_stream(self, messages: List[Dict], temperature: float = 0.7,
+                               max_tokens: int = 1000, usage: Dict = None) -> AsyncIterator[str]:
+        headers = {
+            "Authorization": f"Bearer {self.deepseek_api_key}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "model": PROVIDER_MODELS["deepseek"],
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+        async with get_http_client().stream("POST", self.deepseek_url, headers=headers, json=data) as response:
+            response.raise_for_status()
+            async for event in self._sse_events(response):
+                if event.get("usage") and usage is not None:
+                    usage.update({key: event["usage"][key] for key in ("prompt_tokens", "completion_tokens")
+                                  if key in event["usage"]})
+                choices = event.get("choices") or [{}]
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    yield content
+    
+    @staticmethod
+    async def _sse_events(response) -> AsyncIterator[Dict]:
+        """JSON payloads of a provider's server-sent event stream"""
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == "[DONE]":
+                break
+            if payload:
+                yield json.loads(payload)
+    
+    def _analyze_emotional_state(self, user_message: str, ai_response: str) -> Dict:
+        """Analyze emotional state and crisis risk"""
+        # Crisis and emotional state detection in one pass over the message
+        detection = emotion_detector.scan(user_message)
+        crisis_detected = detection["crisis_detected"]
+        detected_states = detection["states"]
         
         primary_state = detected_states[0] if detected_states else 'neutral'
         
@@ -335,6 +734,18 @@ class MultiAIService:
                 "Try grounding techniques",
                 "Consider anxiety management strategies"
             ])
+        elif primary_state == 'guilty':
+            recommendations.extend([
+                "Write down what you wish you had said or done",
+                "Talk with a grief counselor about regret",
+                "Practice self-compassion"
+            ])
+        elif primary_state == 'numb':
+            recommendations.extend([
+                "Numbness is a normal early grief response",
+                "Keep simple daily routines",
+                "Reach out to someone you trust"
+            ])
         
         return {
             "emotional_state": primary_state,
@@ -351,12 +762,14 @@ class MultiAIService:
             'angry': "Anger is a natural part of grief, and it's okay to feel this way. Your emotions are valid. Sometimes grief brings up feelings we didn't expect. What's been the most challenging part for you?",
             'anxious': "It's completely understandable to feel anxious during grief. Loss can make everything feel uncertain. You're safe here, and we can take this conversation at whatever pace feels right for you.",
             'hopeful': "I'm glad to hear some hope in your words. Healing is possible, even though it doesn't erase the love or the loss. What's been helping you feel more hopeful?",
+            'guilty': "Guilt and regret are very common in grief, and they often come from how much you cared. You did what you could with what you knew at the time. Would you like to talk about what's weighing on you?",
+            'numb': "Feeling numb or disconnected after a loss is a normal way the mind protects itself. It doesn't mean you don't care, and the feelings usually return in their own time. I'm here whenever you want to talk.",
+            'reflective': "Thank you for sharing this memory. Remembering is one of the ways love continues. Would you like to tell me more about them?",
             'neutral': "Thank you for sharing with me. I'm here to listen and support you through whatever you're experiencing. Grief is deeply personal, and there's no right or wrong way to feel. What would be most helpful to talk about right now?"
         }
         
         # Crisis detection in fallback
-        crisis_keywords = ['suicide', 'kill myself', 'end it all', 'not worth living', 'better off dead']
-        crisis_detected = any(keyword in user_message.lower() for keyword in crisis_keywords)
+        crisis_detected = emotion_detector.scan(user_message)["crisis_detected"]
         
         if crisis_detected:
             response = "I'm very concerned about what you've shared. Your life has value, and there are people who want to help. Please reach out to the Crisis Text Line (text HOME to 741741) or call 988 right away. You don't have to go through this alone."
@@ -0,0 +1,189 @@
+# AI Call Telemetry: Latency Histograms, Token and Cost Accounting per Provider, Model and Feature
+import os
+import asyncio
+import logging
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from models import AIUsageRollup, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+AI_TELEMETRY_FLUSH_INTERVAL = float(os.getenv("AI_TELEMETRY_FLUSH_INTERVAL", "60"))  # Seconds
+
+# Upper bounds in milliseconds; the last bucket catches everything slower
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float("inf")]
+
+# USD per million prompt / completion tokens at list price; update when providers change pricing
+MODEL_PRICES_PER_MTOK = {
+    "gpt-4-turbo-preview": (10.00, 30.00),
+    "claude-3-sonnet-20240229": (3.00, 15.00),
+    "deepseek-chat": (0.27, 1.10)
+}
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prompt_price, completion_price = MODEL_PRICES_PER_MTOK.get(model, (0.0, 0.0))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+class _Rollup:
+    __slots__ = ("calls", "errors", "prompt_tokens", "completion_tokens", "estimated_tokens", "cost_usd",
+                 "latency_ms_sum", "latency_buckets")
+
+    def __init__(self):
+        self.calls = self.errors = self.prompt_tokens = self.completion_tokens = self.estimated_tokens = 0
+        self.cost_usd = self.latency_ms_sum = 0.0
+        self.latency_buckets = [0] * len(LATENCY_BUCKETS_MS)
+
+    def merge(self, other: "_Rollup"):
+        for field in ("calls", "errors", "prompt_tokens", "completion_tokens", "estimated_tokens", "cost_usd",
+                      "latency_ms_sum"):
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        self.latency_buckets = [a + b for a, b in zip(self.latency_buckets, other.latency_buckets)]
+
+class AITelemetry:
+    """In-memory counters for the current window, flushed to ai_usage_rollups in the background.
+
+    record() is a dict lookup, a bisect over ten bounds and a few additions on the event loop thread;
+    database writes happen only in the periodic flush, off the call path."""
+
+    def __init__(self, flush_interval: float = AI_TELEMETRY_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._window: Dict[tuple, _Rollup] = {}
+        self._window_start = datetime.utcnow()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, feature: str, provider: str, model: str, latency: float, prompt_tokens: int = 0,
+               completion_tokens: int = 0, estimated: bool = False, error: bool = False):
+        key = (feature, provider, model)
+        rollup = self._window.get(key)
+        if rollup is None:
+            rollup = self._window[key] = _Rollup()
+
+        latency_ms = latency * 1000
+        rollup.calls += 1
+        rollup.errors += error
+        rollup.latency_ms_sum += latency_ms
+        rollup.latency_buckets[bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        if prompt_tokens or completion_tokens:
+            rollup.prompt_tokens += prompt_tokens
+            rollup.completion_tokens += completion_tokens
+            rollup.cost_usd += estimate_cost(model, prompt_tokens, completion_tokens)
+            if estimated:
+                rollup.estimated_tokens += prompt_tokens + completion_tokens
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"AI telemetry flush failed: {str(e)}")
+
+    async def flush(self):
+        """Swap in a fresh window on the loop, then write the finished one from a worker thread.
+
+        If the write fails its counts are merged back into the current window and go out with the next flush."""
+        window, window_start = self._window, self._window_start
+        self._window, self._window_start = {}, datetime.utcnow()
+        if not window:
+            return
+        try:
+            await asyncio.to_thread(self._write, window, window_start, self._window_start)
+        except Exception:
+            for key, rollup in self._window.items():
+                window.setdefault(key, _Rollup()).merge(rollup)
+            self._window, self._window_start = window, window_start
+            raise
+
+    @staticmethod
+    def _write(window: Dict[tuple, _Rollup], window_start: datetime, window_end: datetime):
+        db = SessionLocal()
+        try:
+            db.add_all([
+                AIUsageRollup(
+                    window_start=window_start, window_end=window_end, feature=feature, provider=provider,
+                    model=model, calls=rollup.calls, errors=rollup.errors, prompt_tokens=rollup.prompt_tokens,
+                    completion_tokens=rollup.completion_tokens, estimated_tokens=rollup.estimated_tokens,
+                    cost_usd=rollup.cost_usd, latency_ms_sum=rollup.latency_ms_sum,
+                    latency_buckets=rollup.latency_buckets
+                )
+                for (feature, provider, model), rollup in window.items()
+            ])
+            db.commit()
+        finally:
+            db.close()
+
+    def _pending_rows(self) -> List[AIUsageRollup]:
+        return [
+            AIUsageRollup(feature=feature, provider=provider, model=model, calls=rollup.calls, errors=rollup.errors,
+                          prompt_tokens=rollup.prompt_tokens, completion_tokens=rollup.completion_tokens,
+                          estimated_tokens=rollup.estimated_tokens, cost_usd=rollup.cost_usd,
+                          latency_ms_sum=rollup.latency_ms_sum, latency_buckets=list(rollup.latency_buckets))
+            for (feature, provider, model), rollup in self._window.items()
+        ]
+
+    def rollups(self, db, hours: float = 24) -> Dict:
+        """Totals per feature / provider / model since `hours` ago, including the unflushed window"""
+        since = datetime.utcnow() - timedelta(hours=hours)
+        rows = db.query(AIUsageRollup).filter(AIUsageRollup.window_start >= since).all() + self._pending_rows()
+
+        groups: Dict[tuple, Dict] = {}
+        for row in rows:
+            group = groups.setdefault((row.feature, row.provider, row.model), {
+                "feature": row.feature, "provider": row.provider, "model": row.model, "calls": 0, "errors": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "estimated_tokens": 0, "cost_usd": 0.0,
+                "latency_ms_sum": 0.0, "latency_buckets": [0] * len(LATENCY_BUCKETS_MS)
+            })
+            for field in ("calls", "errors", "prompt_tokens", "completion_tokens", "estimated_tokens", "cost_usd",
+                          "latency_ms_sum"):
+                group[field] += getattr(row, field) or 0
+            group["latency_buckets"] = [a + b for a, b in zip(group["latency_buckets"], row.latency_buckets)]
+
+        results = []
+        for group in sorted(groups.values(), key=lambda g: -g["cost_usd"]):
+            buckets = group.pop("latency_buckets")
+            latency_ms_sum = group.pop("latency_ms_sum")
+            results.append({
+                **group,
+                "cost_usd": round(group["cost_usd"], 4),
+                "latency_mean_ms": round(latency_ms_sum / group["calls"], 1) if group["calls"] else None,
+                "latency_p50_ms": self._bucket_quantile(buckets, 0.5),
+                "latency_p95_ms": self._bucket_quantile(buckets, 0.95),
+                "latency_histogram": {("inf" if bound == float("inf") else str(bound)): count
+                                      for bound, count in zip(LATENCY_BUCKETS_MS, buckets)}
+            })
+
+        return {
+            "since": since.isoformat(),
+            "total_cost_usd": round(sum(result["cost_usd"] for result in results), 4),
+            "total_calls": sum(result["calls"] for result in results),
+            "rollups": results
+        }
+
+    @staticmethod
+    def _bucket_quantile(buckets: List[int], quantile: float) -> Optional[float]:
+        """Upper bound of the bucket holding the quantile (None past the last finite bound)"""
+        total = sum(buckets)
+        if not total:
+            return None
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, buckets):
+            seen += count
+            if seen >= quantile * total:
+                return None if bound == float("inf") else bound
+        return None
+
+# Process-wide collector shared by every MultiAIService instance
+ai_telemetry = AITelemetry()
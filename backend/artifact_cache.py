@@ -0,0 +1,176 @@
+# Content-Addressed Cache of Generated Will PDFs
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import GeneratedArtifact, Will, Document, DocumentNotarization, SessionLocal
+from will_templates import TEMPLATE_VERSION, get_will_template
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_RETENTION_DAYS = int(os.getenv("ARTIFACT_RETENTION_DAYS", "30"))
+
+class WillArtifactCache:
+    """Renders each distinct (will content, user fields, template version) once and reuses the file"""
+
+    def __init__(self, output_dir: Path = Path("uploads/generated")):
+        self.output_dir = output_dir
+
+    @staticmethod
+    def content_key(will_obj, fields: Dict, template) -> str:
+        payload = json.dumps({
+            "content": will_obj.content,
+            "fields": fields,
+            "jurisdiction": template.state_code,
+            "template_version": TEMPLATE_VERSION
+        }, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get_or_render(self, db: Session, will_obj, user) -> Tuple[str, bool]:
+        """Return (pdf_path, cache_hit), rendering and recording the artifact on a miss"""
+        template = get_will_template(will_obj.jurisdiction or user.jurisdiction)
+        fields = template.render_fields(will_obj, user)
+        key = self.content_key(will_obj, fields, template)
+
+        artifact = db.query(GeneratedArtifact).filter(GeneratedArtifact.content_key == key).first()
+        if artifact and os.path.exists(artifact.file_path):
+            artifact.last_accessed = datetime.utcnow()
+            db.commit()
+            return artifact.file_path, True
+
+        file_path = self.output_dir / f"will_{key}.pdf"
+        # Render beside the target and rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.output_dir, suffix=".pdf.tmp")
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                template.render(will_obj, user, tmp_file)
+            with open(tmp_path, "rb") as tmp_file:
+                sha256 = hashlib.sha256(tmp_file.read()).hexdigest()
+            os.replace(tmp_path, file_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        if artifact:
+            artifact.file_path = str(file_path)
+            artifact.file_size = os.path.getsize(file_path)
+            artifact.sha256 = sha256
+            artifact.last_accessed = datetime.utcnow()
+        else:
+            db.add(GeneratedArtifact(
+                content_key=key,
+                will_id=will_obj.id,
+                template_version=TEMPLATE_VERSION,
+                file_path=str(file_path),
+                file_size=os.path.getsize(file_path),
+                sha256=sha256
+            ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker rendered the same key concurrently; its row points at the same path
+            db.rollback()
+
+        return str(file_path), False
+
+    def collect_garbage(self, db: Session, retention_days: int = ARTIFACT_RETENTION_DAYS) -> Dict:
+        """Delete artifacts no will still references once they are past retention"""
+        cutoff = datetime.utcnow() - timedelta(days=retention_days)
+
+        # A will references its most recently used artifact and, once notarized, the anchored one
+        keep_ids = set()
+        latest_by_will = {}
+        notarized_hashes = self._notarized_hashes(db)
+        rows = db.query(
+            GeneratedArtifact.id, GeneratedArtifact.will_id, GeneratedArtifact.sha256,
+            GeneratedArtifact.file_path, GeneratedArtifact.last_accessed
+        ).all()
+        for row in rows:
+            current = latest_by_will.get(row.will_id)
+            if current is None or row.last_accessed > current.last_accessed:
+                latest_by_will[row.will_id] = row
+            if row.sha256 in notarized_hashes:
+                keep_ids.add(row.id)
+        keep_ids.update(row.id for row in latest_by_will.values())
+
+        expired = [row for row in rows if row.id not in keep_ids and row.last_accessed < cutoff]
+        freed_bytes = 0
+        for start in range(0, len(expired), 500):
+            batch = expired[start:start + 500]
+            for row in batch:
+                freed_bytes += self._remove_file(row.file_path)
+            db.query(GeneratedArtifact).filter(
+                GeneratedArtifact.id.in_([row.id for row in batch])
+            ).delete(synchronize_session=False)
+            db.commit()
+        removed_rows = len(expired)
+
+        # Files with no artifact row at all (legacy timestamped renders, crashed temp files). Legacy renders
+        # may be the only copy of a notarized will, so anything a record points at or whose hash was anchored stays
+        known_paths = {os.path.normpath(row.file_path) for row in db.query(GeneratedArtifact.file_path)}
+        known_paths.update(os.path.normpath(row.file_path) for row in db.query(Document.file_path))
+        removed_orphans = 0
+        cutoff_ts = time.time() - retention_days * 86400
+        for path in self.output_dir.glob("*"):
+            if (not path.is_file() or os.path.normpath(str(path)) in known_paths
+                    or path.stat().st_mtime >= cutoff_ts):
+                continue
+            if self._file_sha256(path) in notarized_hashes:
+                continue
+            freed_bytes += self._remove_file(str(path))
+            removed_orphans += 1
+
+        logger.info(f"Artifact GC removed {removed_rows} artifacts and {removed_orphans} orphan files "
+                    f"({freed_bytes} bytes)")
+        return {"artifacts_removed": removed_rows, "orphans_removed": removed_orphans, "bytes_freed": freed_bytes}
+
+    @staticmethod
+    def _notarized_hashes(db: Session) -> set:
+        """SHA-256 of every will and document that was anchored or queued for anchoring"""
+        hashes = {row.blockchain_hash for row in
+                  db.query(Will.blockchain_hash).filter(Will.blockchain_hash.isnot(None))}
+        hashes.update(row.pending_blockchain_hash for row in
+                      db.query(Will.pending_blockchain_hash).filter(Will.pending_blockchain_hash.isnot(None)))
+        hashes.update(row.blockchain_hash for row in
+                      db.query(Document.blockchain_hash).filter(Document.blockchain_hash.isnot(None)))
+        hashes.update(row.document_hash for row in db.query(DocumentNotarization.document_hash))
+        return hashes
+
+    @staticmethod
+    def _file_sha256(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _remove_file(path: str) -> int:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        except FileNotFoundError:
+            return 0
+
+def run_artifact_gc():
+    """Retention job entry point; opens its own session"""
+    db = SessionLocal()
+    try:
+        return WillArtifactCache().collect_garbage(db)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(run_artifact_gc(), indent=2))
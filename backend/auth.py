@@ -1,22 +1,100 @@
 # Authentication and Security Module
 from datetime import datetime, timedelta
 from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
+import math
+import secrets
+import time
+import uuid
 import jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from models import User, get_db
+from models import User, RefreshToken, get_db
+from token_revocation import SessionRevocationList
 import os
 from passlib.context import CryptContext
 
 # Security configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+ADMIN_EMAILS = {email.strip().lower() for email in os.getenv("ADMIN_EMAILS", "").split(",") if email.strip()}
+
+# bcrypt costs 100-300 ms of CPU per call; it runs on a bounded pool (the C extension releases the GIL)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))  # Running plus queued
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+class PasswordHasher:
+    """Hashes and verifies passwords off the event loop; sheds load with 503 + Retry-After when saturated"""
+    
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+        self._seconds = 0.25  # Running average of one hash, for Retry-After
+        self.rejected = 0
+    
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            retry_after = max(1, math.ceil(self._pending / self.workers * self._seconds))
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Authentication is busy, please retry shortly",
+                headers={"Retry-After": str(retry_after)},
+            )
+        
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._timed, fn, *args)
+        finally:
+            self._pending -= 1
+    
+    def _timed(self, fn, *args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._seconds = 0.8 * self._seconds + 0.2 * (time.perf_counter() - started)
+    
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+    
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(pwd_context.verify, plain_password, hashed_password)
+    
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "avg_hash_ms": round(self._seconds * 1000, 1)
+        }
+
+password_hasher = PasswordHasher()
+
+# Revoked login sessions, checked on every request; the table is polled over the access-token lifetime and
+# this worker's own revocations are carried across filter rebuilds for the refresh-token lifetime
+session_revocations = SessionRevocationList(timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+                                            timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS))
+
+def _invalid_refresh_token() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
 class AuthService:
     @staticmethod
     def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -50,16 +128,80 @@ class AuthService:
             )
     
     @staticmethod
-    def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
+    def _hash_refresh_token(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+    
+    @staticmethod
+    def create_session(db: Session, user: User, session_id: Optional[str] = None) -> dict:
+        """Issue an access token plus a single-use refresh token; session_id continues an existing session"""
+        session_id = session_id or uuid.uuid4().hex
+        refresh_token = secrets.token_urlsafe(32)
+        db.add(RefreshToken(
+            user_id=user.id,
+            session_id=session_id,
+            token_hash=AuthService._hash_refresh_token(refresh_token),
+            expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+        ))
+        db.commit()
+        
+        return {
+            "access_token": AuthService.create_access_token(data={"sub": user.email, "sid": session_id}),
+            "refresh_token": refresh_token,
+            "token_type": "bearer",
+            "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
+        }
+    
+    @staticmethod
+    def rotate_refresh_token(db: Session, refresh_token: str) -> dict:
+        """Trade a refresh token for a new pair. Presenting an already-used token revokes its whole session,
+        since either the client or whoever copied the token is replaying it."""
+        token = db.query(RefreshToken).filter(
+            RefreshToken.token_hash == AuthService._hash_refresh_token(refresh_token)
+        ).first()
+        if token is None or token.revoked_at is not None or token.expires_at <= datetime.utcnow():
+            raise _invalid_refresh_token()
+        
+        # Conditional update so two concurrent refreshes with the same token cannot both succeed
+        claimed = db.query(RefreshToken).filter(
+            RefreshToken.id == token.id,
+            RefreshToken.used_at.is_(None),
+            RefreshToken.revoked_at.is_(None)
+        ).update({RefreshToken.used_at: datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            AuthService.revoke_sessions(db, token.user_id, session_id=token.session_id)
+            raise _invalid_refresh_token()
+        
+        user = db.query(User).filter(User.id == token.user_id).first()
+        if user is None or not user.is_active:
+            raise _invalid_refresh_token()
+        return AuthService.create_session(db, user, session_id=token.session_id)
+    
+    @staticmethod
+    def revoke_sessions(db: Session, user_id: int, session_id: Optional[str] = None) -> int:
+        """Revoke one session, or every session of the user; returns how many were live"""
+        query = db.query(RefreshToken).filter(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+        if session_id is not None:
+            query = query.filter(RefreshToken.session_id == session_id)
+        session_ids = {row.session_id for row in query.with_entities(RefreshToken.session_id).distinct()}
+        
+        # Database time, so revocation pollers share one clock whatever this node's clock says
+        query.update({RefreshToken.revoked_at: func.now()}, synchronize_session=False)
+        db.commit()
+        session_revocations.revoke(session_ids)
+        return len(session_ids)
+    
+    @staticmethod
+    async def authenticate_user(db: Session, email: str, password: str) -> Optional[User]:
         user = db.query(User).filter(User.email == email).first()
         if not user:
             return None
-        if not AuthService.verify_password(password, user.hashed_password):
+        if not await password_hasher.verify(password, user.hashed_password):
             return None
         return user
     
     @staticmethod
-    def create_user(db: Session, email: str, password: str, first_name: str, 
+    async def create_user(db: Session, email: str, password: str, first_name: str, 
                    last_name: str, jurisdiction: str, **kwargs) -> User:
         # Check if user already exists
         existing_user = db.query(User).filter(User.email == email).first()
@@ -69,7 +211,7 @@ class AuthService:
                 detail="Email already registered"
             )
         
-        hashed_password = AuthService.get_password_hash(password)
+        hashed_password = await password_hasher.hash(password)
         db_user = User(
             email=email,
             hashed_password=hashed_password,
@@ -99,6 +241,15 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # Every token must belong to a session; one without a sid could not be revoked by logout or a password change
+    session_id = payload.get("sid")
+    if session_id is None or session_revocations.is_revoked(session_id, db):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Session has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
     user = db.query(User).filter(User.email == email).first()
     if user is None:
         raise HTTPException(
@@ -109,6 +260,15 @@ async def get_current_user(
     
     return user
 
+# Admin-only endpoints (fleet jobs, monitoring)
+async def get_current_admin(current_user: User = Depends(get_current_user)) -> User:
+    if current_user.email.lower() not in ADMIN_EMAILS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required"
+        )
+    return current_user
+
 # Optional authentication (for features that work with or without login)
 async def get_current_user_optional(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
@@ -0,0 +1,249 @@
+# Performance Benchmarks for NextEra Estate
+# Usage: python benchmarks.py <benchmark> [--iterations N]
+import io
+import json
+import time
+import argparse
+from types import SimpleNamespace
+
+def _sample_will(beneficiaries: int = 5):
+    will = SimpleNamespace(
+        id=1,
+        jurisdiction="CA",
+        content=json.dumps({
+            "personal_info": {"full_name": "Jane Q. Testator"},
+            "beneficiaries": [
+                {"name": f"Beneficiary {i}", "relationship": "child", "percentage": round(100 / beneficiaries, 2)}
+                for i in range(beneficiaries)
+            ]
+        })
+    )
+    user = SimpleNamespace(id=1, full_name="Jane Testator", address="1 Main St, Sacramento, CA",
+                           jurisdiction="CA")
+    return will, user
+
+def bench_will_render(iterations: int):
+    """CPU time per PDF with and without the precompiled template"""
+    from will_templates import get_will_template, get_stylesheet
+
+    will, user = _sample_will()
+
+    def cpu_per_pdf(precompiled: bool) -> float:
+        get_will_template(will.jurisdiction).render(will, user, io.BytesIO())  # Warm imports and fonts
+        started = time.process_time()
+        for _ in range(iterations):
+            if not precompiled:
+                # Equivalent of the old per-call stylesheet and boilerplate rebuild
+                get_stylesheet.cache_clear()
+                get_will_template.cache_clear()
+            get_will_template(will.jurisdiction).render(will, user, io.BytesIO())
+        return (time.process_time() - started) / iterations * 1000
+
+    rebuilt = cpu_per_pdf(precompiled=False)
+    cached = cpu_per_pdf(precompiled=True)
+    print(f"will_render: rebuilt per call {rebuilt:.2f} ms CPU/PDF, "
+          f"precompiled {cached:.2f} ms CPU/PDF ({(1 - cached / rebuilt) * 100:.1f}% less)")
+
+def bench_ai_routing(iterations: int):
+    """Simulated providers with injected latency and failures: static default vs hedged routing"""
+    import asyncio
+    import random
+    import logging
+    from ai_router import AIProviderRouter
+
+    logging.getLogger("ai_router").setLevel(logging.ERROR)
+    random.seed(7)
+    # (median latency s, chance of a 3 s stall, failure rate); the default provider has a fat tail
+    profiles = {"openai": (0.08, 0.10, 0.05), "claude": (0.10, 0.01, 0.02), "deepseek": (0.15, 0.01, 0.02)}
+
+    async def simulated(provider: str) -> str:
+        median, stall, failure = profiles[provider]
+        await asyncio.sleep(3.0 if random.random() < stall else random.uniform(0.5, 1.5) * median)
+        if random.random() < failure:
+            raise RuntimeError(f"{provider} simulated failure")
+        return provider
+
+    async def static_default() -> None:
+        # Old behaviour: default provider, next one only after an exception
+        for provider in profiles:
+            try:
+                return await simulated(provider)
+            except RuntimeError:
+                continue
+
+    async def run(label, call):
+        latencies = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+        print(f"ai_routing: {label:<14} p50 {p50:7.1f} ms  p99 {p99:7.1f} ms  total {sum(latencies):.1f} s")
+
+    async def main():
+        router = AIProviderRouter(list(profiles), preferred="openai", hedge_min_delay=0.05)
+        await run("static default", static_default)
+        await run("hedged router", lambda: router.call(simulated))
+        for stats in router.snapshot():
+            print(f"  {stats}")
+
+    asyncio.run(main())
+
+def bench_emotion_detection(iterations: int):
+    """Per-keyword substring scans (old) vs the single compiled pass, on long messages"""
+    from emotion_detector import emotion_detector, EMOTION_LEXICON, CRISIS_PHRASES
+
+    filler = ("Some days I sit by the window and think about the garden we planted together and the way "
+              "the light came through the kitchen in the morning. ")
+    messages = {
+        "long": filler * 40 + "I just feel so numb and I keep thinking I should have called her that night.",
+        "short": "I miss her so much, some days I feel numb and I keep thinking I should have called."
+    }
+
+    def keyword_scans(text: str):
+        text_lower = text.lower()
+        crisis = any(phrase in text_lower for phrase in CRISIS_PHRASES)
+        states = [state for state, words in EMOTION_LEXICON.items() if any(word in text_lower for word in words)]
+        return states, crisis
+
+    def ms_per_message(detect, message: str) -> float:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            detect(message)
+        return (time.perf_counter() - started) / iterations * 1000
+
+    for label, message in messages.items():
+        old = ms_per_message(keyword_scans, message)
+        new = ms_per_message(emotion_detector.scan, message)
+        print(f"emotion_detection: {label} ({len(message)} chars) keyword scans {old:.4f} ms, "
+              f"single pass {new:.4f} ms ({old / new:.1f}x)")
+
+def bench_statute_retrieval(iterations: int):
+    """Index build, cold load and per-query latency of the statute index, plus guidance prompt size"""
+    import tempfile
+    from statute_index import StatuteIndex, STATUTE_TOP_K
+    from conversation_context import count_tokens
+
+    user_data = {
+        "personal_info": {"marital_status": "married", "children": "two minor children"},
+        "assets": {"home": "primary residence", "crypto": "bitcoin in a hardware wallet"},
+        "beneficiaries": [{"name": "Alex", "relationship": "spouse"}, {"name": "Sam", "relationship": "child"}]
+    }
+    query = ("execution witnesses signature self-proving executor qualified estate tax married minor children "
+             "home primary residence bitcoin hardware wallet spouse child")
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        started = time.perf_counter()
+        StatuteIndex(index_dir=index_dir).search(query, "CA")
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        index = StatuteIndex(index_dir=index_dir)
+        passages = index.search(query, "CA", pinned_topics=("execution",))
+        load_ms = (time.perf_counter() - started) * 1000
+
+        samples = []
+        for i in range(iterations):
+            started = time.perf_counter()
+            index.search(query, ("CA", "NY", "TX", "FL")[i % 4])
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        print(f"statute_retrieval: build {build_ms:.1f} ms, mmap load {load_ms:.1f} ms, "
+              f"query p50 {samples[len(samples) // 2]:.3f} ms p99 {samples[int(len(samples) * 0.99)]:.3f} ms "
+              f"({len(index.passages)} passages, {len(index.vocabulary)} terms)")
+
+        def law_tokens(selected):
+            return count_tokens("\n".join(f"[{p['citation']}] {p['title']}: {p['text']}" for p in selected))
+
+        from ai_service import MultiAIService
+        section, quoted = MultiAIService._law_section(passages)
+        applicable = [p for p in index.passages if p["state"] in ("CA", "US")]
+        print(f"statute_retrieval: top-{STATUTE_TOP_K} law section {count_tokens(section)} tokens "
+              f"({len(quoted)} of {len(passages)} passages fit the budget) vs "
+              f"{law_tokens(applicable)} tokens for every CA and federal passage; "
+              f"user JSON {count_tokens(json.dumps(user_data))} tokens compact vs "
+              f"{count_tokens(json.dumps(user_data, indent=2))} indented")
+
+def bench_ai_telemetry(iterations: int):
+    """Cost of recording one AI call on the request path"""
+    from ai_telemetry import AITelemetry
+
+    telemetry = AITelemetry()
+    features = ["grief", "guidance", "analysis", "summary"]
+    started = time.perf_counter()
+    for i in range(iterations):
+        telemetry.record(features[i % 4], "openai", "gpt-4-turbo-preview", 0.4 + (i % 50) / 10, 900, 300)
+    per_call_us = (time.perf_counter() - started) / iterations * 1_000_000
+    print(f"ai_telemetry: record() {per_call_us:.2f} us per call ({iterations} calls)")
+
+def bench_login_burst(iterations: int):
+    """Health-check latency while a burst of logins verifies bcrypt hashes inline (old) or on the pool"""
+    import asyncio
+    import httpx
+    from fastapi import FastAPI, HTTPException
+    from auth import pwd_context, PasswordHasher
+
+    hashed = pwd_context.hash("correct horse battery staple")
+    logins = max(4, iterations // 25)
+
+    def build_app(offloaded: bool) -> FastAPI:
+        app = FastAPI()
+        hasher = PasswordHasher()
+
+        @app.post("/login")
+        async def login():
+            if offloaded:
+                ok = await hasher.verify("correct horse battery staple", hashed)
+            else:
+                ok = pwd_context.verify("correct horse battery staple", hashed)
+            return {"ok": ok}
+
+        @app.get("/health")
+        async def health():
+            return {"status": "healthy"}
+
+        return app
+
+    async def run(offloaded: bool):
+        transport = httpx.ASGITransport(app=build_app(offloaded))
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            burst = [asyncio.ensure_future(client.post("/login")) for _ in range(logins)]
+            samples = []
+            while not all(task.done() for task in burst):
+                # A client arriving every 10 ms; a blocked loop delays both the arrival and the reply
+                arrival = time.perf_counter() + 0.01
+                await asyncio.sleep(0.01)
+                await client.get("/health")
+                samples.append((time.perf_counter() - arrival) * 1000)
+            statuses = [task.result().status_code for task in burst]
+        samples.sort()
+        return samples, statuses
+
+    for offloaded in (False, True):
+        samples, statuses = asyncio.run(run(offloaded))
+        label = "bcrypt pool" if offloaded else "inline bcrypt"
+        print(f"login_burst: {label}, {logins} logins: health p50 {samples[len(samples) // 2]:.1f} ms "
+              f"p99 {samples[min(len(samples) - 1, int(len(samples) * 0.99))]:.1f} ms "
+              f"max {samples[-1]:.1f} ms over {len(samples)} checks; "
+              f"{statuses.count(200)} logins ok, {statuses.count(503)} shed with 503")
+
+BENCHMARKS = {
+    "will_render": bench_will_render,
+    "ai_routing": bench_ai_routing,
+    "ai_telemetry": bench_ai_telemetry,
+    "emotion_detection": bench_emotion_detection,
+    "login_burst": bench_login_burst,
+    "statute_retrieval": bench_statute_retrieval,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run backend performance benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ["all"])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    names = sorted(BENCHMARKS) if args.benchmark == "all" else [args.benchmark]
+    for name in names:
+        BENCHMARKS[name](args.iterations)
@@ -0,0 +1,229 @@
+# Bulk Will Export for NextEra Estate (process pool -> streamed ZIP)
+import io
+import os
+import re
+import json
+import uuid
+import logging
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import BulkExport, Will, User, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", str(os.cpu_count() or 2)))
+EXPORT_MAX_WILLS = int(os.getenv("EXPORT_MAX_WILLS", "1000"))
+
+def archive_name(will_id: int, last_name: Optional[str]) -> str:
+    """ZIP entry name; anything outside [A-Za-z0-9_-] in the name becomes "_" so it cannot escape or collide"""
+    safe = re.sub(r"[^A-Za-z0-9_-]", "_", last_name or "")
+    return f"will_{will_id}_{safe}.pdf" if safe else f"will_{will_id}.pdf"
+
+def _render_for_export(payload: Dict) -> Tuple[int, bytes]:
+    """Worker: render one will to PDF bytes (templates are cached per worker process)"""
+    from will_templates import get_will_template
+
+    will_obj = SimpleNamespace(**payload["will"])
+    user = SimpleNamespace(**payload["user"])
+    buffer = io.BytesIO()
+    get_will_template(will_obj.jurisdiction or user.jurisdiction).render(will_obj, user, buffer)
+    return will_obj.id, buffer.getvalue()
+
+class _ZipSink:
+    """Write-only, non-seekable sink; zipfile falls back to data descriptors and never seeks"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+class BulkWillExporter:
+    """Renders many wills across a process pool and streams them as one ZIP.
+
+    One pool serves every export; concurrent exports interleave their renders on it instead of each
+    forking its own set of workers. Progress lives in the bulk_exports table, so any API worker can
+    report on an export another one is streaming."""
+
+    def __init__(self, max_workers: int = EXPORT_WORKERS):
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        """Create the shared pool (idempotent); exports also create it on first use"""
+        self._get_pool()
+
+    def stop(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        """Drop a pool broken by a dead worker so the next export gets a fresh one"""
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def load_payloads(self, db: Session, will_ids: List[int]) -> List[Dict]:
+        """Snapshot the rows to render so the stream does not depend on the request's session"""
+        rows = db.query(
+            Will.id, Will.jurisdiction, Will.content,
+            User.id.label("user_id"), User.first_name, User.last_name, User.address,
+            User.jurisdiction.label("user_jurisdiction")
+        ).join(User, User.id == Will.owner_id).filter(Will.id.in_(will_ids)).order_by(Will.id).all()
+
+        return [{
+            "will": {"id": row.id, "jurisdiction": row.jurisdiction, "content": row.content},
+            "user": {
+                "id": row.user_id,
+                "full_name": f"{row.first_name} {row.last_name}",
+                "address": row.address,
+                "jurisdiction": row.user_jurisdiction
+            },
+            "archive_name": archive_name(row.id, row.last_name)
+        } for row in rows]
+
+    def create_export(self, db: Session, requested_ids: List[int], payloads: List[Dict],
+                      requested_by: Optional[int] = None) -> str:
+        found = {payload["will"]["id"] for payload in payloads}
+        export = BulkExport(
+            id=str(uuid.uuid4()),
+            requested_by=requested_by,
+            status="pending",
+            total=len(payloads),
+            completed=0,
+            failed=0,
+            missing=[will_id for will_id in requested_ids if will_id not in found]
+        )
+        db.add(export)
+        db.commit()
+        return export.id
+
+    def get_progress(self, db: Session, export_id: str) -> Optional[Dict]:
+        export = db.query(BulkExport).filter(BulkExport.id == export_id).first()
+        return self.describe(export) if export else None
+
+    @staticmethod
+    def describe(export: BulkExport) -> Dict:
+        return {
+            "export_id": export.id,
+            "status": export.status,
+            "total": export.total,
+            "completed": export.completed,
+            "failed": export.failed,
+            "missing": export.missing or [],
+            "started_at": export.started_at,
+            "finished_at": export.finished_at
+        }
+
+    def _update(self, export_id: str, **changes):
+        """Write progress; `completed` and `failed` are increments. A failed write never stops the stream"""
+        values = {}
+        for key, value in changes.items():
+            column = getattr(BulkExport, key)
+            values[column] = column + value if key in ("completed", "failed") else value
+        db = SessionLocal()
+        try:
+            db.query(BulkExport).filter(BulkExport.id == export_id).update(values, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Bulk export {export_id}: progress update failed: {str(e)}")
+        finally:
+            db.close()
+
+    def _missing(self, export_id: str) -> List[int]:
+        db = SessionLocal()
+        try:
+            export = db.query(BulkExport.missing).filter(BulkExport.id == export_id).first()
+            return (export.missing if export else None) or []
+        finally:
+            db.close()
+
+    def stream(self, export_id: str, payloads: List[Dict]) -> Iterator[bytes]:
+        """Yield ZIP bytes as each will finishes rendering; a failed will is listed in the manifest"""
+        sink = _ZipSink()
+        archive = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED)
+        manifest = {"export_id": export_id, "wills": []}
+        by_future = {}
+        queued = iter(payloads)
+        pool = self._get_pool()
+        self._update(export_id, status="running")
+
+        try:
+            # Bounded window keeps at most a few rendered PDFs in memory at once
+            for payload in queued:
+                by_future[pool.submit(_render_for_export, payload)] = payload
+                if len(by_future) >= self.max_workers * 2:
+                    break
+
+            while by_future:
+                done, _ = wait(by_future, return_when=FIRST_COMPLETED)
+                for future in done:
+                    payload = by_future.pop(future)
+                    will_id = payload["will"]["id"]
+                    try:
+                        _, pdf_bytes = future.result()
+                        archive.writestr(payload["archive_name"], pdf_bytes)
+                        manifest["wills"].append({"will_id": will_id, "file": payload["archive_name"], "status": "ok"})
+                        self._update(export_id, completed=1)
+                    except Exception as e:
+                        logger.error(f"Bulk export {export_id}: will {will_id} failed: {str(e)}")
+                        manifest["wills"].append({"will_id": will_id, "status": "failed", "error": str(e)})
+                        self._update(export_id, failed=1)
+
+                    next_payload = next(queued, None)
+                    if next_payload is not None:
+                        by_future[pool.submit(_render_for_export, next_payload)] = next_payload
+
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+
+            manifest["missing"] = self._missing(export_id)
+            archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+            archive.close()
+            yield sink.drain()
+            self._update(export_id, status="completed", finished_at=datetime.utcnow())
+        except GeneratorExit:
+            self._update(export_id, status="cancelled", finished_at=datetime.utcnow())
+            raise
+        except Exception as e:
+            logger.error(f"Bulk export {export_id} aborted: {str(e)}")
+            self._update(export_id, status="failed", finished_at=datetime.utcnow())
+            if isinstance(e, BrokenProcessPool):
+                self._discard_pool(pool)
+            raise
+        finally:
+            # The pool is shared; only this export's queued renders are dropped
+            for future in by_future:
+                future.cancel()
+
+# Process-wide exporter; progress is kept in the bulk_exports table
+bulk_will_exporter = BulkWillExporter()
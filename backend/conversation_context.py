@@ -0,0 +1,207 @@
+# Token-Budgeted Conversation Context with Rolling Summaries
+import os
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from models import ConversationSummary, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+AI_CONTEXT_BUDGET_TOKENS = int(os.getenv("AI_CONTEXT_BUDGET_TOKENS", "3000"))  # Whole prompt, system to new message
+AI_SUMMARY_MAX_TOKENS = int(os.getenv("AI_SUMMARY_MAX_TOKENS", "300"))
+AI_UNSUMMARIZED_TOKENS = int(os.getenv("AI_UNSUMMARIZED_TOKENS", "200"))  # Abridged turns awaiting the next fold
+UNSUMMARIZED_TURN_TOKENS = 80  # Longest excerpt of any one of those turns
+SUMMARY_CACHE_SESSIONS = 1000
+
+# Average characters per token of each provider's tokenizer on English prose; used when tiktoken is unavailable
+CHARS_PER_TOKEN = {"openai": 4.0, "claude": 3.5, "deepseek": 3.8}
+MESSAGE_OVERHEAD_TOKENS = 4  # Role marker and separators per chat message
+
+Summarizer = Callable[[str, List[Dict]], Awaitable[str]]
+
+@lru_cache(maxsize=1)
+def _encoding():
+    """tiktoken's cl100k_base (exact for the OpenAI chat models, close for the others), or None.
+
+    The encoding file is downloaded on first use unless TIKTOKEN_CACHE_DIR already holds it; offline
+    hosts fall back to the character estimate."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable, estimating tokens from characters: {str(e)}")
+        return None
+
+def count_tokens(text: str, provider: str = "openai") -> int:
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return int(len(text) / CHARS_PER_TOKEN.get(provider, 4.0)) + 1
+
+def clip_tokens(text: str, max_tokens: int, provider: str = "openai") -> str:
+    """Text cut to about max_tokens, ending in "..." when it was cut"""
+    if count_tokens(text, provider) <= max_tokens:
+        return text
+    encoding = _encoding()
+    if encoding is not None:
+        kept = encoding.encode(text, disallowed_special=())[:max(0, max_tokens - 1)]
+        return encoding.decode(kept).rstrip() + "..."
+    kept = int((max_tokens - 2) * CHARS_PER_TOKEN.get(provider, 4.0))
+    return text[:max(0, kept)].rstrip() + "..."
+
+def message_tokens(message: Dict, provider: str = "openai") -> int:
+    return count_tokens(message["content"], provider) + MESSAGE_OVERHEAD_TOKENS
+
+class ConversationContextManager:
+    """Packs the newest turns into a token budget; older turns live on as a per-session rolling summary"""
+
+    def __init__(self, budget_tokens: int = AI_CONTEXT_BUDGET_TOKENS, summary_tokens: int = AI_SUMMARY_MAX_TOKENS,
+                 unsummarized_tokens: int = AI_UNSUMMARIZED_TOKENS):
+        self.budget_tokens = budget_tokens
+        self.summary_tokens = summary_tokens
+        self.unsummarized_tokens = unsummarized_tokens
+        self._summaries: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()  # session -> (summary, covered)
+        self._lock = threading.Lock()
+        self._folding: Dict[str, asyncio.Task] = {}
+
+    def get_summary(self, session_id: str) -> Tuple[str, int]:
+        """(summary, number of leading history messages it covers)"""
+        with self._lock:
+            cached = self._summaries.get(session_id)
+            if cached:
+                self._summaries.move_to_end(session_id)
+                return cached
+
+        db = SessionLocal()
+        try:
+            row = db.query(ConversationSummary).filter(ConversationSummary.session_id == session_id).first()
+            summary = (row.summary, row.covered_messages) if row else ("", 0)
+        finally:
+            db.close()
+        self._remember(session_id, summary)
+        return summary
+
+    def _remember(self, session_id: str, summary: Tuple[str, int]):
+        with self._lock:
+            self._summaries[session_id] = summary
+            self._summaries.move_to_end(session_id)
+            while len(self._summaries) > SUMMARY_CACHE_SESSIONS:
+                self._summaries.popitem(last=False)
+
+    def _store_summary(self, session_id: str, summary: str, covered: int):
+        db = SessionLocal()
+        try:
+            row = db.query(ConversationSummary).filter(ConversationSummary.session_id == session_id).first()
+            if row is None:
+                row = ConversationSummary(session_id=session_id, summary=summary, covered_messages=covered)
+                db.add(row)
+            else:
+                row.summary = summary
+                row.covered_messages = covered
+                row.updated_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+        self._remember(session_id, (summary, covered))
+
+    async def build(self, session_id: Optional[str], system_prompt: str, history: List[Dict], user_message: str,
+                    provider: str, summarizer: Optional[Summarizer] = None) -> List[Dict]:
+        """Chat messages for one turn: system prompt (+ summary), as many recent turns as fit, new message.
+
+        Turns that have left the window but are not in the summary yet appear abridged in the system
+        message until the background fold covers them."""
+        summary, covered = ("", 0)
+        if session_id:
+            summary, covered = await asyncio.to_thread(self.get_summary, session_id)
+            if covered > len(history):
+                summary, covered = ("", 0)
+
+        system_content = system_prompt
+        if summary:
+            system_content += f"\n\nSummary of the earlier conversation:\n{summary}"
+        user_turn = {"role": "user", "content": user_message}
+        remaining = (self.budget_tokens - message_tokens({"content": system_content}, provider)
+                     - message_tokens(user_turn, provider))
+
+        start = self._window_start(history, covered, remaining, provider)
+        if start > covered:
+            # The window gives up room for an abridged copy of the turns it no longer holds
+            header = "Latest earlier turns, not yet in the summary (abridged):"
+            start = self._window_start(history, covered, remaining - self.unsummarized_tokens, provider)
+            gap = self._abridge(history[covered:start], self.unsummarized_tokens - count_tokens(header, provider),
+                                provider)
+            if gap:
+                system_content += f"\n\n{header}\n{gap}"
+
+        if session_id and summarizer and start > covered:
+            # Turns between the summary and the window are folded in the background, not on this turn's path
+            self._schedule_fold(session_id, summary, covered, history[:start], provider, summarizer)
+
+        return [{"role": "system", "content": system_content}, *history[start:], user_turn]
+
+    @staticmethod
+    def _window_start(history: List[Dict], covered: int, remaining: int, provider: str) -> int:
+        """Start of the newest run of turns after `covered` that fits in `remaining` tokens"""
+        # Newest turns first, stopping at the first one that no longer fits
+        start = len(history)
+        for index in range(len(history) - 1, covered - 1, -1):
+            cost = message_tokens(history[index], provider)
+            if cost > remaining:
+                break
+            remaining -= cost
+            start = index
+        # Providers such as Claude require the conversation to open with a user turn
+        while start < len(history) and history[start]["role"] != "user":
+            start += 1
+        return start
+
+    @staticmethod
+    def _abridge(turns: List[Dict], budget: int, provider: str) -> str:
+        """One clipped line per turn, newest first until the budget runs out, returned oldest first"""
+        lines = []
+        for turn in reversed(turns):
+            allowance = min(UNSUMMARIZED_TURN_TOKENS, budget)
+            if allowance < 8:
+                break
+            line = f"{turn['role'].capitalize()}: {clip_tokens(turn['content'], allowance - 3, provider)}"
+            cost = count_tokens(line, provider) + 1  # Newline
+            if cost > budget:
+                break
+            budget -= cost
+            lines.append(line)
+        return "\n".join(reversed(lines))
+
+    def _schedule_fold(self, session_id: str, summary: str, covered: int, history: List[Dict], provider: str,
+                       summarizer: Summarizer):
+        running = self._folding.get(session_id)
+        if running and not running.done():
+            return  # The next turn picks up whatever this fold does not cover
+        task = asyncio.create_task(self._fold(session_id, summary, covered, history, provider, summarizer))
+        self._folding[session_id] = task
+        task.add_done_callback(lambda _: self._folding.pop(session_id, None))
+
+    async def _fold(self, session_id: str, summary: str, covered: int, history: List[Dict], provider: str,
+                    summarizer: Summarizer):
+        try:
+            # Each summarizer call sees at most one budget's worth of new turns
+            while covered < len(history):
+                chunk_end = covered
+                chunk_tokens = 0
+                while chunk_end < len(history):
+                    chunk_tokens += message_tokens(history[chunk_end], provider)
+                    if chunk_tokens > self.budget_tokens and chunk_end > covered:
+                        break
+                    chunk_end += 1
+                summary = await summarizer(summary, history[covered:chunk_end])
+                covered = chunk_end
+                await asyncio.to_thread(self._store_summary, session_id, summary, covered)
+        except Exception as e:
+            logger.warning(f"Summarizing conversation {session_id} failed: {str(e)}")
+
+# Process-wide manager; summaries are cached in memory and persisted per session
+conversation_context = ConversationContextManager()
@@ -0,0 +1,91 @@
+# Map-Reduce Analysis of Long Vault Documents
+import io
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+from PyPDF2 import PdfReader
+
+from conversation_context import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+DOC_CHUNK_TOKENS = int(os.getenv("DOC_CHUNK_TOKENS", "2500"))
+DOC_CHUNK_OVERLAP_TOKENS = int(os.getenv("DOC_CHUNK_OVERLAP_TOKENS", "200"))  # Clauses cut at a boundary appear whole once
+DOC_ANALYSIS_CONCURRENCY = int(os.getenv("DOC_ANALYSIS_CONCURRENCY", "4"))  # Chunk calls in flight per document
+DOC_REDUCE_FANOUT = 8  # Partial results merged per reduce call
+
+T = TypeVar("T")
+
+class DocumentTextError(Exception):
+    """Raised when no text can be extracted from a vault document"""
+
+def extract_text(content: bytes, mime_type: str = None) -> str:
+    """Text of a PDF (page by page) or of a plain-text document"""
+    if mime_type == "application/pdf" or content[:5] == b"%PDF-":
+        try:
+            reader = PdfReader(io.BytesIO(content))
+            pages = [page.extract_text() or "" for page in reader.pages]
+        except Exception as e:
+            raise DocumentTextError(f"Could not read PDF: {str(e)}")
+        text = "\n\n".join(page.strip() for page in pages if page.strip())
+    elif (mime_type or "").startswith("text/"):
+        text = content.decode("utf-8", errors="replace")
+    else:
+        raise DocumentTextError(f"Text extraction is not supported for {mime_type or 'this file type'}")
+
+    if not text.strip():
+        raise DocumentTextError("Document contains no extractable text (scanned PDFs need OCR first)")
+    return text
+
+def chunk_text(text: str, chunk_tokens: int = DOC_CHUNK_TOKENS, overlap_tokens: int = DOC_CHUNK_OVERLAP_TOKENS,
+               provider: str = "openai") -> List[str]:
+    """Overlapping chunks of about chunk_tokens, cut at a paragraph or sentence break where one is near"""
+    chars_per_token = CHARS_PER_TOKEN.get(provider, 4.0)
+    size = int(chunk_tokens * chars_per_token)
+    overlap = min(int(overlap_tokens * chars_per_token), size // 2)
+    if len(text) <= size:
+        return [text]
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            # Prefer the last break in the final fifth of the window
+            floor = start + size * 4 // 5
+            for separator in ("\n\n", "\n", ". "):
+                cut = text.rfind(separator, floor, end)
+                if cut != -1:
+                    end = cut + len(separator)
+                    break
+        chunks.append(text[start:end].strip())
+        if end >= len(text):
+            break
+        start = max(end - overlap, start + 1)
+    return [chunk for chunk in chunks if chunk]
+
+async def map_reduce(items: List[str], map_fn: Callable[[int, str], Awaitable[Optional[T]]],
+                     reduce_fn: Callable[[List[T], bool], Awaitable[T]], concurrency: int = DOC_ANALYSIS_CONCURRENCY,
+                     fanout: int = DOC_REDUCE_FANOUT) -> T:
+    """map_fn over every item with at most `concurrency` calls in flight, then a tree of reduce_fn calls
+    whose last one is told it is final. Items whose map returns None are left out of the reduce. Latency
+    grows with len(items) / concurrency plus the depth of the reduce tree."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(call: Awaitable):
+        async with semaphore:
+            return await call
+
+    partials = await asyncio.gather(*(bounded(map_fn(index, item)) for index, item in enumerate(items)))
+    partials = [partial for partial in partials if partial is not None]
+    if not partials:
+        raise RuntimeError("Every chunk failed to analyze")
+
+    while True:
+        groups = [partials[index:index + fanout] for index in range(0, len(partials), fanout)]
+        final = len(groups) == 1
+        partials = list(await asyncio.gather(*(bounded(reduce_fn(group, final)) for group in groups)))
+        if final:
+            return partials[0]
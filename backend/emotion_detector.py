@@ -0,0 +1,88 @@
+# Shared Emotion and Crisis Keyword Detection for the Grief Companion
+import re
+from typing import Dict, List
+
+# Checked in this order; the first state found is the primary one
+EMOTION_LEXICON = {
+    'sad': ['sad', 'sadness', 'crying', 'cry', 'cried', 'tears', 'miss', 'misses', 'missed', 'missing',
+            'lonely', 'empty', 'hurt', 'hurts', 'hurting', 'pain', 'heartbroken'],
+    'angry': ['angry', 'mad', 'furious', 'rage', 'unfair', 'hate', 'frustrated', 'livid'],
+    'anxious': ['worried', 'worry', 'scared', 'anxious', 'nervous', 'afraid', 'overwhelmed', 'panic'],
+    'hopeful': ['better', 'healing', 'hope', 'hopeful', 'forward', 'strength', 'grateful', 'thankful'],
+    'guilty': ['guilty', 'fault', 'should have', 'blame myself', 'regret'],
+    'numb': ['numb', 'empty', 'nothing', 'disconnected', 'hollow', 'void'],
+    'reflective': ['remember', 'memory', 'memories', 'used to'],
+}
+
+CRISIS_PHRASES = [
+    'suicide', 'suicidal', 'kill myself', 'end it all', 'not worth living', 'better off dead', 'want to die',
+    "can't go on", 'no point', 'harm myself', 'hurt myself'
+]
+
+# Typographic apostrophes are folded so "can’t" matches "can't"
+_APOSTROPHES = str.maketrans({"’": "'", "‘": "'", "ʼ": "'"})
+
+def _trie_pattern(terms: List[str]) -> str:
+    """Regex alternation factored by common prefix, so each position tries one branch per next character"""
+    trie: Dict = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        branches = [(r"\s+" if char == " " else re.escape(char)) + build(child)
+                    for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+class EmotionDetector:
+    """Every lexicon compiled into one prefix-factored regex and matched in a single left-to-right pass"""
+
+    CRISIS = 'crisis'
+
+    def __init__(self, lexicon: Dict[str, List[str]] = None, crisis_phrases: List[str] = None):
+        self.lexicon = lexicon or EMOTION_LEXICON
+        self.states = list(self.lexicon)
+        self.labels: Dict[str, set] = {}
+        for state, terms in self.lexicon.items():
+            for term in terms:
+                self.labels.setdefault(self._canonical(term), set()).add(state)
+        for phrase in crisis_phrases or CRISIS_PHRASES:
+            self.labels.setdefault(self._canonical(phrase), set()).add(self.CRISIS)
+
+        # The leading non-letter is consumed rather than looked behind for: a pattern that starts with a
+        # character class lets the regex engine skip ahead quickly between word starts. The lexicon is
+        # lower-case ASCII, so ASCII letters are the word characters.
+        self.pattern = re.compile(rf"[^a-z]({_trie_pattern(list(self.labels))})(?![a-z])")
+
+    @staticmethod
+    def _canonical(term: str) -> str:
+        return " ".join(term.lower().translate(_APOSTROPHES).split())
+
+    def scan(self, text: str) -> Dict:
+        """All lexicon matches plus the detected states in priority order"""
+        text = " " + text.lower()
+        if "’" in text or "‘" in text or "ʼ" in text:
+            text = text.translate(_APOSTROPHES)
+
+        found = set()
+        matches = []
+        for match in self.pattern.findall(text):
+            term = " ".join(match.split())
+            matches.append(term)
+            found.update(self.labels[term])
+
+        return {
+            "states": [state for state in self.states if state in found],
+            "crisis_detected": self.CRISIS in found,
+            "matches": matches
+        }
+
+# Compiled once per process and shared by both grief services
+emotion_detector = EmotionDetector()
@@ -0,0 +1,239 @@
+# Background Job Queue for NextEra Estate (database-backed)
+import os
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from artifact_cache import WillArtifactCache
+from models import GenerationJob, Will, User, SessionLocal
+from will_templates import get_will_template
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_PENDING = int(os.getenv("JOB_MAX_PENDING", "200"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2.0"))
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", "600"))  # Seconds before a running job is presumed dead
+JOB_STALE_SWEEP_INTERVAL = 60  # Seconds between checks for jobs orphaned by a dead worker
+JOB_MAX_ATTEMPTS = 3
+
+class QueueFullError(Exception):
+    """Raised when the pending backlog is at its limit"""
+
+class WillJobQueue:
+    """Bounded worker pool that drains will generation jobs from the generation_jobs table"""
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING,
+                 poll_interval: float = JOB_POLL_INTERVAL):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._sweep_lock = threading.Lock()
+        self._last_sweep = float("-inf")
+
+    @staticmethod
+    def dedupe_key(will_obj, user, blockchain_enabled: bool) -> str:
+        """Submissions that would render the same document with the same options map to the same job.
+
+        Built on the artifact content key, so the testator's name, address and the template version
+        count as well as the will content."""
+        template = get_will_template(will_obj.jurisdiction or user.jurisdiction)
+        content_key = WillArtifactCache.content_key(will_obj, template.render_fields(will_obj, user), template)
+        version = f"{will_obj.id}:{content_key}:{int(bool(blockchain_enabled))}"
+        return f"will_pdf:{hashlib.sha256(version.encode()).hexdigest()}"
+
+    def submit(self, db: Session, will_obj, user, blockchain_enabled: bool = False) -> Tuple[GenerationJob, bool]:
+        """Enqueue a generation job; returns (job, coalesced).
+
+        Only a queued or running job absorbs a duplicate. A finished job with the same key is run again
+        in place so the key stays unique; the artifact cache makes an unchanged render cheap."""
+        key = self.dedupe_key(will_obj, user, blockchain_enabled)
+
+        existing = db.query(GenerationJob).filter(GenerationJob.dedupe_key == key).first()
+        if existing and existing.status in ("queued", "running"):
+            return existing, True
+
+        pending = db.query(GenerationJob).filter(GenerationJob.status == "queued").count()
+        if pending >= self.max_pending:
+            raise QueueFullError(f"{pending} jobs already pending")
+
+        if existing:
+            # Conditional on the status read above, so two concurrent resubmissions queue it once
+            requeued = db.query(GenerationJob).filter(
+                GenerationJob.id == existing.id,
+                GenerationJob.status.in_(("succeeded", "failed"))
+            ).update({
+                GenerationJob.status: "queued",
+                GenerationJob.error: None,
+                GenerationJob.attempts: 0,
+                GenerationJob.result: None,
+                GenerationJob.created_at: datetime.utcnow(),
+                GenerationJob.started_at: None,
+                GenerationJob.finished_at: None
+            }, synchronize_session=False)
+            db.commit()
+            db.refresh(existing)
+            if requeued:
+                self._wakeup.set()
+            return existing, not requeued
+
+        job = GenerationJob(
+            id=str(uuid.uuid4()),
+            job_type="will_pdf",
+            dedupe_key=key,
+            user_id=user.id,
+            will_id=will_obj.id,
+            payload={"blockchain_enabled": bool(blockchain_enabled)},
+            status="queued"
+        )
+        db.add(job)
+        try:
+            db.commit()
+        except IntegrityError:
+            # A concurrent submission won the insert; coalesce onto it
+            db.rollback()
+            return db.query(GenerationJob).filter(GenerationJob.dedupe_key == key).first(), True
+
+        db.refresh(job)
+        self._wakeup.set()
+        return job, False
+
+    def start(self):
+        """Start the worker threads (idempotent)"""
+        if self._threads:
+            return
+        self._stopping.clear()
+        self._last_sweep = float("-inf")  # First worker sweeps at once
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"will-job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.max_workers} will generation workers")
+
+    def stop(self, timeout: float = 10.0):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            self._maybe_requeue_stale()
+            job_id = self._claim_next()
+            if job_id is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job_id)
+
+    def _claim_next(self) -> Optional[str]:
+        """Atomically move the oldest queued job to running (safe across processes)"""
+        db = SessionLocal()
+        try:
+            candidate = db.query(GenerationJob.id).filter(
+                GenerationJob.status == "queued"
+            ).order_by(GenerationJob.created_at).first()
+            if not candidate:
+                return None
+
+            claimed = db.query(GenerationJob).filter(
+                GenerationJob.id == candidate.id,
+                GenerationJob.status == "queued"
+            ).update({
+                GenerationJob.status: "running",
+                GenerationJob.started_at: datetime.utcnow(),
+                GenerationJob.attempts: GenerationJob.attempts + 1
+            }, synchronize_session=False)
+            db.commit()
+            # Lost the race to another worker; try again straight away
+            return candidate.id if claimed else self._claim_next()
+        finally:
+            db.close()
+
+    def _run(self, job_id: str):
+        from services import WillGenerationService
+
+        db = SessionLocal()
+        try:
+            job = db.query(GenerationJob).filter(GenerationJob.id == job_id).first()
+            will = db.query(Will).filter(Will.id == job.will_id).first()
+            user = db.query(User).filter(User.id == job.user_id).first()
+
+            try:
+                if not will or not user:
+                    raise ValueError("Will or owner no longer exists")
+                result = WillGenerationService().generate_final_will(
+                    will, user, db, (job.payload or {}).get("blockchain_enabled", False)
+                )
+                job.status = "succeeded"
+                job.result = result
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Will generation job {job_id} failed: {str(e)}")
+                job.error = str(e)
+                job.status = "queued" if job.attempts < JOB_MAX_ATTEMPTS else "failed"
+
+            job.finished_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+    def _maybe_requeue_stale(self):
+        """Sweep for orphaned jobs at most once per JOB_STALE_SWEEP_INTERVAL across this process's workers"""
+        with self._sweep_lock:
+            if time.monotonic() - self._last_sweep < JOB_STALE_SWEEP_INTERVAL:
+                return
+            self._last_sweep = time.monotonic()
+        try:
+            self._requeue_stale()
+        except Exception as e:
+            logger.error(f"Stale job sweep failed: {str(e)}")
+
+    def _requeue_stale(self):
+        """Return jobs orphaned by a crashed worker to the queue, or fail them once out of attempts"""
+        db = SessionLocal()
+        try:
+            cutoff = datetime.utcnow() - timedelta(seconds=JOB_STALE_AFTER)
+            stale = db.query(GenerationJob).filter(
+                GenerationJob.status == "running",
+                GenerationJob.started_at < cutoff
+            )
+            failed = stale.filter(GenerationJob.attempts >= JOB_MAX_ATTEMPTS).update({
+                GenerationJob.status: "failed",
+                GenerationJob.error: "Worker stopped responding",
+                GenerationJob.finished_at: datetime.utcnow()
+            }, synchronize_session=False)
+            requeued = stale.update({GenerationJob.status: "queued"}, synchronize_session=False)
+            db.commit()
+            if requeued or failed:
+                logger.warning(f"Requeued {requeued} and failed {failed} stale will generation jobs")
+        finally:
+            db.close()
+
+    @staticmethod
+    def describe(job: GenerationJob) -> Dict:
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "will_id": job.will_id,
+            "attempts": job.attempts,
+            "error": job.error,
+            "result": job.result,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at
+        }
+
+# Process-wide queue used by the API
+will_job_queue = WillJobQueue()
@@ -63,8 +63,9 @@ class Will(Base):
     completion_percentage = Column(Float, default=0.0)
     jurisdiction = Column(String, nullable=False)
     is_notarized = Column(Boolean, default=False)
-    blockchain_hash = Column(String, nullable=True)
+    blockchain_hash = Column(String, nullable=True, index=True)
     blockchain_transaction = Column(String, nullable=True)
+    pending_blockchain_hash = Column(String, nullable=True, index=True)  # Re-anchor awaiting confirmation
     witnesses_required = Column(Integer, default=2)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -89,7 +90,7 @@ class Document(Base):
     is_encrypted = Column(Boolean, default=True)
     encryption_key = Column(String, nullable=True)
     is_notarized = Column(Boolean, default=False)
-    blockchain_hash = Column(String, nullable=True)
+    blockchain_hash = Column(String, nullable=True, index=True)
     blockchain_transaction = Column(String, nullable=True)
     tags = Column(JSON, nullable=True)  # List of tags
     shared_with = Column(JSON, nullable=True)  # List of heir IDs
@@ -109,7 +110,7 @@ class Heir(Base):
     last_name = Column(String, nullable=False)
     email = Column(String, nullable=False)
     phone = Column(String, nullable=True)
-    relationship = Column(String, nullable=False)  # spouse, child, parent, etc.
+    relationship_ = Column("relationship", String, nullable=False)  # spouse, child, parent, etc.
     role = Column(String, nullable=False)  # primary, secondary, charity, etc.
     percentage = Column(Float, nullable=False)
     address = Column(Text, nullable=True)
@@ -192,12 +193,63 @@ class BlockchainTransaction(Base):
     gas_used = Column(Integer, nullable=True)
     gas_price = Column(Float, nullable=True)
     status = Column(String, nullable=False)  # pending, confirmed, failed
-    metadata = Column(JSON, nullable=True)
+    metadata_ = Column("metadata", JSON, nullable=True)  # "metadata" is reserved by declarative models
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     wallet = relationship("BlockchainWallet", back_populates="transactions")
 
+# One on-chain anchor covering a Merkle tree of document hashes
+class NotarizationBatch(Base):
+    __tablename__ = "notarization_batches"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    merkle_root = Column(String, nullable=False, unique=True, index=True)
+    transaction_hash = Column(String, nullable=True, index=True)
+    block_number = Column(Integer, nullable=True)
+    gas_used = Column(Integer, nullable=True)
+    leaf_count = Column(Integer, nullable=False)
+    leaves = Column(JSON, nullable=False)  # Document hashes in leaf order
+    status = Column(String, default="queued", index=True)  # queued, sending, pending (sent), confirmed, failed
+    sender = Column(String, nullable=True)  # Process that claimed the batch for sending
+    send_rounds = Column(Integer, default=0)  # Failed send rounds; spaces out the retry sweep
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    anchored_at = Column(DateTime, nullable=True)
+
+# Per-document notarization record, looked up by document hash
+class DocumentNotarization(Base):
+    __tablename__ = "document_notarizations"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    document_hash = Column(String, nullable=False, unique=True, index=True)
+    batch_id = Column(Integer, ForeignKey("notarization_batches.id"), nullable=False, index=True)
+    leaf_index = Column(Integer, nullable=False)
+    proof = Column(JSON, nullable=False)  # Sibling path to the batch root
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    batch = relationship("NotarizationBatch")
+
+# Outbox of accepted notarization requests; a row lives until its hash is recorded in a batch
+class NotarizationSubmission(Base):
+    __tablename__ = "notarization_submissions"
+    # Batchers claim rows by id, so an id freed by one batch must never name a later submission
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    id = Column(Integer, primary_key=True, index=True)
+    document_hash = Column(String, nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+# Time-limited ownership of a process-wide role (e.g. the single notarization sender across API workers)
+class ServiceLease(Base):
+    __tablename__ = "service_leases"
+    
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
 # Digital Asset Model (Crypto, NFTs)
 class DigitalAsset(Base):
     __tablename__ = "digital_assets"
@@ -211,7 +263,7 @@ class DigitalAsset(Base):
     token_id = Column(String, nullable=True)  # For NFTs
     balance = Column(Float, default=0.0)
     usd_value = Column(Float, nullable=True)
-    metadata = Column(JSON, nullable=True)  # NFT metadata, etc.
+    metadata_ = Column("metadata", JSON, nullable=True)  # NFT metadata, etc.
     image_url = Column(String, nullable=True)
     last_updated = Column(DateTime, default=datetime.utcnow)
     
@@ -231,6 +283,80 @@ class ComplianceLog(Base):
     recommendations = Column(JSON, nullable=True)
     checked_at = Column(DateTime, default=datetime.utcnow)
 
+# Versioned snapshot of the state rule set used for compliance checks
+class ComplianceRuleSet(Base):
+    __tablename__ = "compliance_rule_sets"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    version = Column(String, nullable=False, unique=True, index=True)
+    rules = Column(JSON, nullable=False)  # Full states_data snapshot
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Resumable progress of a fleet re-validation run
+class RevalidationCheckpoint(Base):
+    __tablename__ = "revalidation_checkpoints"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    from_version = Column(String, nullable=False)
+    to_version = Column(String, nullable=False)
+    jurisdictions = Column(JSON, nullable=False)  # Changed state codes
+    last_will_id = Column(Integer, default=0)  # Keyset cursor
+    wills_processed = Column(Integer, default=0)
+    wills_flagged = Column(Integer, default=0)
+    status = Column(String, default="pending")  # pending, running, completed, failed
+    wills_per_second = Column(Float, nullable=True)
+    error = Column(Text, nullable=True)
+    lease_owner = Column(String, nullable=True)  # Run currently processing the checkpoint
+    heartbeat_at = Column(DateTime, nullable=True)  # Renewed after every chunk; stale means the owner died
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Background job (will PDF generation), the database doubles as the queue
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+    
+    id = Column(String, primary_key=True, index=True)  # UUID
+    job_type = Column(String, nullable=False)  # will_pdf
+    dedupe_key = Column(String, nullable=False, unique=True, index=True)  # Coalesces duplicate submissions
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    will_id = Column(Integer, ForeignKey("wills.id"), nullable=False)
+    payload = Column(JSON, nullable=True)
+    status = Column(String, default="queued", index=True)  # queued, running, succeeded, failed
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+# Progress of a bulk will export, readable from any API worker
+class BulkExport(Base):
+    __tablename__ = "bulk_exports"
+    
+    id = Column(String, primary_key=True, index=True)  # UUID
+    requested_by = Column(Integer, ForeignKey("users.id"), nullable=True)
+    status = Column(String, default="pending", index=True)  # pending, running, completed, failed, cancelled
+    total = Column(Integer, default=0)
+    completed = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    missing = Column(JSON, nullable=True)  # Requested will IDs that do not exist
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+# Rendered will PDF, stored under a hash of everything that went into it
+class GeneratedArtifact(Base):
+    __tablename__ = "generated_artifacts"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    content_key = Column(String, nullable=False, unique=True, index=True)
+    will_id = Column(Integer, ForeignKey("wills.id"), nullable=False, index=True)
+    template_version = Column(String, nullable=False)
+    file_path = Column(String, nullable=False)
+    file_size = Column(Integer, nullable=False)
+    sha256 = Column(String, nullable=False, index=True)  # Matches Will.blockchain_hash once notarized
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_accessed = Column(DateTime, default=datetime.utcnow)
+
 # Grief Support Session
 class GriefSession(Base):
     __tablename__ = "grief_sessions"
@@ -246,6 +372,48 @@ class GriefSession(Base):
     started_at = Column(DateTime, default=datetime.utcnow)
     last_activity = Column(DateTime, default=datetime.utcnow)
 
+# Rolling summary of the grief session turns that no longer fit the prompt budget
+class ConversationSummary(Base):
+    __tablename__ = "conversation_summaries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String, nullable=False, unique=True, index=True)
+    summary = Column(Text, nullable=False)
+    covered_messages = Column(Integer, nullable=False)  # Leading history messages folded into the summary
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+# AI call counts, tokens, cost and latency histogram for one flush window
+class AIUsageRollup(Base):
+    __tablename__ = "ai_usage_rollups"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    window_start = Column(DateTime, nullable=False, index=True)
+    window_end = Column(DateTime, nullable=False)
+    feature = Column(String, nullable=False, index=True)  # grief, guidance, analysis, summary
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    calls = Column(Integer, default=0)
+    errors = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    estimated_tokens = Column(Integer, default=0)  # Part of the token counts estimated, not provider-reported
+    cost_usd = Column(Float, default=0.0)
+    latency_ms_sum = Column(Float, default=0.0)
+    latency_buckets = Column(JSON, nullable=False)  # Counts per ai_telemetry.LATENCY_BUCKETS_MS upper bound
+
+# One refresh token of a login session; each use rotates it to a new row in the same session
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    session_id = Column(String, nullable=False, index=True)  # "sid" claim of the session's access tokens
+    token_hash = Column(String, nullable=False, unique=True, index=True)  # SHA-256; the token itself is never stored
+    expires_at = Column(DateTime, nullable=False)
+    used_at = Column(DateTime, nullable=True)  # Set on rotation; a second use means the token leaked
+    revoked_at = Column(DateTime, nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 # Database setup
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./nextera_estate.db")
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {})
@@ -0,0 +1,749 @@
+# Asynchronous Merkle-Batched Notarization Pipeline for NextEra Estate
+import os
+import json
+import uuid
+import socket
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, or_
+from sqlalchemy.exc import IntegrityError
+
+from models import (NotarizationBatch, DocumentNotarization, NotarizationSubmission, Document, Will,
+                    BlockchainTransaction, ServiceLease, SessionLocal)
+
+logger = logging.getLogger(__name__)
+
+NOTARY_BATCH_SIZE = int(os.getenv("NOTARY_BATCH_SIZE", "256"))
+NOTARY_BATCH_WINDOW = float(os.getenv("NOTARY_BATCH_WINDOW", "2.0"))  # Seconds
+NOTARY_CONFIRMATIONS = int(os.getenv("NOTARY_CONFIRMATIONS", "1"))
+NOTARY_POLL_INTERVAL = float(os.getenv("NOTARY_POLL_INTERVAL", "2.0"))
+NOTARY_SEND_CONCURRENCY = int(os.getenv("NOTARY_SEND_CONCURRENCY", "8"))  # Batches claimed and sent per pass
+NOTARY_SEND_RETRIES = 5
+NOTARY_SEND_BACKOFF = 2.0  # Seconds before the second send attempt; doubles per attempt
+NOTARY_RETRY_BACKOFF = 60  # Seconds before a failed batch is retried; doubles per failed round
+NOTARY_RETRY_MAX_BACKOFF = 3600
+NOTARY_SENDER_LEASE = float(os.getenv("NOTARY_SENDER_LEASE", "60"))  # Seconds a silent sender keeps the role
+NOTARY_SENDER_LEASE_NAME = "notarization_sender"
+NOTARY_CHAIN = os.getenv("NOTARY_CHAIN", "simulated")  # simulated, tester, rpc
+ANCHOR_GAS_LIMIT = 30000
+SIMULATED_CHAIN_PATH = os.getenv("SIMULATED_CHAIN_PATH", "chain/simulated_chain.jsonl")
+
+# Domain separation so an internal node can never be passed off as a leaf
+_LEAF_PREFIX = b"\x00"
+_NODE_PREFIX = b"\x01"
+
+class NotarizationUnavailableError(Exception):
+    """Raised when a submission arrives before the pipeline has started (or after it stopped)"""
+
+def merkle_leaf(document_hash: str) -> bytes:
+    return hashlib.sha256(_LEAF_PREFIX + bytes.fromhex(document_hash)).digest()
+
+def merkle_parent(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(_NODE_PREFIX + left + right).digest()
+
+class MerkleTree:
+    """Binary SHA-256 Merkle tree over document hashes; an odd node is promoted unchanged"""
+
+    def __init__(self, document_hashes: List[str]):
+        if not document_hashes:
+            raise ValueError("Cannot build a Merkle tree without leaves")
+        self.leaves = list(document_hashes)
+        self.levels = [[merkle_leaf(h) for h in self.leaves]]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            parents = [merkle_parent(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+            if len(level) % 2:
+                parents.append(level[-1])
+            self.levels.append(parents)
+
+    @property
+    def root(self) -> str:
+        return self.levels[-1][0].hex()
+
+    def proof(self, index: int) -> List[Dict]:
+        """Sibling hashes from leaf to root; 'position' is the sibling's side"""
+        path = []
+        for level in self.levels[:-1]:
+            sibling = index ^ 1
+            if sibling < len(level):
+                path.append({"position": "left" if sibling < index else "right", "hash": level[sibling].hex()})
+            index //= 2
+        return path
+
+def compute_merkle_root(document_hash: str, proof: List[Dict]) -> str:
+    node = merkle_leaf(document_hash)
+    for step in proof:
+        sibling = bytes.fromhex(step["hash"])
+        node = merkle_parent(sibling, node) if step["position"] == "left" else merkle_parent(node, sibling)
+    return node.hex()
+
+def verify_merkle_proof(document_hash: str, proof: List[Dict], merkle_root: str) -> bool:
+    try:
+        return compute_merkle_root(document_hash, proof) == merkle_root
+    except (KeyError, TypeError, ValueError):
+        return False
+
+class SimulatedChain:
+    """Local chain stand-in: one instamined block per transaction, kept in an append-only JSONL ledger.
+
+    Every call first reads records other processes appended, so all API workers see one chain."""
+
+    accepts_future_nonces = False  # Like an instamining dev node: a nonce must be the next one
+
+    BASE_BLOCK = 18000000
+    BASE_GAS = 21000
+    CALLDATA_GAS = 32 * 16  # 32-byte root at 16 gas per non-zero byte
+
+    def __init__(self, ledger_path: str = SIMULATED_CHAIN_PATH):
+        self.ledger_path = Path(ledger_path)
+        self.ledger_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._by_tx = {}
+        self._offset = 0
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        """Load complete records appended since the last read (caller holds the lock)"""
+        if not self.ledger_path.exists():
+            return
+        with open(self.ledger_path, "rb") as ledger:
+            ledger.seek(self._offset)
+            data = ledger.read()
+        complete = data[:data.rfind(b"\n") + 1]  # A concurrent writer may be mid-line
+        for line in complete.splitlines():
+            if line.strip():
+                record = json.loads(line)
+                self._by_tx[record["transaction_hash"]] = record
+        self._offset += len(complete)
+
+    def pending_nonce(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._by_tx)
+
+    def send_anchor(self, merkle_root: str, nonce: int) -> str:
+        with self._lock:
+            self._refresh()
+            expected = len(self._by_tx)
+            if nonce != expected:
+                raise ValueError(f"Invalid transaction nonce: expected {expected}, got {nonce}")
+            block_number = self.BASE_BLOCK + expected + 1
+            tx_hash = "0x" + hashlib.sha256(f"{merkle_root}:{block_number}".encode()).hexdigest()
+            record = {
+                "transaction_hash": tx_hash,
+                "block_number": block_number,
+                "merkle_root": merkle_root,
+                "gas_used": self.BASE_GAS + self.CALLDATA_GAS,
+                "timestamp": datetime.utcnow().isoformat()
+            }
+            with open(self.ledger_path, "a") as ledger:
+                ledger.write(json.dumps(record) + "\n")
+            self._refresh()
+            return tx_hash
+
+    def block_number(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self.BASE_BLOCK + len(self._by_tx)
+
+    def _record(self, tx_hash: str) -> Optional[Dict]:
+        with self._lock:
+            if tx_hash not in self._by_tx:
+                self._refresh()
+            return self._by_tx.get(tx_hash)
+
+    def get_receipt(self, tx_hash: str) -> Optional[Dict]:
+        record = self._record(tx_hash)
+        if not record:
+            return None
+        return {"block_number": record["block_number"], "gas_used": record["gas_used"], "succeeded": True}
+
+    def anchored_root(self, tx_hash: str) -> Optional[str]:
+        record = self._record(tx_hash)
+        return record["merkle_root"] if record else None
+
+class Web3AnchorChain:
+    """Anchors a root as a zero-value self-transaction whose calldata is the root"""
+
+    def __init__(self, w3, private_key: Optional[str] = None):
+        self.w3 = w3
+        # A real node holds a transaction whose nonce is ahead of the account in its queue until the gap fills;
+        # eth-tester and node-managed dev accounts reject it
+        self.accepts_future_nonces = bool(private_key)
+        if private_key:
+            from eth_account import Account
+            self.account = Account.from_key(private_key)
+            self.address = self.account.address
+        else:
+            # Node-managed, unlocked account (eth-tester or a dev node)
+            self.account = None
+            self.address = w3.eth.accounts[0]
+        self._chain_id = None
+
+    def pending_nonce(self) -> int:
+        return self.w3.eth.get_transaction_count(self.address, "pending")
+
+    def send_anchor(self, merkle_root: str, nonce: int) -> str:
+        tx = {
+            "from": self.address,
+            "to": self.address,
+            "value": 0,
+            "data": "0x" + merkle_root,
+            "nonce": nonce,
+            "gas": ANCHOR_GAS_LIMIT
+        }
+        if self.account:
+            if self._chain_id is None:
+                self._chain_id = self.w3.eth.chain_id
+            tx["gasPrice"] = self.w3.eth.gas_price
+            tx["chainId"] = self._chain_id
+            signed = self.account.sign_transaction(tx)
+            tx_hash = self.w3.eth.send_raw_transaction(signed.rawTransaction)
+        else:
+            tx_hash = self.w3.eth.send_transaction(tx)
+        return self.w3.to_hex(tx_hash)
+
+    def block_number(self) -> int:
+        return self.w3.eth.block_number
+
+    def get_receipt(self, tx_hash: str) -> Optional[Dict]:
+        from web3.exceptions import TransactionNotFound
+
+        try:
+            receipt = self.w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            return None
+        return {"block_number": receipt["blockNumber"], "gas_used": receipt["gasUsed"],
+                "succeeded": receipt["status"] == 1}
+
+    def anchored_root(self, tx_hash: str) -> Optional[str]:
+        from web3.exceptions import TransactionNotFound
+
+        try:
+            tx = self.w3.eth.get_transaction(tx_hash)
+        except TransactionNotFound:
+            return None
+        # JSON-RPC nodes call the calldata "input"; eth-tester calls it "data"
+        data = tx["input"] if "input" in tx else tx["data"]
+        return self.w3.to_hex(data)[2:]
+
+def create_anchor_chain():
+    """Chain backend selected by NOTARY_CHAIN"""
+    if NOTARY_CHAIN == "tester":
+        # In-process Ethereum stand-in; needs eth-tester (pip install "web3[tester]==6.11.3")
+        from web3 import Web3, EthereumTesterProvider
+        return Web3AnchorChain(Web3(EthereumTesterProvider()))
+    if NOTARY_CHAIN == "rpc":
+        from web3 import Web3
+        provider = Web3.HTTPProvider(
+            os.getenv("ETHEREUM_RPC_URL"),
+            request_kwargs={"timeout": int(os.getenv("WEB3_PROVIDER_TIMEOUT", "30"))}
+        )
+        return Web3AnchorChain(Web3(provider), os.getenv("NOTARY_PRIVATE_KEY"))
+    return SimulatedChain()
+
+class NonceManager:
+    """Hands out consecutive nonces for the sending account without a chain round trip per send"""
+
+    def __init__(self, chain):
+        self.chain = chain
+        self._next = None
+        self._lock = asyncio.Lock()
+
+    async def reserve(self) -> int:
+        async with self._lock:
+            if self._next is None:
+                self._next = await asyncio.to_thread(self.chain.pending_nonce)
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    async def resync(self):
+        """Forget the local counter; the next reserve re-reads the pending count"""
+        async with self._lock:
+            self._next = None
+
+class NotarizationPipeline:
+    """Submission outbox -> Merkle batcher -> pipelined sender -> confirmation tracker.
+
+    A submission is a database row before submit returns, so a crash inside the batch window loses
+    nothing; any worker's batcher turns outbox rows into queued batches. Only the worker holding the
+    sender lease claims batches, sends anchors and tracks confirmations. Nonces therefore come from one
+    counter, and a claimed batch is never sent by two workers."""
+
+    def __init__(self, chain, batch_size: int = NOTARY_BATCH_SIZE, window: float = NOTARY_BATCH_WINDOW,
+                 confirmations: int = NOTARY_CONFIRMATIONS, poll_interval: float = NOTARY_POLL_INTERVAL,
+                 sender_lease: float = NOTARY_SENDER_LEASE, send_concurrency: int = NOTARY_SEND_CONCURRENCY):
+        self.chain = chain
+        self.batch_size = batch_size
+        self.window = window
+        self.confirmations = confirmations
+        self.poll_interval = poll_interval
+        self.sender_lease = sender_lease
+        self.send_concurrency = send_concurrency
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_sender = False
+        self.nonces = NonceManager(chain)
+        self._loop = None
+        self._submitted = None
+        self._arrived = 0
+        self._wakeup = None
+        self._anchored_roots: "OrderedDict[str, str]" = OrderedDict()
+        self._tasks = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._submitted = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._batch_loop(datetime.utcnow())),
+            asyncio.create_task(self._send_loop()),
+            asyncio.create_task(self._confirm_loop())
+        ]
+        logger.info(f"Notarization pipeline started as {self.owner}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.is_sender:
+            self.is_sender = False
+            await asyncio.to_thread(self._release_lease)
+
+    def submit(self, document_hash: str):
+        """Persist a document hash to the outbox and wake the batcher; safe to call from any thread"""
+        if not self._tasks:
+            raise NotarizationUnavailableError("Notarization pipeline is not running")
+        db = SessionLocal()
+        try:
+            db.add(NotarizationSubmission(document_hash=document_hash))
+            db.commit()
+        finally:
+            db.close()
+        self._loop.call_soon_threadsafe(self._note_submission)
+
+    def _note_submission(self):
+        self._arrived += 1
+        self._submitted.set()
+
+    def anchored_root(self, tx_hash: str) -> Optional[str]:
+        """Root carried by an anchor transaction (cached; anchors are immutable once confirmed)"""
+        root = self._anchored_roots.get(tx_hash)
+        if root is None:
+            root = self.chain.anchored_root(tx_hash)
+            if root is not None:
+                self._anchored_roots[tx_hash] = root
+                while len(self._anchored_roots) > 10000:
+                    self._anchored_roots.popitem(last=False)
+        return root
+
+    async def _batch_loop(self, cutoff: datetime):
+        # The first pass takes everything in the outbox before start, e.g. submissions a crashed process accepted
+        while True:
+            self._submitted.clear()
+            self._arrived = 0
+            try:
+                while True:
+                    taken, needs_send = await asyncio.to_thread(self._batch_outbox, cutoff)
+                    if needs_send:
+                        self._wakeup.set()
+                    if taken < self.batch_size:
+                        break
+            except Exception as e:
+                logger.error(f"Batching queued notarizations failed: {str(e)}")
+
+            try:
+                await asyncio.wait_for(self._submitted.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                # Polling picks up rows another worker left behind; rows still inside its window stay its own
+                cutoff = datetime.utcnow() - timedelta(seconds=self.window)
+                continue
+
+            # Local submissions: collect for one window, or until a full batch is waiting
+            deadline = self._loop.time() + self.window
+            while self._arrived < self.batch_size:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                self._submitted.clear()
+                try:
+                    await asyncio.wait_for(self._submitted.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            cutoff = datetime.utcnow()
+
+    async def _send_loop(self):
+        # Woken by local batches; polling picks up batches other workers recorded
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._send_queued()
+            except Exception as e:
+                logger.error(f"Notarization send pass failed: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _hold_lease(self) -> bool:
+        held = await asyncio.to_thread(self._renew_lease)
+        if held and not self.is_sender:
+            # Another worker may have sent since this one last did; start again from the chain's count
+            await self.nonces.resync()
+            logger.info(f"Notarization sender lease taken by {self.owner}")
+        self.is_sender = held
+        return held
+
+    async def _send_queued(self):
+        """Claim queued batches and send them concurrently while holding the sender lease"""
+        if not await self._hold_lease():
+            return
+        await asyncio.to_thread(self._requeue_retryable)
+        while await self._hold_lease():
+            claimed = await asyncio.to_thread(self._claim_batches, self.send_concurrency)
+            if not claimed:
+                return
+            # Nonces are reserved in claim order before anything is sent
+            nonces = [await self.nonces.reserve() for _ in claimed]
+            sends = []
+            handed_over = None
+            for (batch_id, merkle_root), nonce in zip(claimed, nonces):
+                # A chain that rejects nonce gaps gets the first sends in nonce order; recording still overlaps
+                previous = None if getattr(self.chain, "accepts_future_nonces", False) else handed_over
+                handed_over = self._loop.create_future()
+                sends.append(self._send_batch(batch_id, merkle_root, nonce, previous, handed_over))
+            await asyncio.gather(*sends)
+
+    async def _send_batch(self, batch_id: int, merkle_root: str, nonce: int,
+                          previous: Optional[asyncio.Future] = None, handed_over: Optional[asyncio.Future] = None):
+        # Sends never wait for receipts, so many anchors can be in flight from one account
+        for attempt in range(1, NOTARY_SEND_RETRIES + 1):
+            if attempt > 1:
+                if not await self._hold_lease():
+                    return  # Left "sending"; the new lease holder re-queues it once the claim goes stale
+                nonce = await self.nonces.reserve()
+            try:
+                try:
+                    if previous is not None and attempt == 1:
+                        await previous
+                    tx_hash = await asyncio.to_thread(self.chain.send_anchor, merkle_root, nonce)
+                finally:
+                    if handed_over is not None and not handed_over.done():
+                        handed_over.set_result(None)
+            except Exception as e:
+                # Any failure may leave a gap or a stale counter; re-read from the chain
+                await self.nonces.resync()
+                if attempt == NOTARY_SEND_RETRIES:
+                    logger.error(f"Anchoring batch {batch_id} failed after {attempt} attempts: {str(e)}")
+                    await asyncio.to_thread(self._mark_failed, batch_id, str(e))
+                    return
+                if "nonce" not in str(e).lower():
+                    await asyncio.sleep(NOTARY_SEND_BACKOFF * 2 ** (attempt - 1))
+                continue
+
+            # The anchor is on chain now; recording it is worth retrying on its own
+            for record_attempt in range(1, NOTARY_SEND_RETRIES + 1):
+                try:
+                    await asyncio.to_thread(self._mark_sent, batch_id, tx_hash)
+                    return
+                except Exception as e:
+                    if record_attempt == NOTARY_SEND_RETRIES:
+                        logger.error(f"Anchor {tx_hash} for batch {batch_id} was sent but not recorded: {str(e)}")
+                        return
+                    await asyncio.sleep(NOTARY_SEND_BACKOFF * 2 ** (record_attempt - 1))
+
+    async def _confirm_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            if not self.is_sender:
+                continue
+            try:
+                in_flight = await asyncio.to_thread(self._load_in_flight)
+                if not in_flight:
+                    continue
+                head = await asyncio.to_thread(self.chain.block_number)
+                for batch_id, tx_hash in in_flight:
+                    receipt = await asyncio.to_thread(self.chain.get_receipt, tx_hash)
+                    if receipt is None:
+                        continue
+                    if not receipt["succeeded"]:
+                        logger.warning(f"Anchor {tx_hash} for batch {batch_id} reverted; resending")
+                        await asyncio.to_thread(self._requeue_reverted, batch_id, tx_hash)
+                        self._wakeup.set()
+                    elif head - receipt["block_number"] + 1 >= self.confirmations:
+                        await asyncio.to_thread(self._apply_confirmation, batch_id, tx_hash, receipt)
+            except Exception as e:
+                logger.error(f"Notarization confirmation check failed: {str(e)}")
+
+    def _renew_lease(self) -> bool:
+        """Take or extend the sender lease; free, expired or already ours all succeed"""
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.sender_lease)
+        db = SessionLocal()
+        try:
+            renewed = db.query(ServiceLease).filter(
+                ServiceLease.name == NOTARY_SENDER_LEASE_NAME,
+                or_(ServiceLease.owner == self.owner, ServiceLease.expires_at < now)
+            ).update({ServiceLease.owner: self.owner, ServiceLease.expires_at: expires_at}, synchronize_session=False)
+            if renewed:
+                db.commit()
+                return True
+            if db.query(ServiceLease.name).filter(ServiceLease.name == NOTARY_SENDER_LEASE_NAME).first():
+                db.rollback()
+                return False
+            db.add(ServiceLease(name=NOTARY_SENDER_LEASE_NAME, owner=self.owner, expires_at=expires_at))
+            try:
+                db.commit()
+                return True
+            except IntegrityError:
+                db.rollback()
+                return False
+        finally:
+            db.close()
+
+    def _release_lease(self):
+        db = SessionLocal()
+        try:
+            db.query(ServiceLease).filter(
+                ServiceLease.name == NOTARY_SENDER_LEASE_NAME, ServiceLease.owner == self.owner
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _claim_batches(self, limit: int) -> List[Tuple[int, str]]:
+        """Atomically move up to `limit` of the oldest queued batches to sending; returns (batch_id, merkle_root)"""
+        db = SessionLocal()
+        try:
+            claimed = []
+            while len(claimed) < limit:
+                candidates = db.query(NotarizationBatch.id, NotarizationBatch.merkle_root).filter(
+                    NotarizationBatch.status == "queued"
+                ).order_by(NotarizationBatch.id).limit(limit - len(claimed)).all()
+                if not candidates:
+                    break
+                for candidate in candidates:
+                    if db.query(NotarizationBatch).filter(
+                        NotarizationBatch.id == candidate.id,
+                        NotarizationBatch.status == "queued"
+                    ).update({NotarizationBatch.status: "sending", NotarizationBatch.sender: self.owner},
+                             synchronize_session=False):
+                        claimed.append((candidate.id, candidate.merkle_root))
+                db.commit()
+            return claimed
+        finally:
+            db.close()
+
+    def _requeue_retryable(self):
+        """Re-queue failed batches once their backoff has passed, and claims abandoned by a dead sender"""
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            abandoned = db.query(NotarizationBatch).filter(
+                NotarizationBatch.status == "sending",
+                NotarizationBatch.updated_at < now - timedelta(seconds=self.sender_lease)
+            ).update({NotarizationBatch.status: "queued"}, synchronize_session=False)
+
+            retried = 0
+            failed = db.query(NotarizationBatch.id, NotarizationBatch.send_rounds, NotarizationBatch.updated_at).filter(
+                NotarizationBatch.status == "failed").all()
+            for batch in failed:
+                rounds = max(1, batch.send_rounds or 0)
+                backoff = min(NOTARY_RETRY_MAX_BACKOFF, NOTARY_RETRY_BACKOFF * 2 ** (rounds - 1))
+                if batch.updated_at <= now - timedelta(seconds=backoff):
+                    retried += db.query(NotarizationBatch).filter(
+                        NotarizationBatch.id == batch.id, NotarizationBatch.status == "failed"
+                    ).update({NotarizationBatch.status: "queued"}, synchronize_session=False)
+            db.commit()
+            if abandoned or retried:
+                logger.warning(f"Re-queued {retried} failed and {abandoned} abandoned notarization batches")
+        finally:
+            db.close()
+
+    def _load_in_flight(self) -> List[Tuple[int, str]]:
+        db = SessionLocal()
+        try:
+            return [(row.id, row.transaction_hash) for row in db.query(
+                NotarizationBatch.id, NotarizationBatch.transaction_hash
+            ).filter(NotarizationBatch.status == "pending").order_by(NotarizationBatch.id)]
+        finally:
+            db.close()
+
+    def _batch_outbox(self, cutoff: datetime) -> Tuple[int, bool]:
+        """Record the oldest outbox rows submitted by `cutoff` as one batch; returns (rows_taken, needs_send)"""
+        db = SessionLocal()
+        try:
+            rows = db.query(NotarizationSubmission.id, NotarizationSubmission.document_hash).filter(
+                NotarizationSubmission.created_at <= cutoff
+            ).order_by(NotarizationSubmission.id).limit(self.batch_size).all()
+        finally:
+            db.close()
+        if not rows:
+            return 0, False
+        # The same document submitted twice in a window shares one leaf
+        leaves = list(dict.fromkeys(row.document_hash for row in rows))
+        recorded = self._record_batch(leaves, [row.id for row in rows])
+        return len(rows), recorded is not None and recorded[1]
+
+    def _record_batch(self, leaves: List[str], submission_ids: List[int] = ()) -> Optional[Tuple[int, bool]]:
+        """Persist the tree and per-document proofs; returns (batch_id, needs_send).
+
+        The outbox rows in `submission_ids` are deleted in the same transaction. If another worker's batcher
+        took any of them first, nothing is recorded and None is returned."""
+        tree = MerkleTree(leaves)
+        db = SessionLocal()
+        try:
+            if submission_ids:
+                taken = db.query(NotarizationSubmission).filter(
+                    NotarizationSubmission.id.in_(submission_ids)
+                ).delete(synchronize_session=False)
+                if taken != len(submission_ids):
+                    db.rollback()
+                    return None
+
+            existing = db.query(NotarizationBatch).filter(NotarizationBatch.merkle_root == tree.root).first()
+            if existing:
+                # Identical leaf set (e.g. one document re-notarized alone) is already anchored or on its way
+                if existing.status == "confirmed":
+                    self._mark_documents(db, existing.leaves, existing.transaction_hash)
+                    db.commit()
+                    return existing.id, False
+                if existing.status == "failed":
+                    existing.status = "queued"
+                needs_send = existing.status == "queued"
+                db.commit()
+                return existing.id, needs_send
+
+            batch = NotarizationBatch(
+                merkle_root=tree.root,
+                leaf_count=len(tree.leaves),
+                leaves=tree.leaves,
+                status="queued"
+            )
+            db.add(batch)
+            db.flush()
+
+            # A document keeps its earliest notarization; later re-anchors only add proof-of-existence
+            already_recorded = set()
+            for start in range(0, len(tree.leaves), 500):
+                chunk = tree.leaves[start:start + 500]
+                already_recorded.update(row.document_hash for row in db.query(DocumentNotarization.document_hash).filter(
+                    DocumentNotarization.document_hash.in_(chunk)
+                ))
+            records = [
+                {"document_hash": document_hash, "batch_id": batch.id, "leaf_index": i,
+                 "proof": tree.proof(i), "created_at": datetime.utcnow()}
+                for i, document_hash in enumerate(tree.leaves) if document_hash not in already_recorded
+            ]
+            if records:
+                db.execute(insert(DocumentNotarization), records)
+            db.commit()
+            return batch.id, True
+        finally:
+            db.close()
+
+    def _mark_failed(self, batch_id: int, error: str):
+        db = SessionLocal()
+        try:
+            db.query(NotarizationBatch).filter(NotarizationBatch.id == batch_id).update({
+                NotarizationBatch.status: "failed",
+                NotarizationBatch.send_rounds: NotarizationBatch.send_rounds + 1,
+                NotarizationBatch.last_error: error,
+                NotarizationBatch.sender: None
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _mark_sent(self, batch_id: int, tx_hash: str):
+        db = SessionLocal()
+        try:
+            recorded = db.query(NotarizationBatch).filter(
+                NotarizationBatch.id == batch_id,
+                NotarizationBatch.status == "sending",
+                NotarizationBatch.sender == self.owner
+            ).update({
+                NotarizationBatch.status: "pending",
+                NotarizationBatch.transaction_hash: tx_hash,
+                NotarizationBatch.last_error: None
+            }, synchronize_session=False)
+            db.commit()
+            if not recorded:
+                logger.warning(f"Batch {batch_id} was re-claimed while anchor {tx_hash} was being sent")
+        finally:
+            db.close()
+
+    def _requeue_reverted(self, batch_id: int, tx_hash: str):
+        db = SessionLocal()
+        try:
+            db.query(NotarizationBatch).filter(
+                NotarizationBatch.id == batch_id,
+                NotarizationBatch.status == "pending",
+                NotarizationBatch.transaction_hash == tx_hash
+            ).update({NotarizationBatch.status: "queued"}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _apply_confirmation(self, batch_id: int, tx_hash: str, receipt: Dict):
+        db = SessionLocal()
+        try:
+            batch = db.query(NotarizationBatch).filter(NotarizationBatch.id == batch_id).first()
+            batch.status = "confirmed"
+            batch.block_number = receipt["block_number"]
+            batch.gas_used = receipt["gas_used"]
+            batch.anchored_at = datetime.utcnow()
+            db.query(BlockchainTransaction).filter(BlockchainTransaction.transaction_hash == tx_hash).update({
+                BlockchainTransaction.status: "confirmed",
+                BlockchainTransaction.block_number: receipt["block_number"],
+                BlockchainTransaction.gas_used: receipt["gas_used"]
+            }, synchronize_session=False)
+            self._mark_documents(db, batch.leaves, tx_hash)
+            db.commit()
+            logger.info(f"Notarization batch {batch_id} confirmed in block {receipt['block_number']} "
+                        f"({batch.leaf_count} documents)")
+        finally:
+            db.close()
+
+    @staticmethod
+    def _mark_documents(db, leaves: List[str], tx_hash: str):
+        """Flag vault documents and wills with these hashes as notarized"""
+        for start in range(0, len(leaves), 500):
+            chunk = leaves[start:start + 500]
+            for model in (Document, Will):
+                db.query(model).filter(
+                    model.blockchain_hash.in_(chunk),
+                    model.is_notarized == False  # noqa: E712
+                ).update({model.is_notarized: True, model.blockchain_transaction: tx_hash},
+                         synchronize_session=False)
+            # A regenerated will keeps its previous proof until now; the new anchor replaces it
+            db.query(Will).filter(Will.pending_blockchain_hash.in_(chunk)).update({
+                Will.blockchain_hash: Will.pending_blockchain_hash,
+                Will.pending_blockchain_hash: None,
+                Will.is_notarized: True,
+                Will.blockchain_transaction: tx_hash
+            }, synchronize_session=False)
+
+_pipeline: Optional[NotarizationPipeline] = None
+
+def get_notarization_pipeline() -> NotarizationPipeline:
+    """Process-wide pipeline; started with the API process"""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = NotarizationPipeline(create_anchor_chain())
+    return _pipeline
@@ -0,0 +1,183 @@
+# Shared Price Oracle for Digital Asset Valuation
+import os
+import json
+import time
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+from sqlalchemy import case, func, update
+
+from models import DigitalAsset, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Feed answering GET <url>?fsyms=ETH,BTC&tsyms=USD with {"ETH": {"USD": 2400.5}, ...} (or {"ETH": 2400.5, ...})
+PRICE_FEED_URL = os.getenv("PRICE_FEED_URL", "https://min-api.cryptocompare.com/data/pricemulti")
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "60"))  # Seconds
+PRICE_FEED_TIMEOUT = float(os.getenv("PRICE_FEED_TIMEOUT", "10"))
+PRICE_STALE_MAX_AGE = float(os.getenv("PRICE_STALE_MAX_AGE", "3600"))  # Seconds an expired quote may serve on errors
+PRICE_FEED_BATCH_SIZE = 50  # Symbols per request
+
+class PriceOracle:
+    """USD quotes cached per symbol; concurrent callers share one in-flight fetch per symbol"""
+
+    def __init__(self, feed_url: str = PRICE_FEED_URL, ttl: float = PRICE_CACHE_TTL,
+                 timeout: float = PRICE_FEED_TIMEOUT, stale_max_age: float = PRICE_STALE_MAX_AGE):
+        self.feed_url = feed_url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.stale_max_age = stale_max_age
+        self._quotes: Dict[str, tuple] = {}  # symbol -> (price, fetched_at)
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._client = None
+        self._loop = None
+        self.fetches = 0
+
+    def _ensure_client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+            self._in_flight = {}
+            self._loop = loop
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def cached_price(self, symbol: str) -> Optional[float]:
+        quote = self._quotes.get(symbol.upper())
+        if quote and time.monotonic() - quote[1] < self.ttl:
+            return quote[0]
+        return None
+
+    def _stale_prices(self, symbols: List[str]) -> Dict[str, float]:
+        """Last known quotes no older than stale_max_age, served while the feed is failing"""
+        now = time.monotonic()
+        prices = {}
+        for symbol in symbols:
+            quote = self._quotes.get(symbol)
+            if quote and now - quote[1] < self.stale_max_age:
+                prices[symbol] = quote[0]
+        return prices
+
+    async def get_prices(self, symbols: Iterable[str]) -> Dict[str, float]:
+        """USD price per symbol; symbols the feed does not know are omitted
+
+        If the feed request fails, expired quotes younger than stale_max_age are returned instead."""
+        self._ensure_client()
+        symbols = {symbol.upper() for symbol in symbols if symbol}
+        prices = {}
+        waiting = {}
+        missing = []
+        for symbol in symbols:
+            price = self.cached_price(symbol)
+            if price is not None:
+                prices[symbol] = price
+            elif symbol in self._in_flight:
+                waiting[symbol] = self._in_flight[symbol]
+            else:
+                missing.append(symbol)
+
+        if missing:
+            futures = {symbol: self._loop.create_future() for symbol in missing}
+            self._in_flight.update(futures)
+            fetched = {}
+            try:
+                fetched = await self._fetch(missing)
+            except Exception as e:
+                logger.warning(f"Price feed request failed: {str(e)}")
+                fetched = self._stale_prices(missing)
+            finally:
+                # Resolve even on cancellation so callers sharing this fetch never hang
+                for symbol, future in futures.items():
+                    self._in_flight.pop(symbol, None)
+                    if not future.done():
+                        future.set_result(fetched.get(symbol))
+            waiting.update(futures)
+
+        for symbol, future in waiting.items():
+            price = await future
+            if price is not None:
+                prices[symbol] = price
+        return prices
+
+    async def _fetch(self, symbols: List[str]) -> Dict[str, float]:
+        """One feed request per PRICE_FEED_BATCH_SIZE symbols"""
+        batches = [symbols[i:i + PRICE_FEED_BATCH_SIZE] for i in range(0, len(symbols), PRICE_FEED_BATCH_SIZE)]
+        responses = await asyncio.gather(*(
+            self._client.get(self.feed_url, params={"fsyms": ",".join(batch), "tsyms": "USD"})
+            for batch in batches
+        ))
+        self.fetches += len(batches)
+
+        now = time.monotonic()
+        prices = {}
+        for response in responses:
+            response.raise_for_status()
+            for symbol, quote in response.json().items():
+                price = quote.get("USD") if isinstance(quote, dict) else quote
+                if isinstance(price, (int, float)):
+                    prices[symbol.upper()] = float(price)
+                    self._quotes[symbol.upper()] = (float(price), now)
+        return prices
+
+    async def revalue_assets(self, wallet_ids: List[int] = None) -> int:
+        """Recompute usd_value from balance for every priced asset (optionally limited to some wallets)"""
+        symbols = await asyncio.to_thread(self._held_symbols, wallet_ids)
+        if not symbols:
+            return 0
+        prices = await self.get_prices(symbols)
+        if not prices:
+            return 0
+        return await asyncio.to_thread(self._apply_prices, prices, wallet_ids)
+
+    @staticmethod
+    def _held_symbols(wallet_ids: List[int] = None) -> List[str]:
+        # Quotes are keyed by upper-case symbol, so "eth" and "ETH" rows share one price
+        db = SessionLocal()
+        try:
+            query = db.query(func.upper(DigitalAsset.symbol).label("symbol")).filter(
+                DigitalAsset.asset_type == "cryptocurrency",
+                DigitalAsset.symbol.isnot(None)
+            )
+            if wallet_ids is not None:
+                query = query.filter(DigitalAsset.wallet_id.in_(wallet_ids))
+            return [row.symbol for row in query.distinct()]
+        finally:
+            db.close()
+
+    @staticmethod
+    def _apply_prices(prices: Dict[str, float], wallet_ids: List[int] = None) -> int:
+        """Single UPDATE: usd_value = balance * price-for-symbol, matching symbols case-insensitively"""
+        symbol = func.upper(DigitalAsset.symbol)
+        statement = update(DigitalAsset).where(
+            DigitalAsset.asset_type == "cryptocurrency",
+            symbol.in_(list(prices))
+        ).values(usd_value=DigitalAsset.balance * case(prices, value=symbol))
+        if wallet_ids is not None:
+            statement = statement.where(DigitalAsset.wallet_id.in_(wallet_ids))
+
+        db = SessionLocal()
+        try:
+            result = db.execute(statement.execution_options(synchronize_session=False))
+            db.commit()
+            return result.rowcount
+        finally:
+            db.close()
+
+# Process-wide oracle so quotes are shared by every sync and request
+price_oracle = PriceOracle()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    async def revalue():
+        try:
+            return await price_oracle.revalue_assets()
+        finally:
+            await price_oracle.aclose()
+
+    print(json.dumps({"assets_revalued": asyncio.run(revalue())}))
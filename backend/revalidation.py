@@ -0,0 +1,311 @@
+# Fleet Compliance Re-validation for NextEra Estate
+import os
+import json
+import time
+import uuid
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, or_, and_
+from sqlalchemy.orm import Session
+
+from models import Will, User, ComplianceLog, ComplianceRuleSet, RevalidationCheckpoint, SessionLocal
+from services import ComplianceService
+
+logger = logging.getLogger(__name__)
+
+REVALIDATION_CHUNK_SIZE = int(os.getenv("REVALIDATION_CHUNK_SIZE", "500"))
+REVALIDATION_WORKERS = int(os.getenv("REVALIDATION_WORKERS", str(os.cpu_count() or 2)))
+REVALIDATION_LEASE_SECONDS = int(os.getenv("REVALIDATION_LEASE_SECONDS", "300"))  # Heartbeat age that frees a run
+
+# Rule set installed once per worker process by the pool initializer
+_worker_compliance: Optional[ComplianceService] = None
+
+def _init_worker(rules: Dict):
+    global _worker_compliance
+    _worker_compliance = ComplianceService(states_data=rules)
+
+def _estimate_age(date_of_birth: Optional[datetime], personal_info: Dict) -> int:
+    """Age from the profile, then the will content, then the dashboard placeholder"""
+    if date_of_birth:
+        today = datetime.utcnow().date()
+        born = date_of_birth.date()
+        return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+    try:
+        return int(personal_info.get('age'))
+    except (TypeError, ValueError):
+        return 25
+
+def _validate_chunk(rows: List[Tuple]) -> List[Dict]:
+    """Validate a chunk of (will_id, owner_id, jurisdiction, content, is_notarized, date_of_birth) rows"""
+    results = []
+    for will_id, owner_id, jurisdiction, content, is_notarized, date_of_birth in rows:
+        try:
+            will_content = json.loads(content) if content else {}
+        except ValueError:
+            will_content = {}
+
+        will_data = {
+            "age": _estimate_age(date_of_birth, will_content.get('personal_info', {})),
+            "witnesses": will_content.get('witnesses', []),
+            "notarized": bool(is_notarized),
+            "self_proving": will_content.get('self_proving', False),
+            "is_holographic": will_content.get('is_holographic', False),
+            "estate_value": will_content.get('estate_value', 0)
+        }
+        try:
+            compliance = _worker_compliance.validate_will_requirements(will_data, jurisdiction)
+        except ValueError as e:
+            # State dropped from the new rule set
+            compliance = {'is_valid': False, 'state_code': jurisdiction, 'errors': [str(e)],
+                          'warnings': [], 'recommendations': [], 'compliance_score': 0}
+        compliance["will_id"] = will_id
+
+        results.append({
+            "user_id": owner_id,
+            "jurisdiction": jurisdiction,
+            "compliance_check": compliance,
+            "is_compliant": compliance["is_valid"],
+            "issues_found": compliance["errors"] + compliance["warnings"],
+            "recommendations": compliance["recommendations"],
+            "checked_at": datetime.utcnow()
+        })
+    return results
+
+class FleetRevalidationService:
+    """Re-checks every will in jurisdictions whose rules changed between two rule-set versions"""
+
+    def __init__(self, chunk_size: int = REVALIDATION_CHUNK_SIZE, max_workers: int = REVALIDATION_WORKERS):
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+
+    def start(self, db: Session, from_version: str, to_version: str) -> RevalidationCheckpoint:
+        """Create the checkpoint for a run, or return the existing one to resume (see claim)"""
+        checkpoint = db.query(RevalidationCheckpoint).filter(
+            RevalidationCheckpoint.from_version == from_version,
+            RevalidationCheckpoint.to_version == to_version
+        ).first()
+        if checkpoint:
+            return checkpoint
+
+        old_rules = self._load_rules(db, from_version)
+        new_rules = self._load_rules(db, to_version)
+        checkpoint = RevalidationCheckpoint(
+            from_version=from_version,
+            to_version=to_version,
+            jurisdictions=ComplianceService.diff_rule_sets(old_rules, new_rules)
+        )
+        db.add(checkpoint)
+        db.commit()
+        db.refresh(checkpoint)
+        return checkpoint
+
+    def claim(self, db: Session, checkpoint_id: int) -> Optional[str]:
+        """Take the lease on a checkpoint; returns the owner token, or None while a live run holds it.
+
+        A single conditional UPDATE, so two requests (or workers) can never both claim the same run.
+        Pending and failed runs are claimable, and so is a running one whose heartbeat has gone stale."""
+        owner = uuid.uuid4().hex
+        now = datetime.utcnow()
+        claimed = db.query(RevalidationCheckpoint).filter(
+            RevalidationCheckpoint.id == checkpoint_id,
+            or_(
+                RevalidationCheckpoint.status.in_(["pending", "failed"]),
+                and_(
+                    RevalidationCheckpoint.status == "running",
+                    or_(RevalidationCheckpoint.heartbeat_at.is_(None),
+                        RevalidationCheckpoint.heartbeat_at < now - timedelta(seconds=REVALIDATION_LEASE_SECONDS))
+                )
+            )
+        ).update({
+            RevalidationCheckpoint.status: "running",
+            RevalidationCheckpoint.lease_owner: owner,
+            RevalidationCheckpoint.heartbeat_at: now,
+            RevalidationCheckpoint.error: None
+        }, synchronize_session=False)
+        db.commit()
+        return owner if claimed else None
+
+    def run(self, db: Session, checkpoint_id: int, owner: Optional[str] = None) -> Dict:
+        """Process the remaining wills for a checkpoint, committing progress after every chunk.
+
+        Pass the owner token from claim(), or leave it out to claim here; without the lease the run
+        returns the current report and does nothing."""
+        checkpoint = db.query(RevalidationCheckpoint).filter(RevalidationCheckpoint.id == checkpoint_id).first()
+        if not checkpoint:
+            raise ValueError(f"Revalidation checkpoint {checkpoint_id} not found")
+        if owner is None:
+            owner = self.claim(db, checkpoint_id)
+        db.refresh(checkpoint)
+        if owner is None or checkpoint.lease_owner != owner:
+            return self.report(checkpoint)
+        if not checkpoint.jurisdictions:
+            self._finish(db, checkpoint, owner, "completed")
+            return self.report(checkpoint)
+
+        started = time.perf_counter()
+        processed_this_run = 0
+        cursor = checkpoint.last_will_id or 0
+        in_flight = deque()
+        exhausted = False
+
+        try:
+            rules = self._load_rules(db, checkpoint.to_version)
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_worker,
+                                     initargs=(rules,)) as pool:
+                while True:
+                    # Keep the pool busy without reading the whole table ahead of the writer
+                    while not exhausted and len(in_flight) < self.max_workers * 2:
+                        rows = self._fetch_chunk(db, checkpoint.jurisdictions, cursor)
+                        if not rows:
+                            exhausted = True
+                            break
+                        cursor = rows[-1][0]
+                        in_flight.append((cursor, len(rows), pool.submit(_validate_chunk, rows)))
+
+                    if not in_flight:
+                        break
+
+                    # Chunks are written in keyset order so the checkpoint never skips ahead of a gap
+                    last_will_id, count, future = in_flight.popleft()
+                    results = future.result()
+                    if results:
+                        db.execute(insert(ComplianceLog), results)
+                    processed_this_run += count
+                    # Progress and heartbeat commit with the logs only while this run still holds the lease
+                    renewed = db.query(RevalidationCheckpoint).filter(
+                        RevalidationCheckpoint.id == checkpoint.id,
+                        RevalidationCheckpoint.lease_owner == owner
+                    ).update({
+                        RevalidationCheckpoint.last_will_id: last_will_id,
+                        RevalidationCheckpoint.wills_processed: RevalidationCheckpoint.wills_processed + count,
+                        RevalidationCheckpoint.wills_flagged: RevalidationCheckpoint.wills_flagged + sum(
+                            1 for result in results if not result["is_compliant"]
+                        ),
+                        RevalidationCheckpoint.wills_per_second:
+                            processed_this_run / max(time.perf_counter() - started, 1e-9),
+                        RevalidationCheckpoint.heartbeat_at: datetime.utcnow()
+                    }, synchronize_session=False)
+                    if not renewed:
+                        db.rollback()
+                        for _, _, pending in in_flight:
+                            pending.cancel()
+                        logger.warning(f"Revalidation {checkpoint.id}: lease lost at will {last_will_id}, stopping")
+                        db.refresh(checkpoint)
+                        return self.report(checkpoint)
+                    db.commit()
+                    db.refresh(checkpoint)
+
+                    logger.info(f"Revalidation {checkpoint.id}: {checkpoint.wills_processed} wills "
+                                f"({checkpoint.wills_per_second:.1f} wills/s), cursor at will {last_will_id}")
+
+            self._finish(db, checkpoint, owner, "completed")
+        except Exception as e:
+            db.rollback()
+            self._finish(db, checkpoint, owner, "failed", error=str(e))
+            logger.error(f"Revalidation {checkpoint.id} failed at will {checkpoint.last_will_id}: {str(e)}")
+            raise
+
+        return self.report(checkpoint)
+
+    def _finish(self, db: Session, checkpoint: RevalidationCheckpoint, owner: str, status: str,
+                error: Optional[str] = None):
+        """Record the outcome and release the lease, unless another run has taken it over"""
+        db.query(RevalidationCheckpoint).filter(
+            RevalidationCheckpoint.id == checkpoint.id,
+            RevalidationCheckpoint.lease_owner == owner
+        ).update({
+            RevalidationCheckpoint.status: status,
+            RevalidationCheckpoint.error: error,
+            RevalidationCheckpoint.lease_owner: None
+        }, synchronize_session=False)
+        db.commit()
+        db.refresh(checkpoint)
+
+    def fail(self, db: Session, checkpoint_id: int, owner: str, error: str) -> bool:
+        """Mark a run failed (and so claimable again) if `owner` still holds its lease"""
+        failed = db.query(RevalidationCheckpoint).filter(
+            RevalidationCheckpoint.id == checkpoint_id,
+            RevalidationCheckpoint.status == "running",
+            RevalidationCheckpoint.lease_owner == owner
+        ).update({
+            RevalidationCheckpoint.status: "failed",
+            RevalidationCheckpoint.error: error,
+            RevalidationCheckpoint.lease_owner: None
+        }, synchronize_session=False)
+        db.commit()
+        return bool(failed)
+
+    def _fetch_chunk(self, db: Session, jurisdictions: List[str], after_id: int) -> List[Tuple]:
+        """Keyset-paginated read of the wills in the changed jurisdictions"""
+        rows = db.query(
+            Will.id, Will.owner_id, Will.jurisdiction, Will.content, Will.is_notarized, User.date_of_birth
+        ).join(User, User.id == Will.owner_id).filter(
+            Will.jurisdiction.in_(jurisdictions),
+            Will.id > after_id
+        ).order_by(Will.id).limit(self.chunk_size).all()
+        return [tuple(row) for row in rows]
+
+    def _load_rules(self, db: Session, version: str) -> Dict:
+        rule_set = db.query(ComplianceRuleSet).filter(ComplianceRuleSet.version == version).first()
+        if not rule_set:
+            raise ValueError(f"Compliance rule set {version} not found")
+        return rule_set.rules
+
+    def report(self, checkpoint: RevalidationCheckpoint) -> Dict:
+        """Progress summary for a run"""
+        return {
+            "checkpoint_id": checkpoint.id,
+            "from_version": checkpoint.from_version,
+            "to_version": checkpoint.to_version,
+            "jurisdictions": checkpoint.jurisdictions,
+            "status": checkpoint.status,
+            "wills_processed": checkpoint.wills_processed,
+            "wills_flagged": checkpoint.wills_flagged,
+            "wills_per_second": checkpoint.wills_per_second,
+            "last_will_id": checkpoint.last_will_id,
+            "error": checkpoint.error
+        }
+
+def run_revalidation(checkpoint_id: int, owner: Optional[str] = None):
+    """Background entry point; opens its own session.
+
+    Nothing is raised to the caller, so every failure is logged here and, if this run still holds the
+    lease, left on the checkpoint as failed for the next claim to resume."""
+    db = SessionLocal()
+    service = FleetRevalidationService()
+    try:
+        service.run(db, checkpoint_id, owner)
+    except Exception as e:
+        logger.exception(f"Revalidation {checkpoint_id} stopped: {str(e)}")
+        if owner is not None:
+            try:
+                db.rollback()
+                service.fail(db, checkpoint_id, owner, str(e))
+            except Exception as mark_error:
+                # The lease goes stale instead and a later claim takes the run over
+                logger.error(f"Could not mark revalidation {checkpoint_id} failed: {str(mark_error)}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Re-validate wills affected by a rule-set change")
+    parser.add_argument("from_version")
+    parser.add_argument("to_version")
+    parser.add_argument("--chunk-size", type=int, default=REVALIDATION_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=REVALIDATION_WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    service = FleetRevalidationService(chunk_size=args.chunk_size, max_workers=args.workers)
+    session = SessionLocal()
+    try:
+        checkpoint = service.start(session, args.from_version, args.to_version)
+        print(json.dumps(service.run(session, checkpoint.id), indent=2))
+    finally:
+        session.close()
@@ -1,14 +1,16 @@
 # NextEra Estate - Production FastAPI Backend
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, status
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, status, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
-from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_, desc
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import json
 import os
+import time
 import uuid
 import shutil
 from pathlib import Path
@@ -16,8 +18,23 @@ import logging
 
 # Import our modules
 from models import *
-from auth import AuthService, get_current_user, get_current_user_optional
+from auth import (AuthService, get_current_user, get_current_user_optional, get_current_admin, password_hasher,
+                  session_revocations)
 from services import *
+from revalidation import FleetRevalidationService, run_revalidation
+from job_queue import will_job_queue, QueueFullError, WillJobQueue
+from artifact_cache import run_artifact_gc
+from bulk_export import bulk_will_exporter, EXPORT_MAX_WILLS
+from notarization import NotarizationUnavailableError, get_notarization_pipeline
+from wallet_sync import wallet_sync_engine
+from price_oracle import price_oracle
+from ai_clients import close_ai_clients
+from ai_router import get_ai_router
+from ai_service import MultiAIService, STREAM_TTFB_MS, stream_ttfb_summary
+from ai_cache import ai_response_cache, ai_single_flight
+from ai_rate_limit import ai_rate_limiter
+from ai_telemetry import ai_telemetry
+from document_analysis import extract_text, DocumentTextError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -46,6 +63,25 @@ create_tables()
 os.makedirs("uploads/documents", exist_ok=True)
 os.makedirs("uploads/generated", exist_ok=True)
 
+@app.on_event("startup")
+async def start_background_workers():
+    await get_notarization_pipeline().start()
+    will_job_queue.start()
+    bulk_will_exporter.start()
+    await ai_telemetry.start()
+    await session_revocations.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    will_job_queue.stop()
+    bulk_will_exporter.stop()
+    await get_notarization_pipeline().stop()
+    await wallet_sync_engine.aclose()
+    await price_oracle.aclose()
+    await ai_telemetry.stop()  # Flushes the current window
+    await session_revocations.stop()
+    await close_ai_clients()
+
 # Authentication Endpoints
 @app.post("/api/auth/register")
 async def register(
@@ -59,7 +95,7 @@ async def register(
 ):
     """Register a new user"""
     try:
-        user = AuthService.create_user(
+        user = await AuthService.create_user(
             db=db,
             email=email,
             password=password,
@@ -69,12 +105,9 @@ async def register(
             phone=phone
         )
         
-        # Create access token
-        access_token = AuthService.create_access_token(data={"sub": user.email})
-        
+        # Start a login session (access + refresh token)
         return {
-            "access_token": access_token,
-            "token_type": "bearer",
+            **AuthService.create_session(db, user),
             "user": {
                 "id": user.id,
                 "email": user.email,
@@ -96,18 +129,15 @@ async def login(
     db: Session = Depends(get_db)
 ):
     """Authenticate user and return token"""
-    user = AuthService.authenticate_user(db, email, password)
+    user = await AuthService.authenticate_user(db, email, password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
     
-    access_token = AuthService.create_access_token(data={"sub": user.email})
-    
     return {
-        "access_token": access_token,
-        "token_type": "bearer",
+        **AuthService.create_session(db, user),
         "user": {
             "id": user.id,
             "email": user.email,
@@ -117,6 +147,42 @@ async def login(
         }
     }
 
+@app.post("/api/auth/refresh")
+async def refresh_session(
+    refresh_token: str = Form(...),
+    db: Session = Depends(get_db)
+):
+    """Exchange a refresh token for a new access token and refresh token (each refresh token works once)"""
+    return AuthService.rotate_refresh_token(db, refresh_token)
+
+@app.post("/api/auth/logout")
+async def logout(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Sign out everywhere: revoke every session of the user"""
+    revoked = AuthService.revoke_sessions(db, current_user.id)
+    return {"message": "Logged out", "sessions_revoked": revoked}
+
+@app.post("/api/auth/change-password")
+async def change_password(
+    current_password: str = Form(...),
+    new_password: str = Form(...),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Change the password, revoke every existing session and start a fresh one for this client"""
+    if not await password_hasher.verify(current_password, current_user.hashed_password):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect password"
+        )
+    
+    current_user.hashed_password = await password_hasher.hash(new_password)
+    db.commit()
+    revoked = AuthService.revoke_sessions(db, current_user.id)
+    return {**AuthService.create_session(db, current_user), "sessions_revoked": revoked}
+
 # User Profile Endpoints
 @app.get("/api/user/profile")
 async def get_profile(current_user: User = Depends(get_current_user)):
@@ -289,31 +355,153 @@ async def generate_will(
     if not will:
         raise HTTPException(status_code=404, detail="No will found")
     
+    # Rendering and hashing the PDF are blocking; keep them off the event loop
     will_service = WillGenerationService()
+    try:
+        result = await run_in_threadpool(will_service.generate_final_will, will, current_user, db, blockchain_enabled)
+    except NotarizationUnavailableError:
+        raise HTTPException(
+            status_code=503,
+            detail="Notarization is not available right now, please retry shortly",
+            headers={"Retry-After": "30"}
+        )
     
-    # Generate PDF document
-    pdf_path = will_service.generate_will_pdf(will, current_user)
+    return {"message": "Will generated successfully", **result}
+
+@app.get("/api/will/preview")
+async def preview_will(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Render the current draft in memory and stream it back; nothing is written to disk"""
+    will = db.query(Will).filter(Will.owner_id == current_user.id).first()
+    if not will:
+        raise HTTPException(status_code=404, detail="No will found")
     
-    # Blockchain notarization if enabled
-    if blockchain_enabled:
-        blockchain_service = BlockchainService()
-        result = blockchain_service.notarize_document(pdf_path, current_user.id, db)
-        
-        if result["success"]:
-            will.blockchain_hash = result["document_hash"]
-            will.blockchain_transaction = result["transaction_hash"]
-            will.is_notarized = True
+    will_service = WillGenerationService()
+    pdf_stream = await run_in_threadpool(will_service.render_will_stream, will, current_user)
     
-    will.status = "complete"
-    will.completion_percentage = 100.0
-    db.commit()
+    return StreamingResponse(
+        pdf_stream,
+        media_type="application/pdf",
+        headers={"Content-Disposition": 'inline; filename="will_preview.pdf"', "Cache-Control": "no-store"}
+    )
+
+@app.get("/api/will/pdf")
+async def download_will_pdf(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Download the most recently saved or notarized will PDF"""
+    will = db.query(Will).filter(Will.owner_id == current_user.id).first()
+    if not will:
+        raise HTTPException(status_code=404, detail="No will found")
     
-    return {
-        "message": "Will generated successfully",
-        "pdf_path": pdf_path,
-        "blockchain_notarized": blockchain_enabled,
-        "transaction_hash": will.blockchain_transaction if blockchain_enabled else None
-    }
+    artifact = db.query(GeneratedArtifact).filter(
+        GeneratedArtifact.will_id == will.id
+    ).order_by(desc(GeneratedArtifact.last_accessed)).first()
+    if not artifact or not os.path.exists(artifact.file_path):
+        raise HTTPException(status_code=404, detail="No generated will document; generate it first")
+    
+    return FileResponse(artifact.file_path, media_type="application/pdf", filename=f"will_{will.id}.pdf")
+
+@app.post("/api/will/generate/jobs")
+async def submit_will_generation(
+    blockchain_enabled: bool = Form(False),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue will generation; duplicate submissions of the same will version share one job"""
+    will = db.query(Will).filter(Will.owner_id == current_user.id).first()
+    if not will:
+        raise HTTPException(status_code=404, detail="No will found")
+    
+    try:
+        job, coalesced = will_job_queue.submit(db, will, current_user, blockchain_enabled)
+    except QueueFullError:
+        raise HTTPException(
+            status_code=503,
+            detail="Will generation is busy, please retry shortly",
+            headers={"Retry-After": "30"}
+        )
+    
+    return {"job_id": job.id, "status": job.status, "coalesced": coalesced}
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Poll a background job"""
+    job = db.query(GenerationJob).filter(
+        and_(GenerationJob.id == job_id, GenerationJob.user_id == current_user.id)
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return WillJobQueue.describe(job)
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Download the PDF produced by a finished job"""
+    job = db.query(GenerationJob).filter(
+        and_(GenerationJob.id == job_id, GenerationJob.user_id == current_user.id)
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    
+    pdf_path = job.result["pdf_path"]
+    if not os.path.exists(pdf_path):
+        raise HTTPException(status_code=410, detail="Generated document no longer available")
+    
+    return FileResponse(pdf_path, media_type="application/pdf", filename=os.path.basename(pdf_path))
+
+@app.post("/api/admin/wills/export")
+async def export_wills(
+    will_ids: str = Form(...),  # JSON list of will IDs
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Render many wills and stream them back as a ZIP while they finish"""
+    try:
+        requested_ids = [int(will_id) for will_id in json.loads(will_ids)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="will_ids must be a JSON list of integers")
+    if not requested_ids:
+        raise HTTPException(status_code=400, detail="No wills requested")
+    if len(requested_ids) > EXPORT_MAX_WILLS:
+        raise HTTPException(status_code=400, detail=f"At most {EXPORT_MAX_WILLS} wills per export")
+    
+    payloads = bulk_will_exporter.load_payloads(db, requested_ids)
+    export_id = bulk_will_exporter.create_export(db, requested_ids, payloads, current_user.id)
+    
+    return StreamingResponse(
+        bulk_will_exporter.stream(export_id, payloads),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="wills_{export_id}.zip"',
+            "X-Export-Id": export_id
+        }
+    )
+
+@app.get("/api/admin/wills/export/{export_id}")
+async def get_export_progress(
+    export_id: str,
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Progress of a running or recent bulk export"""
+    progress = bulk_will_exporter.get_progress(db, export_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return progress
 
 # Document Vault Endpoints
 @app.get("/api/documents")
@@ -414,22 +602,61 @@ async def notarize_document(
         raise HTTPException(status_code=404, detail="Document not found")
     
     blockchain_service = BlockchainService()
-    result = blockchain_service.notarize_document(document.file_path, current_user.id, db)
+    try:
+        result = blockchain_service.notarize_document(document.file_path, current_user.id, db)
+    except NotarizationUnavailableError:
+        raise HTTPException(
+            status_code=503,
+            detail="Notarization is not available right now, please retry shortly",
+            headers={"Retry-After": "30"}
+        )
     
     if result["success"]:
-        document.is_notarized = True
+        # Flagged as notarized by the pipeline once the batch anchor confirms
         document.blockchain_hash = result["document_hash"]
-        document.blockchain_transaction = result["transaction_hash"]
         db.commit()
         
         return {
-            "message": "Document notarized successfully",
-            "transaction_hash": result["transaction_hash"],
-            "block_number": result["block_number"]
+            "message": "Document queued for notarization",
+            "status": result["status"],
+            "document_hash": result["document_hash"],
+            "verify_url": "/api/blockchain/verify"
         }
     else:
         raise HTTPException(status_code=500, detail=f"Notarization failed: {result['error']}")
 
+@app.post("/api/documents/{document_id}/analyze")
+async def analyze_document(
+    document_id: int,
+    state_code: Optional[str] = Form(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """AI compliance analysis of a vault document; long documents are analyzed in parallel sections"""
+    document = db.query(Document).filter(
+        and_(Document.id == document_id, Document.owner_id == current_user.id)
+    ).first()
+    
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    def read_text() -> str:
+        if document.is_encrypted:
+            content = EncryptionService().decrypt_file(document.file_path, document.encryption_key)
+        else:
+            with open(document.file_path, "rb") as file:
+                content = file.read()
+        return extract_text(content, document.mime_type)
+    
+    try:
+        # Decryption and PDF parsing are CPU-bound; keep them off the event loop
+        text = await run_in_threadpool(read_text)
+    except DocumentTextError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    analysis = await MultiAIService().analyze_document_compliance(text, state_code or current_user.jurisdiction)
+    return {"document_id": document.id, "filename": document.original_filename, **analysis}
+
 # Heir Management Endpoints
 @app.get("/api/heirs")
 async def get_heirs(
@@ -446,7 +673,7 @@ async def get_heirs(
         "full_name": heir.full_name,
         "email": heir.email,
         "phone": heir.phone,
-        "relationship": heir.relationship,
+        "relationship": heir.relationship_,
         "role": heir.role,
         "percentage": heir.percentage,
         "is_verified": heir.is_verified,
@@ -473,7 +700,7 @@ async def create_heir(
         last_name=last_name,
         email=email,
         phone=phone,
-        relationship=relationship,
+        relationship_=relationship,
         role=role,
         percentage=percentage
     )
@@ -535,15 +762,13 @@ async def connect_wallet(
         existing_wallet.network = network
         existing_wallet.wallet_type = wallet_type
         existing_wallet.is_connected = True
-        existing_wallet.last_sync = datetime.utcnow()
     else:
         wallet = BlockchainWallet(
             owner_id=current_user.id,
             wallet_address=wallet_address,
             network=network,
             wallet_type=wallet_type,
-            is_connected=True,
-            last_sync=datetime.utcnow()
+            is_connected=True
         )
         db.add(wallet)
     
@@ -551,9 +776,34 @@ async def connect_wallet(
     
     # Sync wallet data
     blockchain_service = BlockchainService()
-    blockchain_service.sync_wallet_assets(current_user.id, db)
+    sync = await blockchain_service.sync_wallet_assets(current_user.id, db)
+    
+    return {"message": "Wallet connected successfully", "synced": sync.get("failed", 0) == 0}
+
+@app.post("/api/blockchain/verify")
+async def verify_documents(
+    document_hashes: str = Form(...),  # JSON list of SHA-256 hex digests
+    current_user: User = Depends(get_current_user)
+):
+    """Verify many notarized documents in one round trip"""
+    try:
+        hashes = [str(h).lower() for h in json.loads(document_hashes)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="document_hashes must be a JSON list")
+    if len(hashes) > 5000:
+        raise HTTPException(status_code=400, detail="At most 5000 hashes per request")
+    if any(len(h) != 64 or any(c not in "0123456789abcdef" for c in h) for h in hashes):
+        raise HTTPException(status_code=400, detail="Each hash must be a 64-character hex SHA-256 digest")
+    
+    # Anchor lookups are chain RPCs; the worker thread opens its own session
+    blockchain_service = BlockchainService()
+    results = await run_in_threadpool(blockchain_service.verify_documents, hashes)
     
-    return {"message": "Wallet connected successfully"}
+    return {
+        "verified": sum(1 for result in results if result["is_verified"]),
+        "total": len(results),
+        "results": results
+    }
 
 # Compliance Endpoints
 @app.get("/api/compliance/states")
@@ -579,6 +829,101 @@ async def validate_compliance(
     will_data_dict = json.loads(will_data)
     return compliance_service.validate_will_requirements(will_data_dict, state_code)
 
+# Fleet re-validation when jurisdiction rules change
+@app.post("/api/admin/compliance/rulesets")
+async def publish_rule_set(
+    version: Optional[str] = Form(None),
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Snapshot the current state rules under a version label"""
+    compliance_service = ComplianceService()
+    rule_set = compliance_service.publish_rule_set(db, version)
+    return {"version": rule_set.version, "created_at": rule_set.created_at}
+
+@app.post("/api/admin/compliance/revalidate")
+async def start_revalidation(
+    background_tasks: BackgroundTasks,
+    from_version: str = Form(...),
+    to_version: str = Form(...),
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Re-validate every will in jurisdictions changed between two rule-set versions (resumes if re-posted)"""
+    revalidation_service = FleetRevalidationService()
+    try:
+        checkpoint = revalidation_service.start(db, from_version, to_version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    # Only one run per checkpoint; re-posting while it is live just reports on it
+    owner = revalidation_service.claim(db, checkpoint.id)
+    if owner:
+        background_tasks.add_task(run_revalidation, checkpoint.id, owner)
+    db.refresh(checkpoint)
+    
+    return {
+        "checkpoint_id": checkpoint.id,
+        "jurisdictions": checkpoint.jurisdictions,
+        "status": checkpoint.status
+    }
+
+@app.get("/api/admin/compliance/revalidate/{checkpoint_id}")
+async def get_revalidation_status(
+    checkpoint_id: int,
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """Get progress and throughput of a re-validation run"""
+    checkpoint = db.query(RevalidationCheckpoint).filter(RevalidationCheckpoint.id == checkpoint_id).first()
+    if not checkpoint:
+        raise HTTPException(status_code=404, detail="Revalidation run not found")
+    
+    return FleetRevalidationService().report(checkpoint)
+
+@app.post("/api/admin/artifacts/gc")
+async def collect_artifact_garbage(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_admin)
+):
+    """Remove generated PDFs that no will references and that are past retention"""
+    background_tasks.add_task(run_artifact_gc)
+    return {"message": "Artifact garbage collection started"}
+
+@app.post("/api/admin/wallets/sync")
+async def sweep_wallets(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_admin)
+):
+    """Refresh balances for connected wallets that have gone stale"""
+    background_tasks.add_task(wallet_sync_engine.sweep)
+    return {"message": "Wallet sweep started"}
+
+@app.get("/api/admin/auth/hashing")
+async def get_password_hashing_stats(current_user: User = Depends(get_current_admin)):
+    """Password hashing pool load and how many requests it has shed, plus session revocation checks"""
+    return {**password_hasher.stats(), "session_revocation": session_revocations.stats()}
+
+@app.get("/api/admin/ai/providers")
+async def get_ai_provider_stats(current_user: User = Depends(get_current_admin)):
+    """AI provider health and latency, rate-limit queues, streaming time-to-first-token, cache and coalescing"""
+    return {
+        "providers": get_ai_router().snapshot(),
+        "rate_limits": ai_rate_limiter.stats(),
+        "grief_stream_ttfb": stream_ttfb_summary(),
+        "response_cache": ai_response_cache.stats(),
+        "coalescing": ai_single_flight.stats()
+    }
+
+@app.get("/api/admin/ai/usage")
+async def get_ai_usage(
+    hours: float = 24,
+    current_user: User = Depends(get_current_admin),
+    db: Session = Depends(get_db)
+):
+    """AI calls, tokens, estimated cost and latency per feature, provider and model"""
+    return ai_telemetry.rollups(db, hours=hours)
+
 # Grief Companion Endpoints
 @app.post("/api/grief/session")
 async def create_grief_session(
@@ -624,8 +969,18 @@ async def send_grief_message(
     ai_service = AIService()
     response = ai_service.generate_grief_response(message, session.emotional_state)
     
-    # Update session
-    messages = session.messages or []
+    _append_grief_exchange(session, message, response)
+    db.commit()
+    
+    return {
+        "response": response["content"],
+        "emotional_state": response["emotional_state"],
+        "crisis_detected": response.get("crisis_detected", False)
+    }
+
+def _append_grief_exchange(session: GriefSession, message: str, response: Dict):
+    """Record one user message and the companion's reply on the session"""
+    messages = list(session.messages or [])
     messages.extend([
         {
             "id": len(messages) + 1,
@@ -646,14 +1001,69 @@ async def send_grief_message(
     session.session_length = len(messages)
     session.last_activity = datetime.utcnow()
     session.crisis_detected = response.get("crisis_detected", False)
+
+@app.post("/api/grief/message/stream")
+async def stream_grief_message(
+    session_id: str = Form(...),
+    message: str = Form(...),
+    db: Session = Depends(get_db)
+):
+    """Send message to grief companion and stream the reply as Server-Sent Events"""
+    session = db.query(GriefSession).filter(GriefSession.session_id == session_id).first()
     
-    db.commit()
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
     
-    return {
-        "response": response["content"],
-        "emotional_state": response["emotional_state"],
-        "crisis_detected": response.get("crisis_detected", False)
-    }
+    # Full history: the context manager packs what fits the token budget and summarizes the rest
+    history = [
+        {"role": "user" if item.get("type") == "user" else "assistant", "content": item.get("content", "")}
+        for item in (session.messages or [])
+    ]
+    emotional_state = session.emotional_state
+    received_at = time.perf_counter()
+    
+    def sse(event: str, data: Dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    async def events():
+        ttfb_ms = None
+        stream = MultiAIService().stream_grief_response(message, emotional_state, history,
+                                                        session_id=session_id)
+        async for event in stream:
+            if event["type"] == "token":
+                if ttfb_ms is None:
+                    ttfb_ms = (time.perf_counter() - received_at) * 1000
+                    STREAM_TTFB_MS.append(ttfb_ms)
+                yield sse("token", {"content": event["content"]})
+                continue
+            
+            # Completed text: analysis is done, persist the exchange before closing the stream
+            response = {key: value for key, value in event.items() if key != "type"}
+            stream_db = SessionLocal()
+            try:
+                stream_session = stream_db.query(GriefSession).filter(GriefSession.session_id == session_id).first()
+                _append_grief_exchange(stream_session, message, response)
+                stream_db.commit()
+            finally:
+                stream_db.close()
+            
+            # No token at all when the provider finished with empty text
+            first_token = f"first token after {ttfb_ms:.0f} ms" if ttfb_ms is not None else "no tokens"
+            logger.info(f"Grief stream {session_id}: {first_token} via {response['provider_used']}")
+            yield sse("done", {
+                "response": response["content"],
+                "emotional_state": response["emotional_state"],
+                "crisis_detected": response.get("crisis_detected", False),
+                "recommendations": response.get("recommendations", []),
+                "provider_used": response["provider_used"],
+                "ttfb_ms": round(ttfb_ms, 1) if ttfb_ms is not None else None
+            })
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Health Check
 @app.get("/api/health")
@@ -3,21 +3,26 @@ import os
 import json
 import hashlib
 import uuid
+import tempfile
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Iterator
 from pathlib import Path
 import requests
 from cryptography.fernet import Fernet
 from sqlalchemy.orm import Session
 import logging
 
+from emotion_detector import emotion_detector
+
 logger = logging.getLogger(__name__)
 
 class ComplianceService:
     """Real legal compliance service for all 50 US states"""
     
-    def __init__(self):
-        self.states_data = self._load_states_data()
+    RULES_VERSION = "2025.1"  # Bump whenever states_data changes
+    
+    def __init__(self, states_data: Optional[Dict] = None):
+        self.states_data = states_data if states_data is not None else self._load_states_data()
     
     def _load_states_data(self):
         """Load comprehensive state legal requirements"""
@@ -131,6 +136,31 @@ class ComplianceService:
             raise ValueError(f"State code {state_code} not found")
         return self.states_data[state_code]
     
+    def publish_rule_set(self, db: Session, version: Optional[str] = None):
+        """Snapshot the current rules under a version label (idempotent)"""
+        from models import ComplianceRuleSet
+        
+        version = version or self.RULES_VERSION
+        rule_set = db.query(ComplianceRuleSet).filter(ComplianceRuleSet.version == version).first()
+        if not rule_set:
+            rule_set = ComplianceRuleSet(version=version, rules=self.states_data)
+            db.add(rule_set)
+            db.commit()
+            db.refresh(rule_set)
+        return rule_set
+    
+    @staticmethod
+    def diff_rule_sets(old_rules: Dict, new_rules: Dict) -> List[str]:
+        """Return state codes whose validation-relevant rules differ between two rule sets"""
+        changed = []
+        for code in sorted(set(old_rules) | set(new_rules)):
+            old_state = old_rules.get(code) or {}
+            new_state = new_rules.get(code) or {}
+            if (old_state.get('will_requirements') != new_state.get('will_requirements')
+                    or old_state.get('inheritance') != new_state.get('inheritance')):
+                changed.append(code)
+        return changed
+    
     def validate_will_requirements(self, will_data: Dict, state_code: str) -> Dict:
         """Validate will against state requirements"""
         state = self.get_state_compliance(state_code)
@@ -248,7 +278,9 @@ class BlockchainService:
         self.network = "ethereum"  # Could be configurable
     
     def notarize_document(self, file_path: str, user_id: int, db: Session) -> Dict:
-        """Notarize document on blockchain"""
+        """Queue document for notarization; it is anchored asynchronously in the next Merkle batch"""
+        from notarization import NotarizationUnavailableError, get_notarization_pipeline
+        
         try:
             # Read file and generate hash
             with open(file_path, 'rb') as file:
@@ -256,35 +288,19 @@ class BlockchainService:
             
             document_hash = hashlib.sha256(content).hexdigest()
             
-            # Simulate blockchain transaction (in production, use real Web3)
-            transaction_hash = f"0x{hashlib.sha256(f'{document_hash}{datetime.utcnow()}'.encode()).hexdigest()}"
-            block_number = 18000000 + hash(transaction_hash) % 1000000
-            
-            # Store blockchain transaction
-            from models import BlockchainTransaction, BlockchainWallet
-            
-            wallet = db.query(BlockchainWallet).filter(BlockchainWallet.owner_id == user_id).first()
-            if wallet:
-                transaction = BlockchainTransaction(
-                    wallet_id=wallet.id,
-                    transaction_hash=transaction_hash,
-                    transaction_type="notarization",
-                    block_number=block_number,
-                    status="confirmed",
-                    metadata={"document_hash": document_hash}
-                )
-                db.add(transaction)
-                db.commit()
+            # Confirmation later flags every Document/Will row carrying this hash as notarized
+            get_notarization_pipeline().submit(document_hash)
             
             return {
                 "success": True,
-                "transaction_hash": transaction_hash,
-                "block_number": block_number,
+                "status": "pending",
                 "document_hash": document_hash,
-                "timestamp": datetime.utcnow().isoformat(),
-                "gas_used": "21000"
+                "transaction_hash": None,
+                "timestamp": datetime.utcnow().isoformat()
             }
             
+        except NotarizationUnavailableError:
+            raise  # Nothing was accepted; the caller reports it as temporarily unavailable
         except Exception as e:
             logger.error(f"Blockchain notarization failed: {str(e)}")
             return {
@@ -292,158 +308,159 @@ class BlockchainService:
                 "error": str(e)
             }
     
-    def verify_document(self, document_hash: str) -> Dict:
-        """Verify document on blockchain"""
-        # In production, this would query the actual blockchain
-        return {
-            "is_verified": True,
-            "timestamp": datetime.utcnow() - timedelta(days=1),
-            "block_number": 18000000,
-            "transaction_hash": f"0x{document_hash[:64]}"
-        }
+    def verify_document(self, document_hash: str, db: Session = None) -> Dict:
+        """Verify document by recomputing its Merkle root from the stored proof"""
+        return self.verify_documents([document_hash], db)[0]
+    
+    def verify_documents(self, document_hashes: List[str], db: Session = None) -> List[Dict]:
+        """Verify many documents with one indexed lookup per 500 hashes"""
+        from models import NotarizationBatch, DocumentNotarization, SessionLocal
+        from notarization import compute_merkle_root, get_notarization_pipeline
+        
+        owns_session = db is None
+        if owns_session:
+            db = SessionLocal()
+        try:
+            records = {}
+            unique_hashes = list(dict.fromkeys(document_hashes))
+            for start in range(0, len(unique_hashes), 500):
+                chunk = unique_hashes[start:start + 500]
+                rows = db.query(DocumentNotarization, NotarizationBatch).join(
+                    NotarizationBatch, NotarizationBatch.id == DocumentNotarization.batch_id
+                ).filter(DocumentNotarization.document_hash.in_(chunk)).all()
+                for notarization, batch in rows:
+                    records[notarization.document_hash] = (notarization, batch)
+            
+            pipeline = get_notarization_pipeline()
+            results = []
+            for document_hash in document_hashes:
+                record = records.get(document_hash)
+                if not record:
+                    results.append({"document_hash": document_hash, "is_verified": False})
+                    continue
+                
+                notarization, batch = record
+                root = compute_merkle_root(document_hash, notarization.proof)
+                is_verified = (batch.status == "confirmed" and root == batch.merkle_root
+                               and pipeline.anchored_root(batch.transaction_hash) == root)
+                results.append({
+                    "document_hash": document_hash,
+                    "is_verified": is_verified,
+                    "status": batch.status,
+                    "merkle_root": root,
+                    "proof": notarization.proof,
+                    "timestamp": batch.anchored_at,
+                    "block_number": batch.block_number,
+                    "transaction_hash": batch.transaction_hash
+                })
+            return results
+        finally:
+            if owns_session:
+                db.close()
     
-    def sync_wallet_assets(self, user_id: int, db: Session):
-        """Sync wallet assets from blockchain"""
-        from models import BlockchainWallet, DigitalAsset
+    async def sync_wallet_assets(self, user_id: int, db: Session) -> Dict:
+        """Sync wallet assets from blockchain (only changed rows are written)"""
+        from models import BlockchainWallet
+        from wallet_sync import wallet_sync_engine
         
         wallet = db.query(BlockchainWallet).filter(BlockchainWallet.owner_id == user_id).first()
         if not wallet:
-            return
-        
-        # Simulate fetching assets (in production, use real Web3 APIs)
-        mock_assets = [
-            {
-                "symbol": "ETH",
-                "name": "Ethereum",
-                "asset_type": "cryptocurrency",
-                "balance": 2.45,
-                "usd_value": 5890.25
-            },
-            {
-                "symbol": "BTC",
-                "name": "Bitcoin",
-                "asset_type": "cryptocurrency",
-                "balance": 0.125,
-                "usd_value": 5437.50
-            }
-        ]
-        
-        # Clear existing assets
-        db.query(DigitalAsset).filter(DigitalAsset.wallet_id == wallet.id).delete()
+            return {}
         
-        # Add new assets
-        for asset_data in mock_assets:
-            asset = DigitalAsset(
-                wallet_id=wallet.id,
-                **asset_data,
-                last_updated=datetime.utcnow()
-            )
-            db.add(asset)
-        
-        wallet.last_sync = datetime.utcnow()
-        db.commit()
+        return await wallet_sync_engine.sync_wallets([wallet.id])
+
+# Previews larger than this spill from memory to a temporary file
+PREVIEW_SPOOL_MAX_BYTES = int(os.getenv("PREVIEW_SPOOL_MAX_BYTES", str(20 * 1024 * 1024)))
 
 class WillGenerationService:
     """PDF will generation service"""
     
+    _dirs_ready = False
+    
     def __init__(self):
         self.template_dir = Path("templates")
         self.output_dir = Path("uploads/generated")
-        self.template_dir.mkdir(exist_ok=True)
-        self.output_dir.mkdir(exist_ok=True)
+        if not WillGenerationService._dirs_ready:
+            self.template_dir.mkdir(exist_ok=True)
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            WillGenerationService._dirs_ready = True
     
-    def generate_will_pdf(self, will_obj, user) -> str:
-        """Generate PDF will document"""
-        from reportlab.lib.pagesizes import letter
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-        from reportlab.lib.styles import getSampleStyleSheet
-        from reportlab.lib.units import inch
+    def generate_will_pdf(self, will_obj, user, db: Session = None) -> str:
+        """Generate PDF will document (reused from the artifact cache when a session is given)"""
+        from will_templates import get_will_template
+        
+        if db is not None:
+            from artifact_cache import WillArtifactCache
+            pdf_path, _ = WillArtifactCache(self.output_dir).get_or_render(db, will_obj, user)
+            return pdf_path
         
         # Generate filename
         filename = f"will_{user.id}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.pdf"
         file_path = self.output_dir / filename
         
-        # Create PDF document
-        doc = SimpleDocTemplate(str(file_path), pagesize=letter)
-        styles = getSampleStyleSheet()
-        story = []
-        
-        # Title
-        title = Paragraph("LAST WILL AND TESTAMENT", styles['Title'])
-        story.append(title)
-        story.append(Spacer(1, 12))
-        
-        # User information
-        will_content = json.loads(will_obj.content)
-        personal_info = will_content.get('personal_info', {})
-        
-        story.append(Paragraph(f"I, <b>{personal_info.get('full_name', user.full_name)}</b>, "
-                              f"of {user.address or 'address on file'}, being of sound mind and memory, "
-                              "do hereby make, publish, and declare this to be my Last Will and Testament.",
-                              styles['Normal']))
-        story.append(Spacer(1, 12))
-        
-        # Revocation clause
-        story.append(Paragraph("I hereby revoke all former wills and codicils made by me.", styles['Normal']))
-        story.append(Spacer(1, 12))
-        
-        # Beneficiaries section
-        beneficiaries = will_content.get('beneficiaries', [])
-        if beneficiaries:
-            story.append(Paragraph("ARTICLE I - BENEFICIARIES", styles['Heading2']))
-            for i, beneficiary in enumerate(beneficiaries, 1):
-                story.append(Paragraph(f"{i}. I give, devise, and bequeath to "
-                                     f"{beneficiary.get('name', 'Unnamed Beneficiary')} "
-                                     f"({beneficiary.get('relationship', 'relationship')}) "
-                                     f"{beneficiary.get('percentage', 0)}% of my estate.",
-                                     styles['Normal']))
-            story.append(Spacer(1, 12))
-        
-        # Executor section
-        story.append(Paragraph("ARTICLE II - EXECUTOR", styles['Heading2']))
-        story.append(Paragraph("I hereby nominate and appoint [EXECUTOR NAME] as the Executor of this Will.",
-                              styles['Normal']))
-        story.append(Spacer(1, 12))
-        
-        # Digital assets clause
-        story.append(Paragraph("ARTICLE III - DIGITAL ASSETS", styles['Heading2']))
-        story.append(Paragraph("I authorize my Executor to access, manage, and distribute my digital assets "
-                              "including but not limited to cryptocurrencies, NFTs, online accounts, and "
-                              "digital files as specified in my digital asset inventory.",
-                              styles['Normal']))
-        story.append(Spacer(1, 12))
-        
-        # Signature section
-        story.append(Paragraph("IN WITNESS WHEREOF, I have hereunto set my hand this _____ day of "
-                              f"_____________, {datetime.now().year}.",
-                              styles['Normal']))
-        story.append(Spacer(1, 24))
-        story.append(Paragraph("_" * 40, styles['Normal']))
-        story.append(Paragraph(f"{user.full_name}, Testator", styles['Normal']))
-        story.append(Spacer(1, 24))
-        
-        # Witness section
-        story.append(Paragraph("WITNESSES:", styles['Heading3']))
-        story.append(Paragraph("The foregoing instrument was signed by the above-named Testator in our presence, "
-                              "and we, at the Testator's request and in the Testator's presence, and in the "
-                              "presence of each other, have subscribed our names as witnesses.",
-                              styles['Normal']))
-        story.append(Spacer(1, 12))
-        
-        for i in range(2):  # Two witnesses
-            story.append(Paragraph(f"Witness {i+1}:", styles['Normal']))
-            story.append(Spacer(1, 6))
-            story.append(Paragraph("_" * 40 + " Date: _" * 15, styles['Normal']))
-            story.append(Paragraph("Signature", styles['Normal']))
-            story.append(Spacer(1, 6))
-            story.append(Paragraph("_" * 40, styles['Normal']))
-            story.append(Paragraph("Print Name", styles['Normal']))
-            story.append(Spacer(1, 12))
-        
-        # Build PDF
-        doc.build(story)
+        template = get_will_template(will_obj.jurisdiction or user.jurisdiction)
+        template.render(will_obj, user, str(file_path))
         
         return str(file_path)
+    
+    def render_will_stream(self, will_obj, user, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        """Render into a spooled in-memory buffer and return an iterator over its bytes (no file written)"""
+        from will_templates import get_will_template
+        
+        buffer = tempfile.SpooledTemporaryFile(max_size=PREVIEW_SPOOL_MAX_BYTES)
+        try:
+            get_will_template(will_obj.jurisdiction or user.jurisdiction).render(will_obj, user, buffer)
+            buffer.seek(0)
+        except Exception:
+            buffer.close()
+            raise
+        
+        def iterate():
+            with buffer:
+                while True:
+                    chunk = buffer.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+        
+        return iterate()
+    
+    def generate_final_will(self, will_obj, user, db: Session, blockchain_enabled: bool = False) -> Dict:
+        """Render the will, optionally notarize it, and mark the will complete"""
+        pdf_path = self.generate_will_pdf(will_obj, user, db)
+        
+        # Blockchain notarization if enabled
+        document_hash = None
+        if blockchain_enabled:
+            with open(pdf_path, 'rb') as pdf_file:
+                document_hash = hashlib.sha256(pdf_file.read()).hexdigest()
+            
+            # Identical content is already anchored (or on its way); sending it again proves nothing new
+            if document_hash not in (will_obj.blockchain_hash, will_obj.pending_blockchain_hash):
+                result = BlockchainService().notarize_document(pdf_path, user.id, db)
+                if result["success"]:
+                    if will_obj.is_notarized:
+                        # Keep the published proof until the new anchor confirms and replaces it
+                        will_obj.pending_blockchain_hash = result["document_hash"]
+                    else:
+                        # is_notarized and the transaction are filled in once the batch anchor confirms
+                        will_obj.blockchain_hash = result["document_hash"]
+                        will_obj.blockchain_transaction = None
+        
+        will_obj.status = "complete"
+        will_obj.completion_percentage = 100.0
+        db.commit()
+        
+        notarization_pending = bool(will_obj.pending_blockchain_hash or
+                                    (will_obj.blockchain_hash and not will_obj.is_notarized))
+        return {
+            "pdf_path": pdf_path,
+            "download_url": "/api/will/pdf",
+            "blockchain_notarized": will_obj.is_notarized,
+            "notarization_status": ("pending" if notarization_pending
+                                    else "confirmed" if will_obj.is_notarized else None),
+            "document_hash": document_hash
+        }
 
 class AIService:
     """AI service for grief companion and other AI features"""
@@ -455,26 +472,10 @@ class AIService:
     def generate_grief_response(self, user_message: str, current_emotional_state: str = None) -> Dict:
         """Generate AI response for grief companion"""
         
-        # Emotional keyword detection
-        message_lower = user_message.lower()
-        
-        # Detect emotional state
-        if any(word in message_lower for word in ['sad', 'crying', 'miss', 'lonely', 'hurt']):
-            emotional_state = 'sad'
-        elif any(word in message_lower for word in ['angry', 'mad', 'furious', 'unfair']):
-            emotional_state = 'angry'
-        elif any(word in message_lower for word in ['worried', 'scared', 'anxious', 'afraid']):
-            emotional_state = 'anxious'
-        elif any(word in message_lower for word in ['better', 'healing', 'hope', 'grateful']):
-            emotional_state = 'hopeful'
-        elif any(word in message_lower for word in ['remember', 'memory', 'used to']):
-            emotional_state = 'reflective'
-        else:
-            emotional_state = current_emotional_state or 'neutral'
-        
-        # Crisis detection
-        crisis_keywords = ['suicide', 'kill myself', 'end it all', 'not worth living', 'better off dead']
-        crisis_detected = any(keyword in message_lower for keyword in crisis_keywords)
+        # Emotional keyword and crisis detection in one pass
+        detection = emotion_detector.scan(user_message)
+        emotional_state = detection["states"][0] if detection["states"] else (current_emotional_state or 'neutral')
+        crisis_detected = detection["crisis_detected"]
         
         # Generate contextual response
         responses_by_state = {
@@ -498,6 +499,16 @@ class AIService:
                 "It takes courage to speak of hope while grieving. You're not betraying your loved one by having moments of light - you're honoring them by continuing to live and grow. How does it feel to notice this shift?",
                 "Hope can feel complicated in grief - like you're being disloyal by feeling better. But hope is actually a gift they would want for you. Your healing honors their memory."
             ],
+            'guilty': [
+                "So many people who grieve carry thoughts of 'I should have' or 'if only'. Guilt is often love looking for somewhere to go. Hindsight shows us things we could not have known then. What is the thought that keeps coming back to you?",
+                "It sounds like you're holding yourself responsible for something. Please be as gentle with yourself as you would be with a friend in your place. You did what you could with what you knew at the time.",
+                "Regret is one of the heaviest parts of grief. It doesn't mean you failed them - it shows how much they mattered to you. Would it help to talk about what you wish had been different?"
+            ],
+            'numb': [
+                "Feeling numb or empty is a very common response to loss. It is often the mind's way of protecting us when the pain is too much to take in all at once. It doesn't mean you don't care.",
+                "Sometimes grief shows up as nothing at all - a flat, disconnected feeling. That is a normal part of grieving, and the feelings usually return in their own time. How have your days been feeling lately?",
+                "It's okay not to feel much right now. Numbness can be a pause that helps you get through the hardest days. Be patient with yourself; there is no wrong way to move through this."
+            ],
             'reflective': [
                 "Memories are precious gifts that no one can take away from you. Each memory is a thread in the tapestry of your relationship that continues even after death. Would you like to share a favorite memory?",
                 "Thank you for sharing this memory. These stories keep your loved one's spirit alive and present. Memories can be both comforting and painful - they remind us of what we had and what we've lost.",
@@ -0,0 +1,153 @@
+# Offline BM25 Retrieval over State Statute Passages (memory-mapped postings)
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STATUTE_CORPUS_PATH = os.getenv("STATUTE_CORPUS_PATH", str(Path(__file__).parent / "data" / "statutes.json"))
+# Derived from the corpus and rebuilt on demand; beside the module so it never depends on the working directory
+STATUTE_INDEX_DIR = os.getenv("STATUTE_INDEX_DIR", str(Path(__file__).parent / "cache" / "statute_index"))
+STATUTE_TOP_K = int(os.getenv("STATUTE_TOP_K", "4"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Passages filed under this code apply in every state
+FEDERAL_STATE = "US"
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "if", "in", "is", "it", "its",
+    "may", "must", "no", "not", "of", "on", "or", "other", "shall", "such", "than", "that", "the", "their", "they",
+    "this", "to", "under", "was", "which", "who", "will", "with", "without"
+}
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case word tokens without stopwords, folded to a crude singular ("wills" -> "will")"""
+    tokens = []
+    for token in _TOKEN.findall(text.lower()):
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        if token not in _STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+class StatuteIndex:
+    """BM25 over the statute corpus, stored term-major (CSC) so a query touches only its terms' postings.
+
+    The postings arrays are .npy files opened with mmap_mode="r": worker processes share the page cache
+    instead of each holding a copy, and the index is rebuilt only when the corpus file changes."""
+
+    def __init__(self, corpus_path: str = STATUTE_CORPUS_PATH, index_dir: str = STATUTE_INDEX_DIR):
+        self.corpus_path = Path(corpus_path)
+        self.index_dir = Path(index_dir)
+        self.version: Optional[str] = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            corpus_bytes = self.corpus_path.read_bytes()
+            version = hashlib.sha256(corpus_bytes).hexdigest()[:16]
+            meta_path = self.index_dir / "meta.json"
+            meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+            if meta.get("version") != version:
+                self._build(json.loads(corpus_bytes), version)
+                meta = json.loads(meta_path.read_text())
+
+            self.vocabulary: Dict[str, int] = meta["vocabulary"]
+            self.passages: List[Dict] = meta["passages"]
+            self.states = np.array([passage["state"] for passage in self.passages])
+            self.indptr = np.load(self.index_dir / "indptr.npy", mmap_mode="r")
+            self.doc_ids = np.load(self.index_dir / "doc_ids.npy", mmap_mode="r")
+            self.weights = np.load(self.index_dir / "weights.npy", mmap_mode="r")
+            self.version = version
+            self._loaded = True
+
+    def _build(self, passages: List[Dict], version: str):
+        """Precompute each (term, passage) BM25 weight so scoring a query is a sum of postings"""
+        documents = [tokenize(f"{passage['title']} {passage['text']}") for passage in passages]
+        lengths = np.array([len(tokens) for tokens in documents], dtype=np.float32)
+        average_length = float(lengths.mean()) if len(documents) else 1.0
+
+        postings: Dict[str, Dict[int, int]] = {}
+        for doc_id, tokens in enumerate(documents):
+            for token in tokens:
+                counts = postings.setdefault(token, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+
+        vocabulary = {term: term_id for term_id, term in enumerate(sorted(postings))}
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        doc_ids, weights = [], []
+        for term, term_id in vocabulary.items():
+            counts = postings[term]
+            idf = np.log(1 + (len(documents) - len(counts) + 0.5) / (len(counts) + 0.5))
+            for doc_id, tf in sorted(counts.items()):
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_id] / average_length)
+                doc_ids.append(doc_id)
+                weights.append(idf * tf * (BM25_K1 + 1) / (tf + norm))
+            indptr[term_id + 1] = len(doc_ids)
+
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self._replace("indptr.npy", lambda file: np.save(file, indptr))
+        self._replace("doc_ids.npy", lambda file: np.save(file, np.array(doc_ids, dtype=np.int32)))
+        self._replace("weights.npy", lambda file: np.save(file, np.array(weights, dtype=np.float32)))
+        # Written last: a crash mid-build leaves a stale version and triggers a rebuild next time
+        meta = json.dumps({
+            "version": version,
+            "vocabulary": vocabulary,
+            "passages": [{key: passage[key] for key in ("id", "state", "topic", "citation", "title", "text")
+                          if key in passage}
+                         for passage in passages]
+        })
+        self._replace("meta.json", lambda file: file.write(meta.encode()))
+        logger.info(f"Built statute index {version}: {len(passages)} passages, {len(vocabulary)} terms")
+
+    def _replace(self, name: str, write):
+        # Atomic per file, so a worker building concurrently never maps a half-written array
+        temp = self.index_dir / f".{name}.{os.getpid()}.tmp"
+        with open(temp, "wb") as file:
+            write(file)
+        os.replace(temp, self.index_dir / name)
+
+    def search(self, query: str, state_code: str, top_k: int = STATUTE_TOP_K,
+               pinned_topics: Iterable[str] = ()) -> List[Dict]:
+        """Best-scoring passages for the state (and federal ones), highest score first.
+
+        The state's passages filed under pinned_topics (e.g. "execution") come first whatever the query,
+        followed by up to top_k ranked ones."""
+        self._ensure_loaded()
+        pinned = [doc_id for doc_id, passage in enumerate(self.passages)
+                  if passage.get("topic") in pinned_topics and passage["state"] == state_code.upper()]
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for token in set(tokenize(query)):
+            term_id = self.vocabulary.get(token)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            scores[self.doc_ids[start:end]] += self.weights[start:end]  # Doc ids are unique within a posting
+
+        scores[(self.states != state_code.upper()) & (self.states != FEDERAL_STATE)] = 0
+        pinned_scores = scores[pinned].copy()
+        scores[pinned] = 0
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        results = [(doc_id, score) for doc_id, score in zip(pinned, pinned_scores)]
+        results += [(doc_id, scores[doc_id]) for doc_id in ranked]
+        return [{**self.passages[doc_id], "score": round(float(score), 3)} for doc_id, score in results]
+
+# Process-wide index, loaded on first search
+statute_index = StatuteIndex()
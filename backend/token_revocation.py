@@ -0,0 +1,152 @@
+# In-Memory Revocation Filter for Login Sessions (Bloom filter backed by the refresh_tokens table)
+import os
+import math
+import time
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import RefreshToken, SessionLocal
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", "5"))  # Seconds between table polls
+REVOCATION_FILTER_CAPACITY = int(os.getenv("REVOCATION_FILTER_CAPACITY", "100000"))
+REVOCATION_FALSE_POSITIVE_RATE = 0.001
+REVOCATION_REBUILD_INTERVAL = 3600  # Seconds; drops sessions whose access tokens have all expired
+REVOCATION_CURSOR_OVERLAP = 2  # Seconds re-read each poll, for revocations committed just after it read the clock
+
+class BloomFilter:
+    """Fixed-size bit array with k positions per item from double hashing one BLAKE2b digest"""
+
+    def __init__(self, capacity: int = REVOCATION_FILTER_CAPACITY, error_rate: float = REVOCATION_FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * step) % self.size for i in range(self.hashes))
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+class SessionRevocationList:
+    """Answers "is this session revoked?" for every authenticated request without touching the database.
+
+    Revoked session ids go into a Bloom filter: a miss is a definite "not revoked", and the rare hit is
+    confirmed against the table (false positives run at REVOCATION_FALSE_POSITIVE_RATE). Each worker
+    polls the table for revocations made by other workers, and rebuilds the filter hourly from the
+    sessions whose access tokens can still be live."""
+
+    def __init__(self, access_token_lifetime: timedelta, refresh_token_lifetime: Optional[timedelta] = None):
+        self.window = access_token_lifetime
+        # Local revocations are carried across rebuilds for this long, then left to the table
+        self.retention = (refresh_token_lifetime or access_token_lifetime).total_seconds()
+        self._filter = BloomFilter()
+        # sid -> (revoked, checked_at) for filter hits; checked_at is the revocation time for local revocations
+        self._confirmed: Dict[str, Tuple[bool, float]] = {}
+        self._cursor: Optional[datetime] = None  # Database time of the last poll
+        self._built_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {"checks": 0, "filter_hits": 0, "false_positives": 0}
+
+    def revoke(self, session_ids: Iterable[str]):
+        """Local revocations take effect at once; other workers see them at their next poll"""
+        for session_id in session_ids:
+            self._filter.add(session_id)
+            self._confirmed[session_id] = (True, time.monotonic())
+
+    def is_revoked(self, session_id: str, db: Session) -> bool:
+        self.metrics["checks"] += 1
+        if session_id not in self._filter:
+            return False
+
+        self.metrics["filter_hits"] += 1
+        confirmed = self._confirmed.get(session_id)
+        if confirmed and (confirmed[0] or time.monotonic() - confirmed[1] < REVOCATION_SYNC_INTERVAL):
+            return confirmed[0]
+        revoked = db.query(RefreshToken.id).filter(
+            RefreshToken.session_id == session_id, RefreshToken.revoked_at.isnot(None)
+        ).first() is not None
+        if not revoked:
+            self.metrics["false_positives"] += 1
+        self._confirmed[session_id] = (revoked, time.monotonic())
+        return revoked
+
+    def sync(self):
+        """Add sessions revoked since the last poll; rebuild from scratch when the filter is stale or full"""
+        rebuild = (time.monotonic() - self._built_at > REVOCATION_REBUILD_INTERVAL
+                   or self._filter.count >= self._filter.capacity)
+
+        db = SessionLocal()
+        try:
+            # revoked_at is written with database time, so the cursor is database time too: a worker with a
+            # skewed clock can neither skip revocations nor see them early
+            now = db.query(func.now()).scalar()
+            if rebuild or self._cursor is None:
+                since = now - self.window
+            else:
+                since = self._cursor - timedelta(seconds=REVOCATION_CURSOR_OVERLAP)
+            rows = db.query(RefreshToken.session_id).filter(RefreshToken.revoked_at >= since).distinct().all()
+        finally:
+            db.close()
+
+        if rebuild:
+            # Local revocations committed after the query above must survive the swap; ones older than the
+            # retention are dropped so the carried set cannot grow without bound
+            cutoff = time.monotonic() - self.retention
+            recent = {session_id: revoked_at for session_id, (revoked, revoked_at) in list(self._confirmed.items())
+                      if revoked and revoked_at >= cutoff}
+            fresh = BloomFilter()
+            for session_id in [row[0] for row in rows] + list(recent):
+                fresh.add(session_id)
+            self._filter = fresh
+            self._confirmed = {session_id: (True, revoked_at) for session_id, revoked_at in recent.items()}
+            self._built_at = time.monotonic()
+        else:
+            for (session_id,) in rows:
+                if session_id not in self._filter:  # The overlap re-reads recent rows; count each session once
+                    self._filter.add(session_id)
+        self._cursor = now
+
+    async def start(self):
+        if self._task is None:
+            await asyncio.to_thread(self.sync)
+            self._task = asyncio.create_task(self._sync_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(REVOCATION_SYNC_INTERVAL)
+            try:
+                await asyncio.to_thread(self.sync)
+            except Exception as e:
+                logger.error(f"Session revocation sync failed: {str(e)}")
+
+    def stats(self) -> Dict:
+        return {
+            **self.metrics,
+            "revoked_sessions": self._filter.count,
+            "filter_bytes": len(self._filter.bits),
+            "hash_functions": self._filter.hashes
+        }
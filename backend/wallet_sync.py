@@ -0,0 +1,241 @@
+# Incremental Wallet Asset Synchronization for NextEra Estate
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import httpx
+from sqlalchemy import insert
+
+from models import BlockchainWallet, DigitalAsset, SessionLocal
+from price_oracle import price_oracle
+
+logger = logging.getLogger(__name__)
+
+WALLET_SYNC_CONCURRENCY = int(os.getenv("WALLET_SYNC_CONCURRENCY", "10"))  # Concurrent RPC requests
+WALLET_SYNC_TIMEOUT = float(os.getenv("WALLET_SYNC_TIMEOUT", "10"))
+WALLET_RPC_BATCH_SIZE = int(os.getenv("WALLET_RPC_BATCH_SIZE", "50"))  # eth_getBalance calls per JSON-RPC batch
+WALLET_STALE_AFTER = int(os.getenv("WALLET_STALE_AFTER", "900"))  # Seconds
+WALLET_SWEEP_BATCH_SIZE = int(os.getenv("WALLET_SWEEP_BATCH_SIZE", "500"))
+
+# Native asset per supported network; wallets on other networks are left untouched
+NETWORKS = {
+    "ethereum": {"rpc_url": os.getenv("ETHEREUM_RPC_URL"), "symbol": "ETH", "name": "Ethereum"},
+    "polygon": {"rpc_url": os.getenv("POLYGON_RPC_URL"), "symbol": "MATIC", "name": "Polygon"},
+}
+
+WEI_PER_ETHER = 10 ** 18
+
+class WalletSyncEngine:
+    """Fetches balances for many wallets over pooled async HTTP and writes only what changed"""
+
+    def __init__(self, concurrency: int = WALLET_SYNC_CONCURRENCY, timeout: float = WALLET_SYNC_TIMEOUT,
+                 rpc_batch_size: int = WALLET_RPC_BATCH_SIZE, networks: Dict = None):
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.rpc_batch_size = rpc_batch_size
+        self.networks = networks or NETWORKS
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+
+    def _ensure_client(self):
+        # The client and semaphore are bound to the event loop that first uses them
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _rpc_batch(self, rpc_url: str, addresses: List[str]) -> Dict[str, Optional[int]]:
+        """One JSON-RPC batch of eth_getBalance calls; returns wei per address (None on error)"""
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": "eth_getBalance", "params": [address, "latest"]}
+            for i, address in enumerate(addresses)
+        ]
+        async with self._semaphore:
+            response = await self._client.post(rpc_url, json=payload)
+        response.raise_for_status()
+        replies = response.json()
+        if isinstance(replies, dict):
+            # Some nodes answer a rejected batch with a single error object
+            raise ValueError(replies.get("error", {}).get("message", "Invalid JSON-RPC batch response"))
+
+        balances = {address: None for address in addresses}
+        for reply in replies:
+            if "result" in reply:
+                balances[addresses[reply["id"]]] = int(reply["result"], 16)
+        return balances
+
+    async def fetch_balances(self, wallets: List[Dict]) -> Dict[int, Optional[int]]:
+        """Native balance in wei per wallet id; batched per network and fetched concurrently"""
+        self._ensure_client()
+        by_network: Dict[str, List[Dict]] = {}
+        for wallet in wallets:
+            by_network.setdefault(wallet["network"], []).append(wallet)
+
+        requests = []
+        for network, members in by_network.items():
+            rpc_url = self.networks[network]["rpc_url"]
+            addresses = list(dict.fromkeys(wallet["wallet_address"] for wallet in members))
+            for start in range(0, len(addresses), self.rpc_batch_size):
+                requests.append((network, self._rpc_batch(rpc_url, addresses[start:start + self.rpc_batch_size])))
+
+        replies = await asyncio.gather(*(request for _, request in requests), return_exceptions=True)
+        by_address: Dict[tuple, Optional[int]] = {}
+        for (network, _), reply in zip(requests, replies):
+            if isinstance(reply, Exception):
+                logger.warning(f"Balance fetch on {network} failed: {str(reply)}")
+                continue
+            for address, wei in reply.items():
+                by_address[(network, address)] = wei
+
+        return {wallet["id"]: by_address.get((wallet["network"], wallet["wallet_address"])) for wallet in wallets}
+
+    async def sync_wallets(self, wallet_ids: List[int]) -> Dict:
+        """Refresh the given wallets; returns counts of inserted, updated, unchanged and failed wallets"""
+        wallets = await asyncio.to_thread(self._load_wallets, wallet_ids)
+        supported = [wallet for wallet in wallets if wallet["network"] in self.networks
+                     and self.networks[wallet["network"]]["rpc_url"]]
+        summary = {"wallets": len(wallet_ids), "unsupported": len(wallets) - len(supported),
+                   "inserted": 0, "updated": 0, "unchanged": 0, "failed": 0}
+        if not supported:
+            return summary
+
+        balances = await self.fetch_balances(supported)
+        changes = await asyncio.to_thread(self._apply, supported, balances)
+        for key, value in changes.items():
+            summary[key] += value
+
+        # Quotes are cached, so a sweep over many wallets fetches each symbol once per TTL
+        synced_ids = [wallet["id"] for wallet in supported if balances.get(wallet["id"]) is not None]
+        if synced_ids:
+            summary["revalued"] = await price_oracle.revalue_assets(synced_ids)
+        return summary
+
+    async def sweep(self, stale_after: int = WALLET_STALE_AFTER, batch_size: int = WALLET_SWEEP_BATCH_SIZE) -> Dict:
+        """Refresh connected wallets not synced within stale_after seconds, oldest first"""
+        stale_ids = await asyncio.to_thread(self._stale_wallet_ids, stale_after)
+        totals = {"wallets": 0, "unsupported": 0, "inserted": 0, "updated": 0, "unchanged": 0, "failed": 0,
+                  "revalued": 0}
+        for start in range(0, len(stale_ids), batch_size):
+            summary = await self.sync_wallets(stale_ids[start:start + batch_size])
+            for key, value in summary.items():
+                totals[key] += value
+        logger.info(f"Wallet sweep: {json.dumps(totals)}")
+        return totals
+
+    @staticmethod
+    def _load_wallets(wallet_ids: List[int]) -> List[Dict]:
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                BlockchainWallet.id, BlockchainWallet.wallet_address, BlockchainWallet.network
+            ).filter(BlockchainWallet.id.in_(wallet_ids)).all()
+            return [{"id": row.id, "wallet_address": row.wallet_address, "network": (row.network or "").lower()}
+                    for row in rows]
+        finally:
+            db.close()
+
+    @staticmethod
+    def _stale_wallet_ids(stale_after: int) -> List[int]:
+        cutoff = datetime.utcnow() - timedelta(seconds=stale_after)
+        db = SessionLocal()
+        try:
+            rows = db.query(BlockchainWallet.id).filter(
+                BlockchainWallet.is_connected == True,  # noqa: E712
+                (BlockchainWallet.last_sync.is_(None)) | (BlockchainWallet.last_sync < cutoff)
+            ).order_by(BlockchainWallet.last_sync.asc().nullsfirst(), BlockchainWallet.id).all()
+            return [row.id for row in rows]
+        finally:
+            db.close()
+
+    def _apply(self, wallets: List[Dict], balances: Dict[int, Optional[int]]) -> Dict:
+        """Diff fetched balances against stored native-asset rows and write only the differences"""
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0, "failed": 0}
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            wallet_ids = [wallet["id"] for wallet in wallets]
+            symbols = {network["symbol"] for network in self.networks.values()}
+            existing = {
+                (asset.wallet_id, asset.symbol): asset
+                for asset in db.query(DigitalAsset).filter(
+                    DigitalAsset.wallet_id.in_(wallet_ids),
+                    DigitalAsset.asset_type == "cryptocurrency",
+                    DigitalAsset.contract_address.is_(None),
+                    DigitalAsset.symbol.in_(symbols)
+                )
+            }
+
+            new_rows = []
+            synced_ids = []
+            balance_by_wallet = {}
+            for wallet in wallets:
+                wei = balances.get(wallet["id"])
+                if wei is None:
+                    counts["failed"] += 1
+                    continue
+                synced_ids.append(wallet["id"])
+                network = self.networks[wallet["network"]]
+                balance = wei / WEI_PER_ETHER
+                balance_by_wallet[wallet["id"]] = balance
+
+                asset = existing.get((wallet["id"], network["symbol"]))
+                if asset is None:
+                    new_rows.append({
+                        "wallet_id": wallet["id"],
+                        "asset_type": "cryptocurrency",
+                        "symbol": network["symbol"],
+                        "name": network["name"],
+                        "balance": balance,
+                        "last_updated": now
+                    })
+                    counts["inserted"] += 1
+                elif asset.balance != balance:
+                    asset.balance = balance
+                    asset.last_updated = now
+                    counts["updated"] += 1
+                else:
+                    counts["unchanged"] += 1
+
+            if new_rows:
+                db.execute(insert(DigitalAsset), new_rows)
+            if synced_ids:
+                for wallet in db.query(BlockchainWallet).filter(BlockchainWallet.id.in_(synced_ids)):
+                    if wallet.balance != balance_by_wallet[wallet.id]:
+                        wallet.balance = balance_by_wallet[wallet.id]
+                    wallet.last_sync = now
+            db.commit()
+            return counts
+        finally:
+            db.close()
+
+# Process-wide engine; its HTTP connection pool is reused across syncs
+wallet_sync_engine = WalletSyncEngine()
+
+def run_wallet_sweep():
+    """Scheduled job entry point"""
+    async def sweep():
+        engine = WalletSyncEngine()
+        try:
+            return await engine.sweep()
+        finally:
+            await engine.aclose()
+            await price_oracle.aclose()
+
+    return asyncio.run(sweep())
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(run_wallet_sweep(), indent=2))
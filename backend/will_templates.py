@@ -0,0 +1,156 @@
+# Will PDF Templates for NextEra Estate
+import copy
+import json
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Type
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+
+# Bump whenever the rendered output changes; cached artifacts are keyed on it
+TEMPLATE_VERSION = "2"
+
+@lru_cache(maxsize=1)
+def get_stylesheet():
+    """ReportLab sample stylesheet, built once per process"""
+    return getSampleStyleSheet()
+
+class WillTemplate:
+    """Standard will layout; static clauses are built once and reused for every render"""
+
+    def __init__(self, state_code: str, state_rules: Dict = None):
+        self.state_code = state_code
+        requirements = (state_rules or {}).get('will_requirements', {})
+        self.witnesses_required = requirements.get('witnesses_required', 2)
+        self.styles = get_stylesheet()
+
+        self._title = [Paragraph("LAST WILL AND TESTAMENT", self.styles['Title']), Spacer(1, 12)]
+        self._revocation = [
+            Paragraph("I hereby revoke all former wills and codicils made by me.", self.styles['Normal']),
+            Spacer(1, 12)
+        ]
+        self._beneficiaries_heading = [Paragraph("ARTICLE I - BENEFICIARIES", self.styles['Heading2'])]
+        self._executor = [
+            Paragraph("ARTICLE II - EXECUTOR", self.styles['Heading2']),
+            Paragraph("I hereby nominate and appoint [EXECUTOR NAME] as the Executor of this Will.",
+                      self.styles['Normal']),
+            Spacer(1, 12)
+        ]
+        self._digital_assets = [
+            Paragraph("ARTICLE III - DIGITAL ASSETS", self.styles['Heading2']),
+            Paragraph("I authorize my Executor to access, manage, and distribute my digital assets "
+                      "including but not limited to cryptocurrencies, NFTs, online accounts, and "
+                      "digital files as specified in my digital asset inventory.",
+                      self.styles['Normal']),
+            Spacer(1, 12)
+        ]
+        self._witnesses = self._witness_flowables()
+
+    def _witness_flowables(self) -> List:
+        flowables = [
+            Paragraph("WITNESSES:", self.styles['Heading3']),
+            Paragraph("The foregoing instrument was signed by the above-named Testator in our presence, "
+                      "and we, at the Testator's request and in the Testator's presence, and in the "
+                      "presence of each other, have subscribed our names as witnesses.",
+                      self.styles['Normal']),
+            Spacer(1, 12)
+        ]
+        for i in range(self.witnesses_required):
+            flowables.extend([
+                Paragraph(f"Witness {i+1}:", self.styles['Normal']),
+                Spacer(1, 6),
+                Paragraph("_" * 40 + " Date: " + "_" * 15, self.styles['Normal']),
+                Paragraph("Signature", self.styles['Normal']),
+                Spacer(1, 6),
+                Paragraph("_" * 40, self.styles['Normal']),
+                Paragraph("Print Name", self.styles['Normal']),
+                Spacer(1, 12)
+            ])
+        return flowables
+
+    @staticmethod
+    def _reuse(block: List) -> List:
+        # Shallow copies keep the parsed paragraph text but give each render its own layout state
+        return [copy.copy(flowable) for flowable in block]
+
+    def render_fields(self, will_obj, user) -> Dict:
+        """User-specific values that appear in the rendered document"""
+        will_content = json.loads(will_obj.content)
+        personal_info = will_content.get('personal_info', {})
+        return {
+            "testator_name": personal_info.get('full_name', user.full_name),
+            "address": user.address or 'address on file',
+            "signature_name": user.full_name,
+            "beneficiaries": [
+                {
+                    "name": beneficiary.get('name', 'Unnamed Beneficiary'),
+                    "relationship": beneficiary.get('relationship', 'relationship'),
+                    "percentage": beneficiary.get('percentage', 0)
+                }
+                for beneficiary in will_content.get('beneficiaries', [])
+            ],
+            "year": datetime.now().year
+        }
+
+    def build_story(self, fields: Dict) -> List:
+        """Assemble the flowables for one document"""
+        normal = self.styles['Normal']
+        story = self._reuse(self._title)
+
+        story.append(Paragraph(f"I, <b>{fields['testator_name']}</b>, "
+                               f"of {fields['address']}, being of sound mind and memory, "
+                               "do hereby make, publish, and declare this to be my Last Will and Testament.",
+                               normal))
+        story.append(Spacer(1, 12))
+        story.extend(self._reuse(self._revocation))
+
+        if fields['beneficiaries']:
+            story.extend(self._reuse(self._beneficiaries_heading))
+            for i, beneficiary in enumerate(fields['beneficiaries'], 1):
+                story.append(Paragraph(f"{i}. I give, devise, and bequeath to "
+                                       f"{beneficiary['name']} ({beneficiary['relationship']}) "
+                                       f"{beneficiary['percentage']}% of my estate.",
+                                       normal))
+            story.append(Spacer(1, 12))
+
+        story.extend(self._reuse(self._executor))
+        story.extend(self._reuse(self._digital_assets))
+
+        # Signature section
+        story.append(Paragraph("IN WITNESS WHEREOF, I have hereunto set my hand this _____ day of "
+                               f"_____________, {fields['year']}.",
+                               normal))
+        story.append(Spacer(1, 24))
+        story.append(Paragraph("_" * 40, normal))
+        story.append(Paragraph(f"{fields['signature_name']}, Testator", normal))
+        story.append(Spacer(1, 24))
+
+        story.extend(self._reuse(self._witnesses))
+        return story
+
+    def render(self, will_obj, user, output) -> None:
+        """Render to a file path or a writable binary file object.
+
+        invariant=1 fixes the creation date and document ID ReportLab would otherwise embed, so the same
+        fields always give the same bytes (and the same notarization hash)."""
+        doc = SimpleDocTemplate(output, pagesize=letter, invariant=1)
+        doc.build(self.build_story(self.render_fields(will_obj, user)))
+
+# Jurisdiction-specific layouts; states without an entry use WillTemplate
+WILL_TEMPLATES: Dict[str, Type[WillTemplate]] = {}
+
+def register_will_template(state_code: str, template_cls: Type[WillTemplate]):
+    WILL_TEMPLATES[state_code.upper()] = template_cls
+    get_will_template.cache_clear()
+
+@lru_cache(maxsize=64)
+def get_will_template(state_code: str) -> WillTemplate:
+    """Compiled template for a jurisdiction, built once per process"""
+    from services import ComplianceService
+
+    state_code = (state_code or "").upper()
+    state_rules = ComplianceService().states_data.get(state_code, {})
+    template_cls = WILL_TEMPLATES.get(state_code, WillTemplate)
+    return template_cls(state_code, state_rules)
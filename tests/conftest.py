@@ -0,0 +1,95 @@
+# Shared fixtures: import the backend modules and give every test an empty SQLite database
+import os
+import sys
+import json
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# models reads DATABASE_URL at import time, so it must be set before any backend import
+_DB_DIR = tempfile.mkdtemp(prefix="nextera-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_DIR}/test.db"
+
+from models import Base, SessionLocal, engine  # noqa: E402
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+@pytest.fixture
+def user(db):
+    from models import User
+
+    user = User(email="owner@example.com", hashed_password="x", first_name="Ada", last_name="Lovelace",
+                jurisdiction="CA")
+    db.add(user)
+    db.commit()
+    return user
+
+class LocalJSONServer:
+    """Threaded HTTP server on 127.0.0.1 answering with whatever `handler` returns.
+
+    handler(method, path, query, body) -> (status, json_body); every request is kept in `requests`."""
+
+    def __init__(self):
+        self.handler = lambda method, path, query, body: (404, {"error": "no handler"})
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, so tests can see connection reuse
+
+            def _serve(self):
+                parts = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                body = json.loads(raw) if raw else None
+                query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+                server.requests.append({"method": self.command, "path": parts.path, "query": query, "body": body,
+                                        "headers": dict(self.headers), "client_port": self.client_address[1]})
+                status, payload = server.handler(self.command, parts.path, query, body)
+                data = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # Client gave up (timeout tests)
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+@pytest.fixture
+def json_server():
+    server = LocalJSONServer()
+    try:
+        yield server
+    finally:
+        server.close()
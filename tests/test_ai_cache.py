@@ -0,0 +1,143 @@
+# Deterministic AI responses: canonical keys, the in-memory and SQLite tiers, TTL, entry bounds and single-flight
+import asyncio
+
+import pytest
+
+import ai_cache
+from ai_cache import AIResponseCache, SingleFlight, cache_key
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "ai_responses.sqlite3")
+
+def key(i: int = 0) -> str:
+    return cache_key("will_guidance", "openai", "gpt-4-turbo-preview", "1", {"state": "CA", "i": i})
+
+def test_key_ignores_whitespace_and_key_order():
+    first = cache_key("analysis", "openai", "gpt-4", "1", {"text": "Last  will\nand testament", "state": "CA"})
+    second = cache_key("analysis", "openai", "gpt-4", "1", {"state": "CA", "text": "Last will and testament"})
+
+    assert first == second
+    bumped = cache_key("analysis", "openai", "gpt-4", "2", {"text": "Last will and testament", "state": "CA"})
+    assert bumped != first  # A template version change never reuses old answers
+
+def test_conversational_features_are_never_keyed():
+    with pytest.raises(ValueError):
+        cache_key("grief", "openai", "gpt-4", "1", {"message": "I miss her"})
+
+def test_memory_tier_then_disk_tier(path):
+    cache = AIResponseCache(path=path)
+    assert asyncio.run(cache.get(key())) is None
+    asyncio.run(cache.set(key(), {"guidance": "Sign before two witnesses."}))
+
+    assert asyncio.run(cache.get(key())) == {"guidance": "Sign before two witnesses."}
+    assert cache.stats()["memory_hits"] == 1
+
+    # A restarted process starts with an empty memory tier and finds the entry on disk
+    restarted = AIResponseCache(path=path)
+    assert asyncio.run(restarted.get(key())) == {"guidance": "Sign before two witnesses."}
+    assert asyncio.run(restarted.get(key())) == {"guidance": "Sign before two witnesses."}
+    assert (restarted.metrics["disk_hits"], restarted.metrics["memory_hits"]) == (1, 1)
+
+def test_expired_entries_are_dropped_from_both_tiers(path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ai_cache.time, "time", lambda: now[0])
+    cache = AIResponseCache(path=path, ttl=60)
+    cache.set_sync(key(), {"guidance": "old"})
+
+    now[0] += 61
+
+    assert cache.get_sync(key()) is None
+    assert cache.metrics["expired"] == 2  # Memory entry, then the disk row
+    assert cache._db().execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 0
+
+def test_both_tiers_stay_within_their_bounds(path):
+    cache = AIResponseCache(path=path, memory_entries=3, disk_entries=10)
+
+    for i in range(25):
+        cache.set_sync(key(i), {"i": i})
+
+    assert len(cache._memory) == 3
+    assert list(cache._memory) == [key(22), key(23), key(24)]
+    assert cache._db().execute("SELECT COUNT(*) FROM responses").fetchone()[0] <= 10
+    assert cache.get_sync(key(24)) == {"i": 24}
+    assert cache.get_sync(key(0)) is None  # Least recently used, trimmed from disk
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"guidance": "Sign before two witnesses."}
+
+    async def scenario():
+        return await asyncio.gather(*(flights.do(key(), generate) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+
+    assert len(calls) == 1
+    assert results == [{"guidance": "Sign before two witnesses."}] * 5
+    assert flights.stats() == {"leaders": 1, "followers": 4, "cancelled": 0, "errors": 0, "in_flight": 0,
+                               "coalesced_rate": 0.8}
+
+def test_every_waiter_receives_the_shared_error():
+    flights = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    async def scenario():
+        return await asyncio.gather(*(flights.do(key(), failing) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+
+    assert [str(result) for result in results] == ["provider down"] * 3
+    assert flights.metrics["errors"] == 1
+    assert flights.stats()["in_flight"] == 0  # The next caller starts a fresh call
+
+def test_cancelled_waiter_leaves_the_shared_call_running():
+    flights = SingleFlight()
+    release = None
+
+    async def generate():
+        await release.wait()
+        return "answer"
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        leaver = asyncio.ensure_future(flights.do(key(), generate))
+        stayer = asyncio.ensure_future(flights.do(key(), generate))
+        await asyncio.sleep(0)
+        leaver.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return leaver.cancelled(), await stayer
+
+    assert asyncio.run(scenario()) == (True, "answer")
+    assert flights.metrics["cancelled"] == 0
+
+def test_last_waiter_leaving_cancels_the_call():
+    flights = SingleFlight()
+    started = []
+
+    async def generate():
+        started.append(1)
+        await asyncio.sleep(10)
+
+    async def scenario():
+        waiters = [asyncio.ensure_future(flights.do(key(), generate)) for _ in range(2)]
+        await asyncio.sleep(0)
+        shared = flights._flights[key()].task
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        return shared.cancelled(), flights.stats()["in_flight"]
+
+    assert asyncio.run(scenario()) == (True, 0)
+    assert started == [1]
+    assert flights.metrics["cancelled"] == 1
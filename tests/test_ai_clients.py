@@ -0,0 +1,142 @@
+# Pooled provider clients, timeouts and provider failover against a local fake provider server
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import ai_clients
+import ai_service
+from ai_clients import close_ai_clients, get_http_client, get_openai_client
+from ai_router import AIProviderRouter
+from ai_service import MultiAIService
+
+MESSAGES = [{"role": "system", "content": "Be kind."}, {"role": "user", "content": "Hello"}]
+
+class FakeProviders:
+    """OpenAI, Anthropic and DeepSeek chat endpoints; `delays` and `failing` are keyed by provider"""
+
+    def __init__(self):
+        self.delays = {}
+        self.failing = set()
+
+    def __call__(self, method, path, query, body):
+        provider = path.strip("/").split("/")[0]
+        time.sleep(self.delays.get(provider, 0))
+        if provider in self.failing:
+            return 500, {"error": {"message": "upstream overloaded"}}
+        text = f"{provider} answer"
+        if provider == "claude":
+            return 200, {"content": [{"type": "text", "text": text}], "usage": {"input_tokens": 7, "output_tokens": 2}}
+        return 200, {
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 7, "completion_tokens": 2, "total_tokens": 9}
+        }
+
+@pytest.fixture
+def providers(json_server, monkeypatch):
+    json_server.handler = FakeProviders()
+    monkeypatch.setattr(ai_clients, "OPENAI_BASE_URL", f"{json_server.url}/openai/v1")
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    return json_server.handler
+
+@pytest.fixture
+def service(json_server, providers):
+    service = MultiAIService()
+    service.anthropic_url = f"{json_server.url}/claude/v1/messages"
+    service.deepseek_url = f"{json_server.url}/deepseek/v1/chat/completions"
+    return service
+
+def run(scenario):
+    async def wrapped():
+        try:
+            return await scenario()
+        finally:
+            await close_ai_clients()
+
+    return asyncio.run(wrapped())
+
+def test_every_provider_shares_one_pooled_connection(json_server, service):
+    async def scenario():
+        client = get_http_client()
+        answers = []
+        for _ in range(2):
+            answers.append((await service._openai_chat(MESSAGES))[0])
+            answers.append((await service._claude_chat(MESSAGES))[0])
+            answers.append((await service._deepseek_chat(MESSAGES))[0])
+        assert get_http_client() is client
+        assert get_openai_client()._client is client
+        return answers
+
+    answers = run(scenario)
+
+    assert answers == ["openai answer", "claude answer", "deepseek answer"] * 2
+    assert [request["path"] for request in json_server.requests[:3]] == [
+        "/openai/v1/chat/completions", "/claude/v1/messages", "/deepseek/v1/chat/completions"]
+    assert len({request["client_port"] for request in json_server.requests}) == 1  # One kept-alive connection
+
+def test_shutdown_closes_the_pool(service):
+    async def scenario():
+        await service._deepseek_chat(MESSAGES)
+        client = get_http_client()
+        await close_ai_clients()
+        assert client.is_closed
+        replacement = get_http_client()
+        assert replacement is not client and not replacement.is_closed
+
+    run(scenario)
+
+def test_each_event_loop_gets_its_own_pool(service):
+    clients = []
+
+    async def scenario():
+        clients.append(get_http_client())
+        await service._deepseek_chat(MESSAGES)
+
+    run(scenario)
+    run(scenario)
+    assert clients[0] is not clients[1]
+    assert clients[0].is_closed
+
+def test_slow_provider_times_out(providers, service, monkeypatch):
+    monkeypatch.setattr(ai_clients, "AI_REQUEST_TIMEOUT", 0.3)
+    providers.delays["deepseek"] = 1.5
+
+    async def scenario():
+        started = time.perf_counter()
+        with pytest.raises(httpx.TimeoutException):
+            await service._deepseek_chat(MESSAGES)
+        return time.perf_counter() - started
+
+    assert run(scenario) < 1.0
+
+def test_failed_provider_is_retried_on_the_next(providers, service, monkeypatch):
+    router = AIProviderRouter(["deepseek", "claude"], preferred="deepseek")
+    monkeypatch.setattr(ai_service, "get_ai_router", lambda: router)
+    providers.failing.add("deepseek")
+
+    answer, used = run(lambda: service._route(MESSAGES, feature="test"))
+
+    assert (answer, used) == ("claude answer", "claude")
+    assert router.stats["deepseek"].error_rate == 1.0
+    assert router.breakers["deepseek"].consecutive_failures == 1
+    assert router.stats["claude"].ewma is not None
+
+def test_slow_provider_is_hedged(providers, service, monkeypatch):
+    router = AIProviderRouter(["deepseek", "claude"], preferred="deepseek", hedge_min_delay=0.1,
+                              hedge_max_delay=0.2)
+    monkeypatch.setattr(ai_service, "get_ai_router", lambda: router)
+    providers.delays["deepseek"] = 1.5
+
+    async def scenario():
+        started = time.perf_counter()
+        result = await service._route(MESSAGES, feature="test")
+        return result, time.perf_counter() - started
+
+    (answer, used), elapsed = run(scenario)
+
+    assert used == "claude" and answer == "claude answer"
+    assert elapsed < 1.0
+    assert router.stats["claude"].hedges_won == 1
+    assert router.breakers["deepseek"].consecutive_failures == 0  # A cancelled loser is not a failure
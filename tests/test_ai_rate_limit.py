@@ -0,0 +1,92 @@
+# AI provider admission: token buckets, strict priority order when saturated, cancellation and queue stats
+import asyncio
+
+import pytest
+
+import ai_rate_limit
+from ai_rate_limit import AIRateLimiter, ProviderLimiter, TokenBucket, provider_limits
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ai_rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+@pytest.fixture
+def limiter(monkeypatch):
+    # 6000 requests a minute: a drained bucket frees a slot every 10 ms
+    monkeypatch.setenv("AI_RATE_LIMIT_OPENAI_RPM", "6000")
+    limiter = ProviderLimiter("openai")
+    limiter.requests.level = 0
+    return limiter
+
+def test_limits_can_be_overridden_per_provider(monkeypatch):
+    monkeypatch.setenv("AI_RATE_LIMIT_CLAUDE_TPM", "1000")
+
+    assert provider_limits("claude") == {"rpm": 50.0, "tpm": 1000.0}
+    assert provider_limits("unknown") == {"rpm": 500.0, "tpm": 150000.0}  # OpenAI's defaults
+
+def test_bucket_refills_continuously_up_to_capacity(clock):
+    bucket = TokenBucket(per_minute=60)
+    bucket.take(60)
+
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock[0] += 0.5
+    assert bucket.wait_time(1) == pytest.approx(0.5)
+    clock[0] += 3600
+    assert bucket.wait_time(1000) == 0  # Oversized calls wait for a full bucket, not forever
+    assert bucket.level == 60  # Never more than a minute's worth
+
+def test_free_capacity_is_admitted_without_queueing():
+    limiter = ProviderLimiter("openai")
+
+    asyncio.run(limiter.acquire(1200, "interactive"))
+
+    stats = limiter.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["priorities"]["interactive"]["admitted"] == 1
+    assert stats["tokens_available"] == 150000 - 1200
+
+def test_saturated_provider_admits_by_priority_then_arrival(limiter):
+    admitted = []
+
+    async def call(name, priority):
+        await limiter.acquire(10, priority)
+        admitted.append(name)
+
+    async def scenario():
+        await asyncio.gather(call("batch 1", "batch"), call("batch 2", "batch"),
+                             call("interactive", "interactive"), call("crisis", "crisis"))
+
+    asyncio.run(scenario())
+
+    assert admitted == ["crisis", "interactive", "batch 1", "batch 2"]
+    waits = limiter.stats()["priorities"]
+    assert waits["crisis"]["wait_p50_ms"] < waits["batch"]["wait_p95_ms"]
+
+def test_cancelled_waiter_leaves_the_queue(limiter):
+    async def scenario():
+        gone = asyncio.ensure_future(limiter.acquire(10, "crisis"))
+        staying = asyncio.ensure_future(limiter.acquire(10, "batch"))
+        await asyncio.sleep(0)
+        assert limiter.stats()["queue_depth"] == 2
+        gone.cancel()
+        await asyncio.sleep(0)
+        assert limiter.stats()["queue_depth"] == 1
+        await staying
+
+    asyncio.run(scenario())
+
+    assert limiter.admitted == {"crisis": 0, "interactive": 0, "batch": 1}
+
+def test_each_provider_has_its_own_buckets():
+    limiters = AIRateLimiter()
+
+    async def scenario():
+        await limiters.acquire("openai", 100, "batch")
+        await limiters.acquire("claude", 100, "crisis")
+
+    asyncio.run(scenario())
+
+    assert [stats["provider"] for stats in limiters.stats()] == ["claude", "openai"]
+    assert limiters.for_provider("claude").tokens.level != limiters.for_provider("openai").tokens.level
@@ -0,0 +1,99 @@
+# Provider choice, hedging, latency samples and hedged-loser cleanup
+import asyncio
+import gc
+import time
+
+from ai_router import AIProviderRouter
+
+def test_latency_excludes_time_waiting_for_admission():
+    router = AIProviderRouter(["openai"])
+
+    async def admit(provider):
+        await asyncio.sleep(0.3)  # Queued behind the rate limiter
+
+    async def request(provider):
+        await asyncio.sleep(0.05)
+        return "ok"
+
+    assert asyncio.run(router.call(request, admit=admit)) == ("ok", "openai")
+    assert router.stats["openai"].ewma < 0.2
+
+def test_failed_hedge_loser_exception_is_retrieved():
+    router = AIProviderRouter(["openai", "claude"], preferred="openai", hedge_min_delay=0.05, hedge_max_delay=0.05)
+    unretrieved = []
+
+    async def request(provider):
+        if provider == "openai":
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                raise RuntimeError("connection torn down mid-request")  # Fails while being cancelled
+        await asyncio.sleep(0.05)
+        return provider
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        loop.set_exception_handler(lambda loop, context: unretrieved.append(context["message"]))
+        result = await router.call(request)
+        await asyncio.sleep(0.1)
+        return result
+
+    assert asyncio.run(scenario()) == ("claude", "claude")
+    gc.collect()
+    assert not [message for message in unretrieved if "never retrieved" in message]
+
+def test_fastest_provider_by_ewma_goes_first():
+    router = AIProviderRouter(["openai", "claude", "deepseek"], preferred="openai")
+    for _ in range(3):
+        router.record_success("openai", 2.0)
+        router.record_success("claude", 0.4)
+        router.record_success("deepseek", 1.0)
+    called = []
+
+    async def request(provider):
+        called.append(provider)
+        return provider
+
+    assert router.rank() == ["claude", "deepseek", "openai"]
+    assert asyncio.run(router.call(request)) == ("claude", "claude")
+    assert asyncio.run(router.call(request, first="openai")) == ("openai", "openai")  # Explicit choice wins
+    assert called == ["claude", "openai"]
+
+def test_hedge_fires_after_p95_and_records_the_winner():
+    router = AIProviderRouter(["openai", "claude"], preferred="openai", hedge_min_delay=0.01, hedge_max_delay=5)
+    for _ in range(10):
+        router.record_success("openai", 0.1)  # p95 100 ms
+    launched = {}
+
+    async def request(provider):
+        launched[provider] = time.monotonic()
+        await asyncio.sleep(1.0 if provider == "openai" else 0.05)
+        return provider
+
+    async def scenario():
+        started = time.monotonic()
+        result = await router.call(request)
+        return result, started
+
+    (result, provider), started = asyncio.run(scenario())
+
+    assert (result, provider) == ("claude", "claude")
+    assert 0.09 <= launched["claude"] - launched["openai"] < 0.5
+    assert router.stats["claude"].hedges_won == 1
+    assert router.stats["claude"].ewma < 0.2
+    assert router.breakers["openai"].consecutive_failures == 0
+
+def test_no_hedge_while_waiting_for_admission():
+    router = AIProviderRouter(["openai", "claude"], preferred="openai", hedge_min_delay=0.05, hedge_max_delay=0.05)
+    launched = []
+
+    async def admit(provider):
+        await asyncio.sleep(0.3 if provider == "openai" else 0)  # Rate limiter says wait
+
+    async def request(provider):
+        launched.append((provider, time.monotonic()))
+        await asyncio.sleep(0.02)
+        return provider
+
+    assert asyncio.run(router.call(request, admit=admit)) == ("openai", "openai")
+    assert [provider for provider, _ in launched] == ["openai"]
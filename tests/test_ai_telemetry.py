@@ -0,0 +1,37 @@
+# Telemetry windows survive a failed flush
+import asyncio
+
+import pytest
+
+from ai_telemetry import AITelemetry
+from models import AIUsageRollup
+
+def test_failed_flush_keeps_the_window_for_the_next_one(db, monkeypatch):
+    telemetry = AITelemetry()
+    write = AITelemetry._write
+    failures = [RuntimeError("database is locked")]
+
+    def flaky_write(window, window_start, window_end):
+        if failures:
+            raise failures.pop()
+        write(window, window_start, window_end)
+
+    monkeypatch.setattr(telemetry, "_write", flaky_write)
+
+    async def scenario():
+        telemetry.record("grief", "openai", "gpt-4-turbo-preview", 0.2, 100, 50)
+        telemetry.record("grief", "openai", "gpt-4-turbo-preview", 0.3, 100, 50)
+        with pytest.raises(RuntimeError):
+            await telemetry.flush()
+        telemetry.record("grief", "openai", "gpt-4-turbo-preview", 0.4, 100, 50)
+        telemetry.record("summary", "claude", "claude-3-sonnet-20240229", 1.2, 10, 5)
+        await telemetry.flush()
+
+    asyncio.run(scenario())
+
+    rows = {row.feature: row for row in db.query(AIUsageRollup)}
+    assert rows["grief"].calls == 3
+    assert rows["grief"].prompt_tokens == 300 and rows["grief"].completion_tokens == 150
+    assert sum(rows["grief"].latency_buckets) == 3
+    assert rows["summary"].calls == 1
+    assert telemetry.rollups(db)["total_calls"] == 4  # Nothing counted twice
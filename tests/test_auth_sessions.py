@@ -0,0 +1,92 @@
+# Refresh-token rotation, reuse detection and session revocation as seen by access tokens
+import asyncio
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+import auth
+from auth import AuthService, get_current_user
+from models import RefreshToken
+from token_revocation import SessionRevocationList
+
+@pytest.fixture(autouse=True)
+def revocations(monkeypatch):
+    # Each test gets a fresh in-process revocation list
+    revocations = SessionRevocationList(auth.timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES),
+                                        auth.timedelta(days=auth.REFRESH_TOKEN_EXPIRE_DAYS))
+    monkeypatch.setattr(auth, "session_revocations", revocations)
+    return revocations
+
+def authenticate(db, access_token: str):
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=access_token)
+    return asyncio.run(get_current_user(credentials, db))
+
+def assert_rejected(db, access_token: str):
+    with pytest.raises(HTTPException) as error:
+        authenticate(db, access_token)
+    assert error.value.status_code == 401
+
+def test_refresh_rotates_within_the_same_session(db, user):
+    first = AuthService.create_session(db, user)
+
+    second = AuthService.rotate_refresh_token(db, first["refresh_token"])
+
+    assert second["refresh_token"] != first["refresh_token"]
+    sid = AuthService.verify_token(first["access_token"])["sid"]
+    assert AuthService.verify_token(second["access_token"])["sid"] == sid
+    assert authenticate(db, second["access_token"]).id == user.id
+    used_hash = AuthService._hash_refresh_token(first["refresh_token"])
+    used = db.query(RefreshToken).filter(RefreshToken.token_hash == used_hash).one()
+    assert used.used_at is not None and used.revoked_at is None
+
+def test_reused_refresh_token_revokes_the_whole_session(db, user):
+    first = AuthService.create_session(db, user)
+    other = AuthService.create_session(db, user)  # Another device, left alone
+    second = AuthService.rotate_refresh_token(db, first["refresh_token"])
+
+    with pytest.raises(HTTPException) as error:
+        AuthService.rotate_refresh_token(db, first["refresh_token"])  # Replay
+    assert error.value.status_code == 401
+
+    with pytest.raises(HTTPException):
+        AuthService.rotate_refresh_token(db, second["refresh_token"])
+    assert_rejected(db, first["access_token"])
+    assert_rejected(db, second["access_token"])
+    assert authenticate(db, other["access_token"]).id == user.id
+
+def test_logout_revokes_every_session_on_every_worker(db, user):
+    sessions = [AuthService.create_session(db, user) for _ in range(2)]
+    elsewhere = SessionRevocationList(auth.timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES))
+    elsewhere.sync()
+
+    assert AuthService.revoke_sessions(db, user.id) == 2
+
+    for session in sessions:
+        assert_rejected(db, session["access_token"])
+        with pytest.raises(HTTPException):
+            AuthService.rotate_refresh_token(db, session["refresh_token"])
+
+    # Another worker learns about it from the table at its next poll
+    elsewhere.sync()
+    for session in sessions:
+        sid = AuthService.verify_token(session["access_token"])["sid"]
+        assert sid in elsewhere._filter
+        assert elsewhere.is_revoked(sid, db)
+
+def test_token_without_a_session_is_rejected(db, user):
+    legacy = AuthService.create_access_token(data={"sub": user.email})
+
+    assert_rejected(db, legacy)
+
+def test_access_token_lifetime_comes_from_the_environment(tmp_path):
+    # Fresh interpreter: the lifetime is read once at import
+    env = {**os.environ, "ACCESS_TOKEN_EXPIRE_MINUTES": "1440", "DATABASE_URL": f"sqlite:///{tmp_path}/env.db"}
+    script = "import auth; print(auth.ACCESS_TOKEN_EXPIRE_MINUTES, auth.session_revocations.window.total_seconds())"
+    output = subprocess.run([sys.executable, "-c", script], cwd=Path(auth.__file__).parent, env=env, capture_output=True,
+                            text=True, check=True).stdout.split()
+    assert output == ["1440", str(1440 * 60.0)]
@@ -0,0 +1,77 @@
+# Bulk will export: safe archive names, streamed ZIP contents and progress kept in the database
+import io
+import json
+import re
+import zipfile
+
+import pytest
+
+from bulk_export import BulkWillExporter, archive_name
+from models import BulkExport, User, Will
+
+@pytest.fixture
+def exporter():
+    exporter = BulkWillExporter(max_workers=2)
+    yield exporter
+    exporter.stop()
+
+@pytest.fixture
+def wills(db, user):
+    other = User(email="heir@example.com", hashed_password="x", first_name="Sean", last_name="../O'Brien ñ",
+                 jurisdiction="NY")
+    db.add(other)
+    db.commit()
+    content = json.dumps({"beneficiaries": [{"name": "Byron", "relationship": "child", "percentage": 100}]})
+    rows = [Will(owner_id=user.id, title="Will", jurisdiction="CA", content=content),
+            Will(owner_id=other.id, title="Will", jurisdiction="NY", content=content),
+            Will(owner_id=user.id, title="Broken", jurisdiction="CA", content="not json")]
+    db.add_all(rows)
+    db.commit()
+    return rows
+
+@pytest.mark.parametrize("last_name, expected", [
+    ("Lovelace", "will_7_Lovelace.pdf"),
+    ("../../etc/passwd", "will_7_______etc_passwd.pdf"),
+    ("O'Brien\\x", "will_7_O_Brien_x.pdf"),
+    ("Zoë", "will_7_Zo_.pdf"),
+    (None, "will_7.pdf"),
+])
+def test_archive_names_keep_only_safe_characters(last_name, expected):
+    assert archive_name(7, last_name) == expected
+
+def test_export_streams_every_will_and_records_progress(db, user, wills, exporter):
+    requested = [will.id for will in wills] + [999]
+    payloads = exporter.load_payloads(db, requested)
+    export_id = exporter.create_export(db, requested, payloads, user.id)
+    assert exporter.get_progress(db, export_id)["status"] == "pending"
+
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(exporter.stream(export_id, payloads))))
+
+    names = archive.namelist()
+    assert all(re.fullmatch(r"will_\d+(_[A-Za-z0-9_-]+)?\.pdf", name) for name in names if name != "manifest.json")
+    assert f"will_{wills[1].id}____O_Brien__.pdf" in names
+    manifest = json.loads(archive.read("manifest.json"))
+    assert [entry["status"] for entry in manifest["wills"] if entry["will_id"] == wills[2].id] == ["failed"]
+    assert manifest["missing"] == [999]
+
+    # Another worker (a fresh exporter and session) sees the same progress
+    db.expire_all()
+    progress = BulkWillExporter().get_progress(db, export_id)
+    assert progress["status"] == "completed"
+    assert (progress["total"], progress["completed"], progress["failed"]) == (3, 2, 1)
+    assert progress["missing"] == [999] and progress["finished_at"] is not None
+    assert db.query(BulkExport).one().requested_by == user.id
+
+def test_abandoned_download_is_marked_cancelled(db, user, wills, exporter):
+    payloads = exporter.load_payloads(db, [wills[0].id, wills[1].id])
+    export_id = exporter.create_export(db, [wills[0].id, wills[1].id], payloads)
+
+    stream = exporter.stream(export_id, payloads)
+    next(stream)
+    stream.close()  # Client went away
+
+    db.expire_all()
+    assert exporter.get_progress(db, export_id)["status"] == "cancelled"
+
+def test_unknown_export(db, exporter):
+    assert exporter.get_progress(db, "no-such-export") is None
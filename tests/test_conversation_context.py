@@ -0,0 +1,130 @@
+# Prompt packing under a token budget, the user-first trim, abridged unsummarized turns and summary folding
+import asyncio
+
+import pytest
+
+import conversation_context
+from conversation_context import ConversationContextManager, count_tokens, message_tokens
+from models import ConversationSummary
+
+SYSTEM = "You are a gentle grief companion."
+
+def turn(role: str, i: int, words: int = 30) -> dict:
+    return {"role": role, "content": f"turn {i} " + " ".join(["remembering"] * words)}
+
+def conversation(turns: int) -> list:
+    return [turn("user" if i % 2 == 0 else "assistant", i) for i in range(turns)]
+
+def prompt_tokens(messages) -> int:
+    return sum(message_tokens(message) for message in messages)
+
+def build(manager, history, session_id=None, summarizer=None):
+    async def scenario():
+        messages = await manager.build(session_id, SYSTEM, history, "How do I get through today?", "openai",
+                                       summarizer)
+        for task in list(manager._folding.values()):
+            await task
+        return messages
+
+    return asyncio.run(scenario())
+
+def test_short_conversation_is_sent_whole():
+    history = conversation(4)
+
+    messages = build(ConversationContextManager(budget_tokens=3000), history)
+
+    assert messages == [{"role": "system", "content": SYSTEM}, *history,
+                        {"role": "user", "content": "How do I get through today?"}]
+
+def test_newest_turns_fill_the_budget():
+    manager = ConversationContextManager(budget_tokens=400, unsummarized_tokens=100)
+    history = conversation(20)
+
+    messages = build(manager, history)
+
+    window = messages[1:-1]
+    assert window == history[-len(window):]
+    assert 2 <= len(window) < len(history)
+    assert prompt_tokens(messages) <= manager.budget_tokens
+
+def test_window_opens_with_a_user_turn():
+    manager = ConversationContextManager(budget_tokens=1000, unsummarized_tokens=0)
+    history = conversation(20)
+    system_and_new = message_tokens({"content": SYSTEM}) + message_tokens({"content": "How do I get through today?"})
+    # Room for exactly three turns, so the window would start on an assistant turn
+    manager.budget_tokens = system_and_new + sum(message_tokens(t) for t in history[-3:])
+
+    window = build(manager, history)[1:-1]
+
+    assert window == history[-2:]
+    assert window[0]["role"] == "user"
+
+def test_turns_outside_the_window_stay_visible_until_folded():
+    manager = ConversationContextManager(budget_tokens=600, unsummarized_tokens=200)
+    history = conversation(20)
+
+    messages = build(manager, history)
+
+    system = messages[0]["content"]
+    first_kept = history.index(messages[1])
+    assert "not yet in the summary" in system
+    assert f"Assistant: turn {first_kept - 1} " in system  # The turn just before the window
+    assert "turn 0 " not in system  # The oldest do not fit the allowance
+    assert prompt_tokens(messages) <= manager.budget_tokens
+
+def test_old_turns_are_folded_into_the_session_summary(db):
+    manager = ConversationContextManager(budget_tokens=600, unsummarized_tokens=200)
+    history = conversation(20)
+    folded = []
+
+    async def summarizer(previous, turns):
+        folded.append(turns)
+        return f"{previous} covered {len(turns)}".strip()
+
+    first = build(manager, history, "session-1", summarizer)
+    covered = history.index(first[1])
+
+    assert [t for chunk in folded for t in chunk] == history[:covered]
+    row = db.query(ConversationSummary).filter(ConversationSummary.session_id == "session-1").one()
+    assert row.covered_messages == covered
+
+    # Next turn: the summary replaces the folded turns, and nothing is left to abridge
+    second = build(ConversationContextManager(budget_tokens=600, unsummarized_tokens=200), history, "session-1")
+    assert f"Summary of the earlier conversation:\n{row.summary}" in second[0]["content"]
+    assert "not yet in the summary" not in second[0]["content"]
+
+def test_failed_fold_keeps_the_previous_summary(db):
+    manager = ConversationContextManager(budget_tokens=600)
+
+    async def summarizer(previous, turns):
+        raise RuntimeError("provider down")
+
+    build(manager, conversation(20), "session-2", summarizer)
+
+    assert db.query(ConversationSummary).count() == 0
+    assert manager.get_summary("session-2") == ("", 0)
+
+class WordEncoding:
+    """Stand-in tokenizer: one token per word"""
+
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+    def decode(self, tokens):
+        return " ".join(tokens)
+
+def test_tiktoken_counts_are_used_when_available(monkeypatch):
+    monkeypatch.setattr(conversation_context, "_encoding", lambda: WordEncoding())
+
+    assert count_tokens("one two three four") == 4
+    assert conversation_context.clip_tokens("one two three four five", 3) == "one two..."
+
+@pytest.mark.parametrize("provider", ["openai", "claude", "deepseek"])
+def test_character_estimate_without_tiktoken(monkeypatch, provider):
+    monkeypatch.setattr(conversation_context, "_encoding", lambda: None)
+    text = "remembering " * 100
+
+    clipped = conversation_context.clip_tokens(text, 20, provider)
+
+    assert clipped.endswith("...")
+    assert count_tokens(clipped, provider) <= 20
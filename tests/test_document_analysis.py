@@ -0,0 +1,98 @@
+# Long vault documents: overlapping chunks, bounded parallel map, the reduce tree and partial-failure reports
+import asyncio
+
+import pytest
+
+from ai_service import MultiAIService
+from document_analysis import chunk_text, map_reduce
+
+def clauses(count: int) -> str:
+    return "\n\n".join(f"Article {i}. I give my estate to my heirs in equal shares." for i in range(count))
+
+def test_short_text_is_one_chunk():
+    assert chunk_text("I, Ada Lovelace, declare this my will.", chunk_tokens=100) == [
+        "I, Ada Lovelace, declare this my will."]
+
+def test_chunks_cut_at_paragraphs_and_overlap():
+    text = clauses(60)
+
+    chunks = chunk_text(text, chunk_tokens=200, overlap_tokens=40, provider="openai")
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 800 for chunk in chunks)
+    assert all(chunk.endswith("equal shares.") for chunk in chunks)  # No clause cut mid-sentence
+    for previous, following in zip(chunks, chunks[1:]):
+        assert following.split("\n\n")[0] in previous  # The boundary clause appears whole in both
+    assert all(f"Article {i}." in "".join(chunks) for i in range(60))
+
+def test_unbroken_text_is_still_chunked():
+    chunks = chunk_text("x" * 1000, chunk_tokens=50, overlap_tokens=10, provider="openai")
+
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    assert len("".join(chunks)) >= 1000
+
+def test_map_runs_at_most_concurrency_calls():
+    in_flight = [0]
+    peak = [0]
+
+    async def analyze(index, item):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.01)
+        in_flight[0] -= 1
+        return item
+
+    async def merge(items, final):
+        return "+".join(items)
+
+    result = asyncio.run(map_reduce([str(i) for i in range(10)], analyze, merge, concurrency=3, fanout=20))
+
+    assert result == "+".join(str(i) for i in range(10))  # Input order is kept
+    assert peak[0] == 3
+
+def test_reduce_tree_tells_only_the_last_call_it_is_final():
+    calls = []
+
+    async def analyze(index, item):
+        return item
+
+    async def merge(items, final):
+        calls.append((len(items), final))
+        return f"[{','.join(items)}]"
+
+    result = asyncio.run(map_reduce([str(i) for i in range(7)], analyze, merge, fanout=3))
+
+    assert result == "[[0,1,2],[3,4,5],[6]]"
+    assert sorted(calls) == [(1, False), (3, False), (3, False), (3, True)]
+
+def test_failed_items_are_left_out_of_the_reduce():
+    async def analyze(index, item):
+        return None if index % 2 else item
+
+    async def merge(items, final):
+        return items
+
+    assert asyncio.run(map_reduce(["a", "b", "c", "d"], analyze, merge)) == ["a", "c"]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(map_reduce(["a", "b"], lambda index, item: asyncio.sleep(0), merge))
+
+def test_section_failures_are_reported(monkeypatch):
+    service = MultiAIService()
+    prompts = []
+
+    async def route(messages, provider=None, **kwargs):
+        prompt = messages[-1]["content"]
+        prompts.append(prompt)
+        if prompt == "second":
+            raise RuntimeError("rate limited")
+        return f"findings: {prompt[:20]}", "claude"
+
+    monkeypatch.setattr(service, "_route", route)
+
+    result = asyncio.run(service._analyze_document_chunks(["first", "second", "third"], "CA"))
+
+    assert result["sections"] == 3 and result["sections_not_analyzed"] == [2]
+    assert result["provider_used"] == "claude"
+    final = prompts[-1]
+    assert "Section 1:" in final and "Section 3:" in final and "Section 2:" not in final
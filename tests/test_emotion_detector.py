@@ -0,0 +1,60 @@
+# Single-pass emotion and crisis detection, and the grief services' handling of every detected state
+import pytest
+
+from ai_service import MultiAIService
+from emotion_detector import EMOTION_LEXICON, EmotionDetector, emotion_detector
+from services import AIService
+
+@pytest.mark.parametrize("message, states", [
+    ("I miss him so much, I cried all night", ["sad"]),
+    ("It's so unfair and I'm furious", ["angry"]),
+    ("I keep thinking I should  have called her", ["guilty"]),
+    ("I just feel numb and disconnected", ["numb"]),
+    ("I remember the songs she used to sing", ["reflective"]),
+    ("The healing has started, but I am worried", ["anxious", "hopeful"]),  # Priority order, not text order
+    ("Lunch was fine", []),
+])
+def test_states_in_priority_order(message, states):
+    assert emotion_detector.scan(message)["states"] == states
+
+@pytest.mark.parametrize("message", ["I made dinner", "I feel hopeless", "She was a pianist", "Sadie called"])
+def test_matches_respect_word_boundaries(message):
+    assert emotion_detector.scan(message) == {"states": [], "crisis_detected": False, "matches": []}
+
+@pytest.mark.parametrize("message", [
+    "Sometimes I want to die",
+    "I can’t go on like this",  # Typographic apostrophe
+    "everyone would be BETTER OFF\nDEAD",
+    "I've thought about suicide",
+])
+def test_crisis_phrases_are_detected(message):
+    assert emotion_detector.scan(message)["crisis_detected"]
+
+def test_crisis_phrase_is_not_also_hope():
+    detected = emotion_detector.scan("they'd be better off dead without me")
+
+    assert detected["crisis_detected"]
+    assert "hopeful" not in detected["states"]
+
+def test_every_match_is_reported():
+    detected = emotion_detector.scan("Tears, tears and more tears. I regret it.")
+
+    assert detected["matches"] == ["tears", "tears", "tears", "regret"]
+
+def test_custom_lexicon():
+    detector = EmotionDetector({"relieved": ["relief", "at peace"]}, ["give up"])
+
+    assert detector.scan("Some relief, finally at   peace")["states"] == ["relieved"]
+    assert detector.scan("I want to give up")["crisis_detected"]
+
+@pytest.mark.parametrize("state", list(EMOTION_LEXICON))
+def test_every_state_gets_its_own_reply(state):
+    message = EMOTION_LEXICON[state][0]
+    neutral = AIService().generate_grief_response("Lunch was fine")["content"]
+
+    legacy = AIService().generate_grief_response(message)
+    fallback = MultiAIService()._fallback_grief_response(message, state)
+
+    assert legacy["emotional_state"] == state
+    assert legacy["content"] != neutral
+    assert fallback["content"] != MultiAIService()._fallback_grief_response(message, "neutral")["content"]
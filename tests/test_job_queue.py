@@ -0,0 +1,102 @@
+# Will generation jobs: duplicate coalescing, retries and status transitions
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import job_queue
+from job_queue import QueueFullError, WillJobQueue
+from models import GenerationJob, Will
+from services import WillGenerationService
+
+@pytest.fixture
+def will(db, user):
+    will = Will(owner_id=user.id, title="Will", jurisdiction="CA", content=json.dumps({
+        "personal_info": {"full_name": "Ada Lovelace"},
+        "beneficiaries": [{"name": "Byron", "relationship": "child", "percentage": 100}]
+    }))
+    db.add(will)
+    db.commit()
+    return will
+
+@pytest.fixture
+def queue():
+    return WillJobQueue(max_workers=0)
+
+def job(db, job_id: str) -> GenerationJob:
+    db.expire_all()
+    return db.query(GenerationJob).filter(GenerationJob.id == job_id).one()
+
+def run_next(queue) -> str:
+    job_id = queue._claim_next()
+    assert job_id is not None
+    queue._run(job_id)
+    return job_id
+
+def test_duplicates_coalesce_only_while_queued_or_running(db, user, will, queue, monkeypatch):
+    monkeypatch.setattr(WillGenerationService, "generate_final_will",
+                        lambda self, will_obj, user, db, blockchain_enabled: {"pdf_path": "will.pdf"})
+    first, coalesced = queue.submit(db, will, user)
+    assert not coalesced
+
+    assert queue.submit(db, will, user) == (first, True)
+    assert queue._claim_next() == first.id
+    assert queue.submit(db, will, user)[1]  # Running
+
+    queue._run(first.id)
+    assert job(db, first.id).status == "succeeded"
+
+    again, coalesced = queue.submit(db, will, user)
+    assert again.id == first.id and not coalesced
+    assert again.status == "queued" and again.result is None and again.attempts == 0
+
+def test_render_fields_are_part_of_the_key(db, user, will, queue):
+    first, _ = queue.submit(db, will, user, blockchain_enabled=False)
+    key = WillJobQueue.dedupe_key(will, user, False)
+
+    user.address = "1 Analytical Engine Way"
+    db.commit()
+    moved, coalesced = queue.submit(db, will, user)
+
+    assert moved.id != first.id and not coalesced
+    assert WillJobQueue.dedupe_key(will, user, False) != key
+    assert WillJobQueue.dedupe_key(will, user, True) != WillJobQueue.dedupe_key(will, user, False)
+
+def test_failures_are_retried_then_marked_failed(db, user, will, queue, monkeypatch):
+    def fail(self, will_obj, user, db, blockchain_enabled):
+        raise RuntimeError("renderer crashed")
+
+    monkeypatch.setattr(WillGenerationService, "generate_final_will", fail)
+    submitted, _ = queue.submit(db, will, user)
+
+    seen = []
+    for _ in range(job_queue.JOB_MAX_ATTEMPTS):
+        run_next(queue)
+        seen.append((job(db, submitted.id).status, job(db, submitted.id).attempts))
+
+    assert seen == [("queued", 1), ("queued", 2), ("failed", 3)]
+    assert job(db, submitted.id).error == "renderer crashed"
+    assert queue._claim_next() is None
+
+def test_stale_running_job_is_requeued(db, user, will, queue):
+    submitted, _ = queue.submit(db, will, user)
+    assert queue._claim_next() == submitted.id
+    assert job(db, submitted.id).status == "running"
+
+    # The worker died without finishing; it is old enough to be presumed dead
+    db.query(GenerationJob).update({GenerationJob.started_at: datetime.utcnow() - timedelta(hours=1)})
+    db.commit()
+    queue._requeue_stale()
+
+    assert job(db, submitted.id).status == "queued"
+    assert queue._claim_next() == submitted.id
+    assert job(db, submitted.id).attempts == 2
+
+def test_backlog_limit(db, user, will):
+    queue = WillJobQueue(max_workers=0, max_pending=1)
+    queue.submit(db, will, user)
+    user.address = "Elsewhere"
+    db.commit()
+
+    with pytest.raises(QueueFullError):
+        queue.submit(db, will, user)
@@ -0,0 +1,250 @@
+# Merkle batching, inclusion proofs and confirmation handling against the local simulated chain
+import asyncio
+import hashlib
+import threading
+import time
+
+import pytest
+
+from models import DocumentNotarization, NotarizationBatch, NotarizationSubmission, Will
+from notarization import (MerkleTree, NotarizationPipeline, NotarizationUnavailableError, SimulatedChain,
+                          compute_merkle_root, merkle_parent, verify_merkle_proof)
+
+def doc_hash(i: int) -> str:
+    return hashlib.sha256(f"document {i}".encode()).hexdigest()
+
+async def wait_for(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not reached before timeout")
+        await asyncio.sleep(0.02)
+
+def batch_statuses(db):
+    db.expire_all()
+    return [batch.status for batch in db.query(NotarizationBatch).order_by(NotarizationBatch.id)]
+
+@pytest.fixture
+def chain(tmp_path):
+    return SimulatedChain(str(tmp_path / "chain.jsonl"))
+
+class MempoolChain:
+    """Queues nonces ahead of the account like a real node; every send takes `latency` seconds"""
+
+    accepts_future_nonces = True
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.roots = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def pending_nonce(self) -> int:
+        with self._lock:
+            return len(self.roots)
+
+    def send_anchor(self, merkle_root: str, nonce: int) -> str:
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+            self.roots[nonce] = merkle_root
+        return f"0x{nonce:064x}"
+
+    def block_number(self) -> int:
+        return len(self.roots)
+
+    def get_receipt(self, tx_hash: str):
+        nonce = int(tx_hash, 16)
+        return {"block_number": nonce + 1, "gas_used": 21512, "succeeded": True} if nonce in self.roots else None
+
+    def anchored_root(self, tx_hash: str):
+        return self.roots.get(int(tx_hash, 16))
+
+@pytest.mark.parametrize("size", [1, 2, 3, 4, 5, 7, 8, 9, 16, 33])
+def test_every_leaf_proves_inclusion(size):
+    leaves = [doc_hash(i) for i in range(size)]
+    tree = MerkleTree(leaves)
+    for i, leaf in enumerate(leaves):
+        assert verify_merkle_proof(leaf, tree.proof(i), tree.root)
+
+def test_proof_rejects_other_document_and_tampering():
+    tree = MerkleTree([doc_hash(i) for i in range(6)])
+    proof = tree.proof(2)
+    assert not verify_merkle_proof(doc_hash(99), proof, tree.root)
+
+    tampered = [dict(step) for step in proof]
+    tampered[0]["position"] = "left" if tampered[0]["position"] == "right" else "right"
+    assert not verify_merkle_proof(doc_hash(2), tampered, tree.root)
+    assert not verify_merkle_proof(doc_hash(2), [{"hash": "zz"}], tree.root)
+
+def test_internal_node_is_not_a_valid_leaf():
+    tree = MerkleTree([doc_hash(i) for i in range(4)])
+    internal = merkle_parent(tree.levels[0][0], tree.levels[0][1]).hex()
+    # Second-preimage attempt: present the internal node as a document with the upper path
+    assert compute_merkle_root(internal, tree.proof(0)[1:]) != tree.root
+
+def test_empty_tree_is_rejected():
+    with pytest.raises(ValueError):
+        MerkleTree([])
+
+def test_submissions_in_one_window_share_one_anchor(db, chain):
+    hashes = [doc_hash(i) for i in range(10)]
+
+    async def scenario():
+        pipeline = NotarizationPipeline(chain, batch_size=64, window=0.2, poll_interval=0.05)
+        await pipeline.start()
+        try:
+            for document_hash in hashes + hashes[:3]:  # Duplicates inside the window share a leaf
+                pipeline.submit(document_hash)
+            await wait_for(lambda: batch_statuses(db) == ["confirmed"])
+        finally:
+            await pipeline.stop()
+
+    asyncio.run(scenario())
+
+    batch = db.query(NotarizationBatch).one()
+    assert batch.leaf_count == 10
+    assert chain.anchored_root(batch.transaction_hash) == batch.merkle_root
+    assert chain.pending_nonce() == 1
+
+    records = db.query(DocumentNotarization).all()
+    assert sorted(record.document_hash for record in records) == sorted(hashes)
+    for record in records:
+        assert verify_merkle_proof(record.document_hash, record.proof, batch.merkle_root)
+
+def test_batch_size_splits_a_burst(db, chain):
+    async def scenario():
+        pipeline = NotarizationPipeline(chain, batch_size=4, window=0.2, poll_interval=0.05)
+        await pipeline.start()
+        try:
+            for i in range(10):
+                pipeline.submit(doc_hash(i))
+            await wait_for(lambda: batch_statuses(db) == ["confirmed"] * 3)
+        finally:
+            await pipeline.stop()
+
+    asyncio.run(scenario())
+    assert [batch.leaf_count for batch in db.query(NotarizationBatch).order_by(NotarizationBatch.id)] == [4, 4, 2]
+
+def test_documents_are_flagged_only_after_enough_confirmations(db, chain, user):
+    will_hash = doc_hash(1)
+    will = Will(owner_id=user.id, title="Will", content="{}", jurisdiction="CA", blockchain_hash=will_hash)
+    db.add(will)
+    db.commit()
+
+    async def scenario():
+        pipeline = NotarizationPipeline(chain, batch_size=64, window=0.05, confirmations=2, poll_interval=0.05)
+        await pipeline.start()
+        try:
+            pipeline.submit(will_hash)
+            await wait_for(lambda: batch_statuses(db) == ["pending"])
+            # One block deep is not enough; the batch and the will wait
+            await asyncio.sleep(0.3)
+            assert batch_statuses(db) == ["pending"]
+            db.refresh(will)
+            assert not will.is_notarized
+
+            pipeline.submit(doc_hash(2))  # Mines the next block
+            await wait_for(lambda: batch_statuses(db)[0] == "confirmed")
+        finally:
+            await pipeline.stop()
+
+    asyncio.run(scenario())
+    db.refresh(will)
+    first = db.query(NotarizationBatch).order_by(NotarizationBatch.id).first()
+    assert will.is_notarized
+    assert will.blockchain_transaction == first.transaction_hash
+    assert first.block_number == chain.get_receipt(first.transaction_hash)["block_number"]
+
+def test_unsent_batches_are_resumed_on_restart(db, chain):
+    async def scenario():
+        pipeline = NotarizationPipeline(chain, batch_size=64, window=0.05, poll_interval=0.05)
+        await pipeline.start()
+        await pipeline.stop()
+        # Recorded by a process that died before sending
+        batch_id, needs_send = pipeline._record_batch([doc_hash(i) for i in range(3)])
+        assert needs_send
+
+        restarted = NotarizationPipeline(chain, batch_size=64, window=0.05, poll_interval=0.05)
+        await restarted.start()
+        try:
+            await wait_for(lambda: batch_statuses(db) == ["confirmed"])
+        finally:
+            await restarted.stop()
+
+    asyncio.run(scenario())
+
+def test_submission_survives_a_crash_inside_the_window(db, chain):
+    async def scenario():
+        crashed = NotarizationPipeline(chain, batch_size=64, window=30, poll_interval=0.05, sender_lease=0.3)
+        await crashed.start()
+        crashed.submit(doc_hash(1))
+        await asyncio.sleep(0.1)
+        # Dies before its window closes
+        for task in crashed._tasks:
+            task.cancel()
+        await asyncio.gather(*crashed._tasks, return_exceptions=True)
+        assert [row.document_hash for row in db.query(NotarizationSubmission)] == [doc_hash(1)]
+        assert batch_statuses(db) == []
+
+        restarted = NotarizationPipeline(chain, batch_size=64, window=30, poll_interval=0.05, sender_lease=0.3)
+        await restarted.start()
+        try:
+            await wait_for(lambda: batch_statuses(db) == ["confirmed"])
+        finally:
+            await restarted.stop()
+
+    asyncio.run(scenario())
+    db.expire_all()
+    assert db.query(NotarizationSubmission).count() == 0
+    assert db.query(DocumentNotarization).one().document_hash == doc_hash(1)
+
+def test_slower_batcher_cannot_take_a_later_submission(db, chain):
+    pipeline = NotarizationPipeline(chain)
+    first = NotarizationSubmission(document_hash=doc_hash(1))
+    db.add(first)
+    db.commit()
+    stale_id = first.id  # Both batchers read this row
+
+    assert pipeline._record_batch([doc_hash(1)], [stale_id]) is not None
+    later = NotarizationSubmission(document_hash=doc_hash(2))
+    db.add(later)
+    db.commit()
+
+    assert later.id != stale_id  # An emptied outbox does not hand out the same id again
+    assert pipeline._record_batch([doc_hash(1)], [stale_id]) is None
+    db.expire_all()
+    assert [row.document_hash for row in db.query(NotarizationSubmission)] == [doc_hash(2)]
+
+def test_submit_before_start_is_refused(db, chain):
+    pipeline = NotarizationPipeline(chain)
+
+    with pytest.raises(NotarizationUnavailableError):
+        pipeline.submit(doc_hash(1))
+    assert db.query(NotarizationSubmission).count() == 0
+
+def test_claimed_batches_are_sent_concurrently(db):
+    chain = MempoolChain(latency=0.2)
+
+    async def scenario():
+        pipeline = NotarizationPipeline(chain, window=0.05, poll_interval=0.05, send_concurrency=4)
+        for i in range(4):
+            pipeline._record_batch([doc_hash(i)])
+        started = time.monotonic()
+        await pipeline.start()
+        try:
+            await wait_for(lambda: batch_statuses(db) == ["confirmed"] * 4)
+            return time.monotonic() - started
+        finally:
+            await pipeline.stop()
+
+    elapsed = asyncio.run(scenario())
+    assert chain.max_in_flight == 4
+    assert elapsed < 0.6  # Four sends back to back would take 0.8 s
+    batches = db.query(NotarizationBatch).order_by(NotarizationBatch.id).all()
+    assert all(chain.anchored_root(batch.transaction_hash) == batch.merkle_root for batch in batches)
+    assert sorted(chain.roots) == [0, 1, 2, 3]
@@ -0,0 +1,227 @@
+# Nonce sequencing, send retries, confirmation depth and the single-sender lease, on eth-tester
+import asyncio
+import hashlib
+
+import pytest
+
+pytest.importorskip("eth_tester")
+from web3 import EthereumTesterProvider, Web3  # noqa: E402
+
+import notarization  # noqa: E402
+from models import NotarizationBatch, Will  # noqa: E402
+from notarization import NotarizationPipeline, Web3AnchorChain  # noqa: E402
+
+def doc_hash(i: int) -> str:
+    return hashlib.sha256(f"document {i}".encode()).hexdigest()
+
+async def wait_for(condition, timeout: float = 10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not reached before timeout")
+        await asyncio.sleep(0.02)
+
+def batches(db):
+    db.expire_all()
+    return db.query(NotarizationBatch).order_by(NotarizationBatch.id).all()
+
+def statuses(db):
+    return [batch.status for batch in batches(db)]
+
+def make_pipeline(chain, **options) -> NotarizationPipeline:
+    options = {"batch_size": 64, "window": 0.05, "poll_interval": 0.05, **options}
+    return NotarizationPipeline(chain, **options)
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(notarization, "NOTARY_SEND_BACKOFF", 0.01)
+
+@pytest.fixture
+def w3():
+    return Web3(EthereumTesterProvider())
+
+@pytest.fixture
+def chain(w3):
+    return Web3AnchorChain(w3)
+
+class FlakyChain:
+    """Wraps a chain; the first `failures` sends raise before reaching it"""
+
+    def __init__(self, chain, failures: int, error: str = "connection reset by peer"):
+        self.chain = chain
+        self.failures = failures
+        self.error = error
+        self.send_attempts = 0
+
+    def send_anchor(self, merkle_root: str, nonce: int) -> str:
+        self.send_attempts += 1
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError(self.error)
+        return self.chain.send_anchor(merkle_root, nonce)
+
+    def __getattr__(self, name):
+        return getattr(self.chain, name)
+
+def test_anchors_use_consecutive_nonces(db, w3, chain):
+    async def scenario():
+        pipeline = make_pipeline(chain, batch_size=2)
+        await pipeline.start()
+        try:
+            for i in range(8):
+                pipeline.submit(doc_hash(i))
+            await wait_for(lambda: statuses(db) == ["confirmed"] * 4)
+        finally:
+            await pipeline.stop()
+
+    asyncio.run(scenario())
+    sent = batches(db)
+    assert [w3.eth.get_transaction(batch.transaction_hash)["nonce"] for batch in sent] == [0, 1, 2, 3]
+    assert all(chain.anchored_root(batch.transaction_hash) == batch.merkle_root for batch in sent)
+
+def test_stale_nonce_is_resynced_from_the_chain(db, w3, chain):
+    async def scenario():
+        pipeline = make_pipeline(chain)
+        await pipeline.start()
+        try:
+            pipeline.submit(doc_hash(1))
+            await wait_for(lambda: statuses(db) == ["confirmed"])
+            # Someone else spends the account's next nonce behind the pipeline's back
+            chain.send_anchor("00" * 32, chain.pending_nonce())
+            pipeline.submit(doc_hash(2))
+            await wait_for(lambda: statuses(db) == ["confirmed", "confirmed"])
+        finally:
+            await pipeline.stop()
+
+    asyncio.run(scenario())
+    assert w3.eth.get_transaction(batches(db)[1].transaction_hash)["nonce"] == 2
+
+def test_failed_sends_are_retried(db, chain):
+    flaky = FlakyChain(chain, failures=2)
+
+    async def scenario():
+        pipeline = make_pipeline(flaky)
+        await pipeline.start()
+        try:
+            pipeline.submit(doc_hash(1))
+            await wait_for(lambda: statuses(db) == ["confirmed"])
+        finally:
+            await pipeline.stop()
+
+    asyncio.run(scenario())
+    assert flaky.send_attempts == 3
+    assert batches(db)[0].send_rounds == 0
+
+def test_exhausted_batch_is_failed_then_retried_by_the_sweep(db, chain, monkeypatch):
+    flaky = FlakyChain(chain, failures=notarization.NOTARY_SEND_RETRIES)
+
+    async def scenario():
+        pipeline = make_pipeline(flaky)
+        await pipeline.start()
+        try:
+            pipeline.submit(doc_hash(1))
+            await wait_for(lambda: statuses(db) == ["failed"])
+            failed = batches(db)[0]
+            assert failed.send_rounds == 1
+            assert "connection reset" in failed.last_error
+
+            # Backoff elapsed and the node is healthy again
+            monkeypatch.setattr(notarization, "NOTARY_RETRY_BACKOFF", 0)
+            await wait_for(lambda: statuses(db) == ["confirmed"])
+        finally:
+            await pipeline.stop()
+
+    asyncio.run(scenario())
+
+def test_confirmation_waits_for_depth(db, w3, chain, user):
+    will = Will(owner_id=user.id, title="Will", content="{}", jurisdiction="CA", blockchain_hash=doc_hash(1))
+    db.add(will)
+    db.commit()
+
+    async def scenario():
+        pipeline = make_pipeline(chain, confirmations=3)
+        await pipeline.start()
+        try:
+            pipeline.submit(doc_hash(1))
+            await wait_for(lambda: statuses(db) == ["pending"])
+            await asyncio.sleep(0.3)
+            assert statuses(db) == ["pending"]
+
+            w3.provider.ethereum_tester.mine_blocks(2)
+            await wait_for(lambda: statuses(db) == ["confirmed"])
+        finally:
+            await pipeline.stop()
+
+    asyncio.run(scenario())
+    db.refresh(will)
+    assert will.is_notarized
+    assert will.blockchain_transaction == batches(db)[0].transaction_hash
+
+def test_reverted_anchor_is_sent_again(db, chain):
+    reverted = set()
+
+    class RevertingOnce(FlakyChain):
+        def get_receipt(self, tx_hash):
+            receipt = self.chain.get_receipt(tx_hash)
+            if receipt and not reverted:
+                reverted.add(tx_hash)
+                return {**receipt, "succeeded": False}
+            return receipt
+
+    async def scenario():
+        pipeline = make_pipeline(RevertingOnce(chain, failures=0))
+        await pipeline.start()
+        try:
+            pipeline.submit(doc_hash(1))
+            await wait_for(lambda: statuses(db) == ["confirmed"])
+        finally:
+            await pipeline.stop()
+
+    asyncio.run(scenario())
+    batch = batches(db)[0]
+    assert batch.transaction_hash not in reverted
+    assert chain.pending_nonce() == 2
+
+def test_only_the_lease_holder_sends(db, w3, chain):
+    async def scenario():
+        first, second = make_pipeline(chain), make_pipeline(chain)
+        await first.start()
+        await second.start()
+        try:
+            for i in range(6):
+                (first if i % 2 else second).submit(doc_hash(i))
+                await asyncio.sleep(0.1)  # Usually one batch per submission; either batcher may take two
+            await wait_for(lambda: sum(batch.leaf_count for batch in batches(db)) == 6
+                           and set(statuses(db)) == {"confirmed"})
+            assert first.is_sender != second.is_sender
+        finally:
+            await first.stop()
+            await second.stop()
+
+    asyncio.run(scenario())
+    sent = batches(db)
+    assert chain.pending_nonce() == len(sent)  # No batch was anchored twice
+    assert sorted(w3.eth.get_transaction(batch.transaction_hash)["nonce"] for batch in sent) == list(range(len(sent)))
+
+def test_expired_lease_is_taken_over(db, chain):
+    async def scenario():
+        crashed = make_pipeline(chain, sender_lease=0.3)
+        await crashed.start()
+        await wait_for(lambda: crashed.is_sender)
+        # Dies without releasing the lease or sending its last batch
+        for task in crashed._tasks:
+            task.cancel()
+        await asyncio.gather(*crashed._tasks, return_exceptions=True)
+        crashed._record_batch([doc_hash(1)])
+
+        survivor = make_pipeline(chain, sender_lease=0.3)
+        await survivor.start()
+        try:
+            await asyncio.sleep(0.1)
+            assert not survivor.is_sender
+            await wait_for(lambda: statuses(db) == ["confirmed"])
+            assert survivor.is_sender
+        finally:
+            await survivor.stop()
+
+    asyncio.run(scenario())
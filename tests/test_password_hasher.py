@@ -0,0 +1,91 @@
+# Password hashing off the event loop on a bounded bcrypt pool, shedding load with 503 + Retry-After
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+import auth
+from auth import AuthService, PasswordHasher
+
+class GatedContext:
+    """Stands in for the bcrypt context; every call blocks until `release` is set"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = 0
+
+    def hash(self, password):
+        self.started += 1
+        self.release.wait(5)
+        return f"hashed:{password}"
+
+    def verify(self, plain_password, hashed_password):
+        self.started += 1
+        self.release.wait(5)
+        return hashed_password == f"hashed:{plain_password}"
+
+@pytest.fixture
+def gated(monkeypatch):
+    context = GatedContext()
+    monkeypatch.setattr(auth, "pwd_context", context)
+    yield context
+    context.release.set()
+
+def test_bcrypt_round_trip(db, user, monkeypatch):
+    hasher = PasswordHasher(workers=1)
+    monkeypatch.setattr(auth, "password_hasher", hasher)
+    user.hashed_password = asyncio.run(hasher.hash("correct horse"))
+    db.commit()
+
+    assert user.hashed_password.startswith("$2b$")
+    assert asyncio.run(AuthService.authenticate_user(db, user.email, "correct horse")) is user
+    assert asyncio.run(AuthService.authenticate_user(db, user.email, "wrong")) is None
+    assert hasher.stats()["pending"] == 0
+
+def test_saturated_pool_answers_503_with_retry_after(gated):
+    hasher = PasswordHasher(workers=1, max_pending=2)
+    hasher._seconds = 1.5  # Average hash time so far
+
+    async def scenario():
+        running = [asyncio.ensure_future(hasher.hash(f"password {i}")) for i in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as error:
+            await hasher.verify("password 0", "hashed:password 0")
+        gated.release.set()
+        return error.value, await asyncio.gather(*running)
+
+    error, hashes = asyncio.run(scenario())
+
+    assert error.status_code == 503
+    assert error.headers == {"Retry-After": "3"}  # Two pending on one worker at 1.5 s each
+    assert hashes == ["hashed:password 0", "hashed:password 1"]  # Admitted calls were not affected
+    assert hasher.stats()["rejected"] == 1 and hasher.stats()["pending"] == 0
+
+def test_capacity_returns_once_hashes_finish(gated):
+    hasher = PasswordHasher(workers=1, max_pending=1)
+    gated.release.set()
+
+    async def scenario():
+        for i in range(3):
+            await hasher.verify(f"password {i}", f"hashed:password {i}")
+
+    asyncio.run(scenario())
+
+    assert gated.started == 3 and hasher.rejected == 0
+
+def test_hashing_does_not_block_the_event_loop(gated):
+    hasher = PasswordHasher(workers=1)
+    ticks = []
+
+    async def scenario():
+        hashing = asyncio.ensure_future(hasher.hash("password"))
+        for _ in range(5):
+            await asyncio.sleep(0.01)
+            ticks.append(gated.started)
+        gated.release.set()
+        await hashing
+
+    asyncio.run(scenario())
+
+    assert ticks == [1] * 5  # The loop kept running while the hash was in progress
@@ -0,0 +1,109 @@
+# Quote caching, single-flight fetches and stale fallback against a local stub price feed
+import asyncio
+import time
+
+import pytest
+
+from models import BlockchainWallet, DigitalAsset
+from price_oracle import PriceOracle
+
+class StubFeed:
+    """pricemulti-style feed; `delay` holds each reply, `failing` answers 503"""
+
+    def __init__(self, prices):
+        self.prices = dict(prices)
+        self.delay = 0.0
+        self.failing = False
+
+    def __call__(self, method, path, query, body):
+        time.sleep(self.delay)
+        if self.failing:
+            return 503, {"Response": "Error"}
+        symbols = query["fsyms"].split(",")
+        return 200, {symbol: {"USD": self.prices[symbol]} for symbol in symbols if symbol in self.prices}
+
+@pytest.fixture
+def feed(json_server):
+    json_server.handler = StubFeed({"ETH": 2400.0, "BTC": 60000.0, "MATIC": 0.5})
+    return json_server.handler
+
+def make_oracle(json_server, **options) -> PriceOracle:
+    return PriceOracle(feed_url=f"{json_server.url}/data/pricemulti", timeout=5, **options)
+
+def run(oracle, coroutine_factory):
+    async def scenario():
+        try:
+            return await coroutine_factory()
+        finally:
+            await oracle.aclose()
+
+    return asyncio.run(scenario())
+
+def test_quotes_are_cached_until_the_ttl_expires(json_server, feed):
+    oracle = make_oracle(json_server, ttl=0.2)
+
+    async def scenario():
+        first = await oracle.get_prices(["eth", "BTC", "DOGE"])
+        cached = await oracle.get_prices(["ETH"])
+        feed.prices["ETH"] = 2500.0
+        await asyncio.sleep(0.3)
+        expired = await oracle.get_prices(["ETH"])
+        return first, cached, expired
+
+    first, cached, expired = run(oracle, scenario)
+
+    assert first == {"ETH": 2400.0, "BTC": 60000.0}  # Unknown symbols are omitted
+    assert cached == {"ETH": 2400.0}
+    assert expired == {"ETH": 2500.0}
+    assert oracle.fetches == len(json_server.requests) == 2
+
+def test_concurrent_callers_share_one_fetch(json_server, feed):
+    feed.delay = 0.2
+    oracle = make_oracle(json_server, ttl=60)
+
+    async def scenario():
+        return await asyncio.gather(*(oracle.get_prices(["ETH"]) for _ in range(10)),
+                                    oracle.get_prices(["eth", "BTC"]))
+
+    results = run(oracle, scenario)
+
+    assert all(result["ETH"] == 2400.0 for result in results)
+    assert results[-1]["BTC"] == 60000.0
+    # One request for ETH; the overlapping caller only asked the feed for BTC
+    assert sorted(request["query"]["fsyms"] for request in json_server.requests) == ["BTC", "ETH"]
+
+def test_expired_quotes_are_served_while_the_feed_fails(json_server, feed):
+    oracle = make_oracle(json_server, ttl=0.1, stale_max_age=0.6)
+
+    async def scenario():
+        await oracle.get_prices(["ETH"])
+        feed.failing = True
+        await asyncio.sleep(0.2)
+        stale = await oracle.get_prices(["ETH", "BTC"])
+        await asyncio.sleep(0.5)
+        too_old = await oracle.get_prices(["ETH"])
+        return stale, too_old
+
+    stale, too_old = run(oracle, scenario)
+
+    assert stale == {"ETH": 2400.0}  # BTC was never quoted, so there is nothing to fall back to
+    assert too_old == {}
+
+def test_revalue_matches_symbols_case_insensitively(db, user, json_server, feed):
+    wallet = BlockchainWallet(owner_id=user.id, wallet_address="0x1", network="ethereum", wallet_type="metamask")
+    db.add(wallet)
+    db.commit()
+    db.add_all([
+        DigitalAsset(wallet_id=wallet.id, asset_type="cryptocurrency", symbol="eth", name="Ether", balance=2.0),
+        DigitalAsset(wallet_id=wallet.id, asset_type="cryptocurrency", symbol="BTC", name="Bitcoin", balance=0.5),
+        DigitalAsset(wallet_id=wallet.id, asset_type="nft", symbol="eth", name="Punk", balance=1.0),
+    ])
+    db.commit()
+    oracle = make_oracle(json_server, ttl=60)
+
+    revalued = run(oracle, lambda: oracle.revalue_assets([wallet.id]))
+
+    assert revalued == 2
+    db.expire_all()
+    values = {asset.name: asset.usd_value for asset in db.query(DigitalAsset)}
+    assert values == {"Ether": 4800.0, "Bitcoin": 30000.0, "Punk": None}
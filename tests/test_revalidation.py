@@ -0,0 +1,104 @@
+# Fleet re-validation: exclusive claims, stale-lease takeover, resuming from the checkpoint, failure reporting
+import copy
+import json
+import logging
+from datetime import datetime, timedelta
+
+import pytest
+
+import revalidation
+from models import ComplianceLog, ComplianceRuleSet, RevalidationCheckpoint, Will
+from revalidation import FleetRevalidationService, run_revalidation
+from services import ComplianceService
+
+@pytest.fixture
+def service():
+    return FleetRevalidationService(chunk_size=2, max_workers=1)
+
+@pytest.fixture
+def checkpoint(db, user, service):
+    old_rules = ComplianceService().states_data
+    new_rules = copy.deepcopy(old_rules)
+    new_rules["CA"]["will_requirements"]["witnesses_required"] = 3
+    db.add_all([ComplianceRuleSet(version="v1", rules=old_rules), ComplianceRuleSet(version="v2", rules=new_rules)])
+    for i in range(7):
+        db.add(Will(owner_id=user.id, title=f"Will {i}", jurisdiction="NY" if i == 3 else "CA",
+                    content=json.dumps({"witnesses": ["A", "B"]})))
+    db.commit()
+    return service.start(db, "v1", "v2")
+
+def reload(db, checkpoint) -> RevalidationCheckpoint:
+    db.expire_all()
+    return db.query(RevalidationCheckpoint).filter(RevalidationCheckpoint.id == checkpoint.id).one()
+
+def test_only_one_run_holds_the_lease(db, service, checkpoint):
+    assert checkpoint.jurisdictions == ["CA"]
+    owner = service.claim(db, checkpoint.id)
+
+    assert owner is not None
+    assert service.claim(db, checkpoint.id) is None
+    report = service.run(db, checkpoint.id, owner="someone-else")
+    assert report["status"] == "running" and report["wills_processed"] == 0
+
+    report = service.run(db, checkpoint.id, owner)
+    assert report["status"] == "completed"
+    assert report["wills_processed"] == 6 and report["wills_flagged"] == 6  # Two witnesses, three now required
+    assert db.query(ComplianceLog).count() == 6
+    assert reload(db, checkpoint).lease_owner is None
+
+def test_stale_lease_is_taken_over(db, service, checkpoint):
+    crashed = service.claim(db, checkpoint.id)
+    db.query(RevalidationCheckpoint).update({
+        RevalidationCheckpoint.heartbeat_at: datetime.utcnow()
+        - timedelta(seconds=revalidation.REVALIDATION_LEASE_SECONDS + 1)
+    })
+    db.commit()
+
+    survivor = service.claim(db, checkpoint.id)
+
+    assert survivor not in (None, crashed)
+    assert service.run(db, checkpoint.id, crashed)["wills_processed"] == 0  # The old owner does nothing
+    assert service.run(db, checkpoint.id, survivor)["status"] == "completed"
+
+def test_failed_run_resumes_from_the_checkpoint(db, service, checkpoint, monkeypatch):
+    fetch = FleetRevalidationService._fetch_chunk
+    calls = []
+
+    def failing_fetch(self, db, jurisdictions, after_id):
+        calls.append(after_id)
+        if len(calls) == 3:
+            raise RuntimeError("database went away")
+        return fetch(self, db, jurisdictions, after_id)
+
+    monkeypatch.setattr(FleetRevalidationService, "_fetch_chunk", failing_fetch)
+    with pytest.raises(RuntimeError):
+        service.run(db, checkpoint.id, service.claim(db, checkpoint.id))
+
+    failed = reload(db, checkpoint)
+    assert failed.status == "failed" and failed.error == "database went away"
+    assert failed.wills_processed == 2  # The first chunk committed before the failure
+    resume_from = failed.last_will_id
+
+    monkeypatch.setattr(FleetRevalidationService, "_fetch_chunk", fetch)
+    report = service.run(db, checkpoint.id, service.claim(db, checkpoint.id))
+
+    assert report["status"] == "completed" and report["wills_processed"] == 6
+    will_ids = sorted(log.compliance_check["will_id"] for log in db.query(ComplianceLog))
+    assert len(will_ids) == len(set(will_ids)) == 6  # Nothing before the cursor was checked twice
+    assert min(will_ids[2:]) > resume_from
+
+def test_background_failure_is_logged_and_left_retryable(db, service, checkpoint, monkeypatch, caplog):
+    def crash(self, db, checkpoint_id, owner=None):
+        raise RuntimeError("worker pool could not start")
+
+    monkeypatch.setattr(FleetRevalidationService, "run", crash)
+    owner = service.claim(db, checkpoint.id)
+
+    with caplog.at_level(logging.ERROR, logger="revalidation"):
+        run_revalidation(checkpoint.id, owner)
+
+    assert "worker pool could not start" in caplog.text
+    failed = reload(db, checkpoint)
+    assert failed.status == "failed" and failed.error == "worker pool could not start"
+    assert failed.lease_owner is None
+    assert service.claim(db, checkpoint.id) is not None
@@ -0,0 +1,27 @@
+# Local session revocations across revocation-filter rebuilds
+import time
+from datetime import timedelta
+
+from token_revocation import SessionRevocationList
+
+def rebuild(revocations: SessionRevocationList):
+    revocations._built_at = 0.0  # Due for its periodic rebuild
+    revocations.sync()
+
+def test_local_revocations_expire_after_the_retention(db):
+    revocations = SessionRevocationList(timedelta(minutes=15), refresh_token_lifetime=timedelta(seconds=0.3))
+    revocations.revoke(["old"])
+    time.sleep(0.2)
+    revocations.revoke(["new"])
+
+    rebuild(revocations)
+    assert revocations.is_revoked("old", db) and revocations.is_revoked("new", db)
+
+    # A rebuild must not restart the clock on the sessions it carries over
+    time.sleep(0.15)
+    rebuild(revocations)
+
+    assert set(revocations._confirmed) == {"new"}
+    assert not revocations.is_revoked("old", db)
+    assert revocations.is_revoked("new", db)
+    assert revocations._filter.count == 1
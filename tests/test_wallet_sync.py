@@ -0,0 +1,119 @@
+# Balance batching and per-item JSON-RPC error handling against a local mock RPC node
+import asyncio
+
+import pytest
+
+import wallet_sync
+from models import BlockchainWallet, DigitalAsset
+from wallet_sync import WEI_PER_ETHER, WalletSyncEngine
+
+def address(i: int) -> str:
+    return "0x" + f"{i:040x}"
+
+def wei_for(addr: str) -> int:
+    return int(addr, 16) * WEI_PER_ETHER
+
+class MockRPC:
+    """eth_getBalance node: each address holds int(address) ether; `errors`/`rejects` select failures"""
+
+    def __init__(self, errors=(), rejects=(), reverse=False):
+        self.errors = set(errors)  # Addresses answered with a per-item error
+        self.rejects = set(rejects)  # Addresses whose whole batch is rejected
+        self.reverse = reverse  # Answer out of order, as batch replies may
+
+    def __call__(self, method, path, query, body):
+        addresses = [call["params"][0] for call in body]
+        if self.rejects & set(addresses):
+            return 200, {"jsonrpc": "2.0", "id": None, "error": {"code": -32600, "message": "batch too large"}}
+        replies = []
+        for call in body:
+            if call["params"][0] in self.errors:
+                replies.append({"jsonrpc": "2.0", "id": call["id"], "error": {"code": -32000, "message": "boom"}})
+            else:
+                replies.append({"jsonrpc": "2.0", "id": call["id"], "result": hex(wei_for(call["params"][0]))})
+        return 200, replies[::-1] if self.reverse else replies
+
+@pytest.fixture
+def engine(json_server):
+    networks = {"ethereum": {"rpc_url": json_server.url, "symbol": "ETH", "name": "Ethereum"}}
+    return WalletSyncEngine(concurrency=4, timeout=5, rpc_batch_size=3, networks=networks)
+
+def fetch(engine, wallets):
+    async def scenario():
+        try:
+            return await engine.fetch_balances(wallets)
+        finally:
+            await engine.aclose()
+
+    return asyncio.run(scenario())
+
+def test_addresses_are_deduplicated_and_split_into_batches(engine, json_server):
+    json_server.handler = MockRPC()
+    wallets = [{"id": i, "wallet_address": address(i), "network": "ethereum"} for i in range(1, 8)]
+    wallets.append({"id": 8, "wallet_address": address(3), "network": "ethereum"})  # Shared address
+
+    balances = fetch(engine, wallets)
+
+    sizes = sorted(len(request["body"]) for request in json_server.requests)
+    assert sizes == [1, 3, 3]
+    sent = [call["params"][0] for request in json_server.requests for call in request["body"]]
+    assert sorted(sent) == [address(i) for i in range(1, 8)]
+    assert all(call["method"] == "eth_getBalance" for request in json_server.requests for call in request["body"])
+    assert balances == {**{i: wei_for(address(i)) for i in range(1, 8)}, 8: wei_for(address(3))}
+
+def test_item_errors_only_fail_their_wallet(engine, json_server):
+    json_server.handler = MockRPC(errors={address(2)}, reverse=True)
+    wallets = [{"id": i, "wallet_address": address(i), "network": "ethereum"} for i in range(1, 4)]
+
+    balances = fetch(engine, wallets)
+
+    assert balances == {1: wei_for(address(1)), 2: None, 3: wei_for(address(3))}
+
+def test_rejected_batch_only_fails_its_members(engine, json_server):
+    json_server.handler = MockRPC(rejects={address(5)})
+    wallets = [{"id": i, "wallet_address": address(i), "network": "ethereum"} for i in range(1, 8)]
+
+    balances = fetch(engine, wallets)
+
+    failed = {wallet_id for wallet_id, wei in balances.items() if wei is None}
+    assert len(json_server.requests) == 3
+    assert len(failed) == 3 and 5 in failed
+    assert all(balances[i] == wei_for(address(i)) for i in set(balances) - failed)
+
+def test_sync_writes_successes_and_counts_failures(db, user, engine, json_server, monkeypatch):
+    revalued = []
+
+    async def revalue_assets(wallet_ids):
+        revalued.extend(wallet_ids)
+        return len(wallet_ids)
+
+    monkeypatch.setattr(wallet_sync.price_oracle, "revalue_assets", revalue_assets)
+    json_server.handler = MockRPC(errors={address(2)})
+    wallets = [BlockchainWallet(owner_id=user.id, wallet_address=address(i), network="Ethereum",
+                                wallet_type="metamask", is_connected=True) for i in range(1, 5)]
+    wallets.append(BlockchainWallet(owner_id=user.id, wallet_address=address(9), network="solana",
+                                    wallet_type="phantom", is_connected=True))
+    db.add_all(wallets)
+    db.commit()
+    ids = [wallet.id for wallet in wallets]
+
+    async def scenario():
+        try:
+            return await engine.sync_wallets(ids)
+        finally:
+            await engine.aclose()
+
+    summary = asyncio.run(scenario())
+
+    assert summary["inserted"] == 3 and summary["failed"] == 1 and summary["unsupported"] == 1
+    assert sorted(revalued) == sorted(ids[i] for i in (0, 2, 3))
+    db.expire_all()
+    assets = {asset.wallet_id: asset.balance for asset in db.query(DigitalAsset)}
+    assert assets == {ids[0]: 1.0, ids[2]: 3.0, ids[3]: 4.0}
+    failed = db.get(BlockchainWallet, ids[1])
+    assert failed.last_sync is None
+
+    # A second pass with the node healthy leaves unchanged rows alone and fills the gap
+    json_server.handler = MockRPC()
+    summary = asyncio.run(scenario())
+    assert summary["inserted"] == 1 and summary["unchanged"] == 3 and summary["failed"] == 0
@@ -0,0 +1,66 @@
+# Statute passages injected into will guidance prompts: whole passages, a hard budget, execution rules pinned
+import asyncio
+
+import pytest
+
+import ai_service
+from ai_service import GUIDANCE_LAW_MAX_TOKENS, MultiAIService
+from conversation_context import count_tokens
+from statute_index import StatuteIndex
+
+USER_DATA = {
+    "personal_info": {"marital_status": "married", "children": "two minor children"},
+    "assets": {"home": "primary residence", "crypto": "bitcoin in a hardware wallet"},
+    "beneficiaries": [{"name": "Alex", "relationship": "spouse"}, {"name": "Sam", "relationship": "child"}]
+}
+
+def passage(i: int, words: int) -> dict:
+    return {"id": f"p{i}", "citation": f"Code § {i}", "title": "Rule", "text": " ".join(["statute"] * words)}
+
+@pytest.fixture
+def index(tmp_path):
+    return StatuteIndex(index_dir=str(tmp_path / "statute_index"))
+
+def test_law_section_skips_passages_that_do_not_fit():
+    passages = [passage(1, 40), passage(2, 400), passage(3, 40)]
+
+    section, quoted = MultiAIService._law_section(passages)
+
+    assert [p["id"] for p in quoted] == ["p1", "p3"]  # The long one is dropped, not cut
+    assert section.split("\n") == [f"[{p['citation']}] {p['title']}: {p['text']}" for p in quoted]
+    assert count_tokens(section) <= GUIDANCE_LAW_MAX_TOKENS
+
+@pytest.mark.parametrize("state", ["CA", "NY", "TX", "FL"])
+def test_execution_requirements_are_always_retrieved(index, state):
+    passages = index.search("bitcoin hardware wallet", state, pinned_topics=("execution",))
+
+    assert passages[0]["topic"] == "execution" and passages[0]["state"] == state
+    assert len({p["id"] for p in passages}) == len(passages)
+
+def test_guidance_prompt_quotes_whole_passages_and_cites_them(index, monkeypatch):
+    sent = {}
+
+    async def route(self, messages, provider=None, **options):
+        sent["messages"] = messages
+        return "guidance", "openai"
+
+    async def cache_miss(key):
+        return None
+
+    async def cache_store(key, value):
+        pass
+
+    monkeypatch.setattr(MultiAIService, "_route", route)
+    monkeypatch.setattr(ai_service.ai_response_cache, "get", cache_miss)
+    monkeypatch.setattr(ai_service.ai_response_cache, "set", cache_store)
+    monkeypatch.setattr(ai_service, "statute_index", index)
+
+    result = asyncio.run(MultiAIService().generate_will_guidance(USER_DATA, "CA"))
+
+    system = sent["messages"][0]["content"]
+    assert result["sources"][0] == "Cal. Prob. Code § 6110"
+    for citation in result["sources"]:
+        quoted = next(p for p in index.passages if p["citation"] == citation)
+        assert quoted["text"] in system
+    assert "..." not in system.split("Relevant law:")[1]
+    assert not any(line.startswith(" ") for message in sent["messages"] for line in message["content"].split("\n"))
@@ -0,0 +1,25 @@
+# Will PDFs are reproducible: the same fields always render to the same bytes
+import io
+import json
+
+import pytest
+
+from models import Will
+from will_templates import get_will_template
+
+def render(will, user) -> bytes:
+    buffer = io.BytesIO()
+    get_will_template(will.jurisdiction).render(will, user, buffer)
+    return buffer.getvalue()
+
+@pytest.mark.parametrize("state", ["CA", "NY"])
+def test_two_renders_are_byte_identical(user, state):
+    will = Will(owner_id=user.id, title="Will", jurisdiction=state, content=json.dumps({
+        "personal_info": {"full_name": "Ada Lovelace"},
+        "beneficiaries": [{"name": "Byron", "relationship": "child", "percentage": 100}]
+    }))
+
+    first = render(will, user)
+
+    assert first.startswith(b"%PDF")
+    assert render(will, user) == first